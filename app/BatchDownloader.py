@@ -0,0 +1,391 @@
+'''
+Headless batch downloader for pre-seeding deep zoom pyramids.
+
+The job space (zoom range x bounding box) is sharded by quadkey prefix: every shard is the subtree of
+one tile at the shard level, so shards are disjoint, similar in size and enumerated lazily without
+ever materialising the full job list. Shards run across a process pool; each process runs its own
+concurrent fetch loop and writes a per-shard manifest. Progress flows back to the parent through a
+shared queue, and the shard manifests are merged once all shards complete. No Qt is required.
+
+With --archive, tiles are written to a packed tile archive (see app.TileArchive) instead of one file
+per tile: every shard writes its own archive, and the shard archives are merged in tile id order.
+With --codec, the downloaded tiles are transcoded to a storage codec afterwards (see app.TileTranscoder).
+
+Usage:
+    python -m app.BatchDownloader -p resources/images -min_zoom 0 -max_zoom 15 --bbox 24 -125 50 -66
+    python -m app.BatchDownloader -p resources/archive -min_zoom 0 -max_zoom 15 --archive
+    python -m app.BatchDownloader -p resources/images -min_zoom 0 -max_zoom 12 --codec webp --quality 80
+'''
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+from app.util import bbox_to_tile_range, tile_to_quadkey, quadkey_to_tile
+from app.tile_id import tile_id, tile_key
+from app.TileFetcher import TileFetcher
+from app.TileStore import TileStore
+from app.TileArchive import TileArchive
+
+WORLD_BBOX = (-85.0511, -180.0, 85.0511, 180.0)
+AVERAGE_TILE_BYTES = 20 * 1024 # Typical compressed (JPEG) tile size
+MANIFEST_DIR = ".manifest"
+
+##### JOB SPACE #####
+def count_tiles(min_zoom: int, max_zoom: int, bbox: Tuple[float, float, float, float] = WORLD_BBOX) -> int:
+    """
+    Counts the tiles within a bounding box (south, west, north, east) over a zoom range.
+    """
+    total = 0
+    for zoom in range(min_zoom, max_zoom + 1):
+        x_start, y_start, x_end, y_end = bbox_to_tile_range(*bbox, zoom)
+        total += (x_end - x_start + 1) * (y_end - y_start + 1)
+    return total
+
+def plan_shards(min_zoom: int, max_zoom: int, bbox: Tuple[float, float, float, float], target_shards: int) -> List[str]:
+    """
+    Picks the shallowest shard level yielding at least `target_shards` quadkey prefixes within the
+    bounding box, and returns the shard prefixes. Levels above the shard level are covered by the
+    root shard (empty prefix), which holds only the few low-zoom tiles. The shard level may be above
+    min_zoom: a shard then holds the tiles below its prefix tile from min_zoom on.
+
+    Returns:
+        list: quadkey prefixes, one per shard.
+    """
+    shard_level = 1
+    while shard_level < max_zoom:
+        x_start, y_start, x_end, y_end = bbox_to_tile_range(*bbox, shard_level)
+        if (x_end - x_start + 1) * (y_end - y_start + 1) >= target_shards:
+            break
+        shard_level += 1
+    shard_level = min(shard_level, max_zoom)
+
+    x_start, y_start, x_end, y_end = bbox_to_tile_range(*bbox, shard_level)
+    prefixes = [tile_to_quadkey(x, y, shard_level) for y in range(y_start, y_end + 1) for x in range(x_start, x_end + 1)]
+    if min_zoom < shard_level:
+        prefixes.insert(0, "")
+    return prefixes
+
+def iter_shard_tiles(prefix: str, min_zoom: int, max_zoom: int, bbox: Tuple[float, float, float, float], shard_level: int) -> Iterator[int]:
+    """
+    Lazily enumerates the tile ids of a shard, level by level.
+
+    Args:
+        prefix (str): quadkey prefix of the shard; empty for the root shard (zooms below the shard level).
+        min_zoom (int): lowest level of detail to download.
+        max_zoom (int): highest level of detail to download.
+        bbox (tuple): (south, west, north, east) in degrees.
+        shard_level (int): quadkey length of the non-root shards.
+    """
+    if prefix or shard_level == 0:
+        prefix_x, prefix_y, prefix_zoom = quadkey_to_tile(prefix)
+        zooms = range(max(min_zoom, prefix_zoom), max_zoom + 1)
+    else:
+        zooms = range(min_zoom, min(max_zoom, shard_level - 1) + 1)
+
+    for zoom in zooms:
+        x_start, y_start, x_end, y_end = bbox_to_tile_range(*bbox, zoom)
+        if prefix or shard_level == 0:
+            scale = 2 ** (zoom - prefix_zoom)
+            x_start, x_end = max(x_start, prefix_x * scale), min(x_end, (prefix_x + 1) * scale - 1)
+            y_start, y_end = max(y_start, prefix_y * scale), min(y_end, (prefix_y + 1) * scale - 1)
+        for y in range(y_start, y_end + 1):
+            for x in range(x_start, x_end + 1):
+                yield tile_id(zoom, x, y)
+
+
+##### WORKER PROCESS #####
+_progress_queue = None
+_fetcher: TileFetcher = None
+
+def _init_worker(progress_queue) -> None:
+    global _progress_queue
+    _progress_queue = progress_queue
+
+def _get_worker_fetcher(threads: int) -> TileFetcher:
+    """
+    Returns the fetcher of this worker process, kept across shards so its adaptive state carries over.
+    """
+    global _fetcher
+    if _fetcher is None:
+        _fetcher = TileFetcher(max_concurrency=threads)
+    return _fetcher
+
+def shard_archive_path(download_path: str, prefix: str) -> Path:
+    return Path(download_path) / MANIFEST_DIR / f"shard-{prefix or 'root'}.tiles"
+
+def run_shard(prefix: str, min_zoom: int, max_zoom: int, bbox: tuple, shard_level: int, download_path: str, threads: int,
+              archive: bool = False) -> dict:
+    """
+    Downloads every tile of a shard with a bounded concurrent fetch loop, writing a per-shard manifest
+    (one JSON line per tile) and reporting progress to the parent process.
+
+    Returns:
+        dict: shard summary (tiles done, fetched, skipped, failed, bytes written).
+    """
+    if archive:
+        # Tiles archived by earlier runs are skipped; new ones go to the shard's own archive
+        existing = TileArchive(download_path, writable=False) if TileArchive.is_archive(download_path) else None
+        store = TileArchive(shard_archive_path(download_path, prefix))
+        contains = lambda key: store.contains(key) or (existing is not None and existing.contains(key))
+    else:
+        store = TileStore(download_path)
+        contains = store.contains
+    fetcher = _get_worker_fetcher(threads)
+    stats_before = fetcher.get_stats()
+    manifest_path = Path(download_path) / MANIFEST_DIR / f"shard-{prefix or 'root'}.ndjson"
+    summary = {"prefix": prefix, "done": 0, "fetched": 0, "skipped": 0, "failed": 0, "bytes": 0}
+    pending = {"done": 0, "bytes": 0, "failed": 0}
+    last_report = time.monotonic()
+
+    def fetch(key: int) -> Tuple[int, str, int, str]:
+        if contains(key):
+            return key, "skipped", 0, None
+        try:
+            return key, "fetched", store.write(key, fetcher.fetch(key)), None
+        except Exception as e:
+            return key, "failed", 0, repr(e)
+
+    def report(force: bool = False) -> None:
+        nonlocal last_report
+        if _progress_queue is not None and pending["done"] and (force or time.monotonic() - last_report > 0.5):
+            _progress_queue.put((prefix, pending["done"], pending["bytes"], pending["failed"]))
+            pending.update(done=0, bytes=0, failed=0)
+            last_report = time.monotonic()
+
+    def collect(future, manifest) -> None:
+        key, status, size, error = future.result()
+        summary["done"] += 1
+        summary[status] += 1
+        summary["bytes"] += size
+        pending["done"] += 1
+        pending["bytes"] += size
+        pending["failed"] += int(status == "failed")
+        record = {"key": tile_key(key), "status": status, "bytes": size}
+        if error:
+            record["error"] = error
+        manifest.write(json.dumps(record) + "\n")
+        report()
+
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(manifest_path, "w", encoding="utf-8") as manifest, ThreadPoolExecutor(max_workers=threads) as executor:
+        in_flight = deque()
+        for key in iter_shard_tiles(prefix, min_zoom, max_zoom, bbox, shard_level):
+            in_flight.append(executor.submit(fetch, key))
+            if len(in_flight) >= threads * 2:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    in_flight.remove(future)
+                    collect(future, manifest)
+        for future in in_flight:
+            collect(future, manifest)
+    if archive:
+        store.close()
+    report(force=True)
+    fetch_stats = fetcher.get_stats()
+    summary["retries"] = fetch_stats["retries"] - stats_before["retries"]
+    summary["circuit_trips"] = fetch_stats["circuit_trips"] - stats_before["circuit_trips"]
+    return summary
+
+
+##### ORCHESTRATION #####
+class BatchDownloader:
+    """
+    Multi-process batch downloader of a tile pyramid into a TileStore directory.
+
+    Args:
+        download_path (str): root directory of the tile store.
+        min_zoom (int): lowest level of detail to download.
+        max_zoom (int): highest level of detail to download.
+        bbox (tuple): (south, west, north, east) in degrees. Defaults to the whole world.
+        processes (int): number of worker processes.
+        threads (int): concurrent fetches per worker process.
+        archive (bool): write a packed tile archive instead of one file per tile.
+    """
+    def __init__(self, download_path: str, min_zoom: int, max_zoom: int, bbox: tuple = WORLD_BBOX,
+                 processes: int = None, threads: int = 8, archive: bool = False):
+        self.download_path: str = str(download_path)
+        self.min_zoom: int = min_zoom
+        self.max_zoom: int = max_zoom
+        self.bbox: tuple = tuple(bbox)
+        self.processes: int = processes or os.cpu_count() or 1
+        self.threads: int = threads
+        self.archive: bool = archive
+        self.total: int = count_tiles(min_zoom, max_zoom, self.bbox)
+        self.prefixes: List[str] = plan_shards(min_zoom, max_zoom, self.bbox, self.processes * 4)
+        self.shard_level: int = max(len(p) for p in self.prefixes)
+        self.done: int = 0
+        self.bytes: int = 0
+        self.failed: int = 0
+
+    def run(self, verbose: bool = True) -> dict:
+        """
+        Runs all shards across the process pool and merges their manifests.
+
+        Returns:
+            dict: the merged manifest summary.
+        """
+        start = time.monotonic()
+        context = multiprocessing.get_context()
+        progress_queue = context.Queue()
+        summaries = []
+        with ProcessPoolExecutor(max_workers=self.processes, mp_context=context,
+                                 initializer=_init_worker, initargs=(progress_queue,)) as pool:
+            futures = {pool.submit(run_shard, prefix, self.min_zoom, self.max_zoom, self.bbox, self.shard_level,
+                                   self.download_path, self.threads, self.archive) for prefix in self.prefixes}
+            while futures:
+                finished, futures = wait(futures, timeout=0.5, return_when=FIRST_COMPLETED)
+                summaries.extend(future.result() for future in finished)
+                self._drain_progress(progress_queue)
+                if verbose:
+                    self._print_progress(start)
+        self._drain_progress(progress_queue)
+        if verbose:
+            self._print_progress(start)
+            print()
+        if self.archive:
+            self.merge_archives()
+        return self.merge_manifests(summaries, time.monotonic() - start)
+
+    def _drain_progress(self, progress_queue) -> None:
+        """
+        Adds up the progress reports the shards queued so far.
+        """
+        while True:
+            try:
+                _, done, size, failed = progress_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.done += done
+            self.bytes += size
+            self.failed += failed
+
+    def merge_archives(self) -> int:
+        """
+        Merges the shard archives into the archive at <download_path>, in tile id order, and removes them.
+
+        Returns:
+            int: number of tiles merged.
+        """
+        parts = [shard_archive_path(self.download_path, prefix) for prefix in self.prefixes]
+        parts = [path for path in parts if TileArchive.is_archive(path)]
+        with TileArchive(self.download_path) as archive:
+            merged = archive.merge([TileArchive(path, writable=False) for path in parts])
+        for path in parts:
+            for file in path.iterdir():
+                file.unlink()
+            path.rmdir()
+        return merged
+
+    def _print_progress(self, start: float) -> None:
+        elapsed = max(time.monotonic() - start, 1e-6)
+        print(f"\rDownloaded {self.done}/{self.total} tiles ({self.bytes / (1024 ** 2):.1f} Mb, "
+              f"{self.done / elapsed:.0f} tiles/s, {self.failed} failed)", end="", flush=True)
+
+    def merge_manifests(self, summaries: List[dict], elapsed: float) -> dict:
+        """
+        Concatenates the shard manifests into <download_path>/manifest.ndjson and writes the run
+        summary to <download_path>/manifest.json.
+        """
+        manifest_dir = Path(self.download_path) / MANIFEST_DIR
+        failed_keys = []
+        with open(Path(self.download_path) / "manifest.ndjson", "w", encoding="utf-8") as merged:
+            for prefix in self.prefixes:
+                part = manifest_dir / f"shard-{prefix or 'root'}.ndjson"
+                if not part.exists():
+                    continue
+                with open(part, "r", encoding="utf-8") as f:
+                    for line in f:
+                        merged.write(line)
+                        if '"failed"' in line:
+                            failed_keys.append(json.loads(line)["key"])
+                part.unlink()
+        if manifest_dir.exists() and not any(manifest_dir.iterdir()):
+            manifest_dir.rmdir()
+
+        summary = {
+            "min_zoom": self.min_zoom,
+            "max_zoom": self.max_zoom,
+            "bbox": list(self.bbox),
+            "shards": len(self.prefixes),
+            "shard_level": self.shard_level,
+            "processes": self.processes,
+            "tiles": sum(s["done"] for s in summaries),
+            "fetched": sum(s["fetched"] for s in summaries),
+            "skipped": sum(s["skipped"] for s in summaries),
+            "failed": sum(s["failed"] for s in summaries),
+            "bytes": sum(s["bytes"] for s in summaries),
+            "retries": sum(s["retries"] for s in summaries),
+            "circuit_trips": sum(s["circuit_trips"] for s in summaries),
+            "seconds": round(elapsed, 3),
+            "failed_keys": failed_keys,
+        }
+        with open(Path(self.download_path) / "manifest.json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless multi-process batch download of ArcGIS image tile pyramids.")
+    parser.add_argument('-p', '--download_path', type=str, default=None, required=True,
+                        help='Directory of the tile store to download into.')
+    parser.add_argument('-min_zoom', '--min_zoom_level', type=int, default=0, required=True,
+                        help='Lowest Level of Detail to download.')
+    parser.add_argument('-max_zoom', '--max_zoom_level', type=int, default=0, required=True,
+                        help='Highest Level of Detail to download.')
+    parser.add_argument('--bbox', type=float, nargs=4, default=WORLD_BBOX, metavar=('SOUTH', 'WEST', 'NORTH', 'EAST'),
+                        help='Bounding box in degrees. Defaults to the whole world.')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), required=False,
+                        help='Number of worker processes.')
+    parser.add_argument('--threads', type=int, default=8, required=False,
+                        help='Concurrent fetches per worker process.')
+    parser.add_argument('--derive_lower', action='store_true', default=False,
+                        help='Download only the maximum zoom level and derive the lower levels locally by downsampling.')
+    parser.add_argument('--archive', action='store_true', default=False,
+                        help='Write a packed tile archive (data file plus sorted index) instead of one file per tile.')
+    parser.add_argument('--codec', type=str, default="original", choices=["original", "webp", "jpeg"], required=False,
+                        help='Storage codec: transcode the tiles in a parallel pass after the download (see app.TileTranscoder).')
+    parser.add_argument('--quality', type=int, default=80, required=False,
+                        help='Encoder quality of the storage codec, 1-100.')
+    parser.add_argument('-mem', '--memory_limit', type=int, default=101, required=False,
+                        help='Maximum megabytes of disk storage to use without confirmation.')
+    parser.add_argument('-y', '--yes', action='store_true', default=False,
+                        help='Do not ask for confirmation when the estimated size exceeds the memory limit.')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.download_path):
+        raise Exception(f"""The directory "{args.download_path}" was not found.""")
+    if args.min_zoom_level > args.max_zoom_level:
+        raise Exception("The zoom level of detail minimum must be lower than the maximum.")
+
+    download_min_zoom = args.max_zoom_level if args.derive_lower else args.min_zoom_level
+    if args.archive and args.derive_lower:
+        raise Exception("Deriving lower zoom levels requires the one-file-per-tile store; pack it afterwards with app.TileArchive.")
+    downloader = BatchDownloader(args.download_path, download_min_zoom, args.max_zoom_level, args.bbox,
+                                 processes=args.processes, threads=args.threads, archive=args.archive)
+    disk_memory_estimate = int(downloader.total * AVERAGE_TILE_BYTES / (1024 ** 2))
+    print(f"{downloader.total} tiles in {len(downloader.prefixes)} shards (level {downloader.shard_level}), estimated {disk_memory_estimate} Mb.")
+    if disk_memory_estimate > args.memory_limit and not args.yes:
+        user_input = input(f"Warning: The download size is estimated to be {disk_memory_estimate} Mb. Continue? (y/n): ")
+        if user_input.lower() != "y":
+            sys.exit(-1)
+
+    result = downloader.run()
+    print(f"Fetched {result['fetched']}, skipped {result['skipped']}, failed {result['failed']} in {result['seconds']} s.")
+
+    if args.derive_lower and args.min_zoom_level < args.max_zoom_level:
+        from app.TilePyramid import TilePyramidBuilder
+        TilePyramidBuilder(args.download_path, processes=args.processes).build_lower(args.max_zoom_level, args.min_zoom_level, verbose=True)
+
+    if args.codec != "original":
+        from app.TileTranscoder import TileTranscoder
+        summary = TileTranscoder(args.download_path, args.codec, args.quality, processes=args.processes).run(verbose=True)
+        print(f"Transcoded {summary['transcoded']} tiles to {args.codec}:{args.quality}, "
+              f"saving {(summary['bytes_before'] - summary['bytes_after']) / (1024 ** 2):.1f} Mb in {summary['seconds']} s.")
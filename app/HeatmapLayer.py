@@ -0,0 +1,185 @@
+import numpy as np
+from PyQt5.QtGui import QImage, QColor
+from typing import Dict, List, Tuple
+
+from app.MapLayer import MapLayer
+from app.util import degree_to_tile_array
+from app.tile_id import tile_x, tile_y
+
+# Color stops of the default color map: (intensity, color); the alpha channel ramps with intensity
+HEATMAP_STOPS = [(0.0, "#000080"), (0.25, "#0050FF"), (0.5, "#00E0A0"), (0.75, "#FFE000"), (1.0, "#E01010")]
+
+def color_table(stops: List[Tuple[float, str]] = HEATMAP_STOPS, opacity: float = 0.75, size: int = 256) -> np.ndarray:
+    """
+    Builds a lookup table from intensity (0 to size - 1) to premultiplied ARGB32 pixel values.
+
+    Args:
+        stops (list): (intensity in [0, 1], color) pairs in ascending order.
+        opacity (float): alpha of the highest intensity.
+        size (int): number of table entries.
+
+    Returns:
+        np.ndarray: uint32 pixel values; the first entry is fully transparent.
+    """
+    t = np.linspace(0.0, 1.0, size)
+    positions = [position for position, _ in stops]
+    colors = [QColor(color) for _, color in stops]
+    red = np.interp(t, positions, [color.red() for color in colors])
+    green = np.interp(t, positions, [color.green() for color in colors])
+    blue = np.interp(t, positions, [color.blue() for color in colors])
+    alpha = opacity * np.clip(t * 3.0, 0.0, 1.0) # Faint densities fade out instead of tinting the map
+    channels = [np.round(channel * alpha).astype(np.uint32) for channel in (red, green, blue)]
+    return (np.round(alpha * 255).astype(np.uint32) << 24) | (channels[0] << 16) | (channels[1] << 8) | channels[2]
+
+
+class HeatmapLayer(MapLayer):
+    """
+    Overlay layer showing the point density of large datasets as a translucent heatmap.
+
+    Points are projected once to normalized Web Mercator coordinates and sorted by x. A tile is computed
+    from the points within its bounds and a blur margin: they are binned into a grid of `bin_px` screen
+    pixels with one vectorised bincount, blurred with a separable Gaussian kernel and mapped through a
+    color table into a small QImage, drawn scaled (smoothly) to the tile. The blur margin makes adjacent
+    tiles agree at their edges, and intensities are scaled by a per-zoom density reference computed over
+    all points, so tiles are independent of each other and of the viewport. Tile images go to the
+    overlay tile cache (see MapLayer.paint()): panning and zooming only compute newly exposed tiles.
+
+    Args:
+        name (str): layer name.
+        lat (np.ndarray, optional): latitudes in degrees.
+        lon (np.ndarray, optional): longitudes in degrees.
+        weights (np.ndarray, optional): weight of each point; 1 by default.
+        radius_px (float): blur radius (Gaussian sigma) in screen pixels.
+        bin_px (int): size of a density bin in screen pixels; a divisor of the tile size.
+        opacity (float): alpha of the densest areas.
+        visible (bool): whether the layer is painted.
+        z_order (int): painting order; higher layers are painted on top.
+    """
+    TILE_SIZE = 256
+
+    def __init__(self, name: str = "heatmap", lat: np.ndarray = None, lon: np.ndarray = None, weights: np.ndarray = None,
+                 radius_px: float = 8.0, bin_px: int = 2, opacity: float = 0.75, visible: bool = True, z_order: int = 0):
+        super().__init__(name, visible, z_order)
+        self.radius_px: float = radius_px
+        self.bin_px: int = bin_px
+        self.colors: np.ndarray = color_table(opacity=opacity)
+        self.x: np.ndarray = np.empty(0)
+        self.y: np.ndarray = np.empty(0)
+        self.weights: np.ndarray = None
+        self.level_scale: dict = {}
+        self.stats: dict = {"computed": 0, "empty": 0}
+        if lat is not None and lon is not None:
+            self.set_points(lat, lon, weights)
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def set_points(self, lat: np.ndarray, lon: np.ndarray, weights: np.ndarray = None) -> None:
+        """
+        Replaces the points of the heatmap.
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        if len(lat) != len(lon) or (weights is not None and len(weights) != len(lat)):
+            raise Exception(f"Heatmap layer '{self.name}' requires equal numbers of latitudes, longitudes and weights.")
+        valid = np.isfinite(lat) & np.isfinite(lon) & (np.abs(lat) <= 85.0511)
+        x, y = degree_to_tile_array(lat[valid], lon[valid], 0)
+        order = np.argsort(x, kind="stable")
+        self.x, self.y = x[order], y[order]
+        self.weights = None if weights is None else np.asarray(weights, dtype=np.float64)[valid][order]
+        self.invalidate()
+
+    def set_style(self, radius_px: float = None, opacity: float = None) -> None:
+        if radius_px is not None:
+            self.radius_px = radius_px
+        if opacity is not None:
+            self.colors = color_table(opacity=opacity)
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        super().invalidate()
+        self.level_scale.clear()
+
+    ##### DENSITY #####
+    def _kernel(self) -> np.ndarray:
+        sigma = max(self.radius_px / self.bin_px, 0.5)
+        half = int(np.ceil(3 * sigma))
+        return np.exp(-0.5 * (np.arange(-half, half + 1) / sigma) ** 2)
+
+    def _scale(self, zoom: int) -> float:
+        """
+        Returns the density reference of a zoom level: the largest (weighted) number of points within a
+        cell about the size of the blur kernel, which the blurred density peaks near.
+        """
+        if zoom not in self.level_scale:
+            cells = (self.TILE_SIZE << zoom) / max(2.0 * self.radius_px, self.bin_px)
+            cell_x = np.minimum((self.x * cells).astype(np.int64), int(cells) - 1)
+            cell_y = np.minimum((self.y * cells).astype(np.int64), int(cells) - 1)
+            _, inverse = np.unique(cell_y * (int(cells) + 1) + cell_x, return_inverse=True)
+            counts = np.bincount(inverse.ravel(), weights=self.weights)
+            self.level_scale[zoom] = float(counts.max()) if len(counts) else 1.0
+        return self.level_scale[zoom]
+
+    def _tile_density(self, zoom: int, tile_x: int, tile_y: int) -> np.ndarray:
+        """
+        Returns the blurred density grid of a tile ([bins, bins]), or None if no points affect it.
+        """
+        kernel = self._kernel()
+        half = len(kernel) // 2
+        bins = self.TILE_SIZE // self.bin_px
+        size = bins + 2 * half
+        scale = float(bins << zoom) # Bins per unit of normalized Web Mercator
+        left = tile_x / (1 << zoom) - half / scale
+        top = tile_y / (1 << zoom) - half / scale
+        extent = size / scale
+
+        start, end = np.searchsorted(self.x, [left, left + extent])
+        y = self.y[start:end]
+        inside = (y >= top) & (y < top + extent)
+        if not inside.any():
+            return None
+        bx = np.clip(((self.x[start:end][inside] - left) * scale).astype(np.int64), 0, size - 1)
+        by = np.clip(((y[inside] - top) * scale).astype(np.int64), 0, size - 1)
+        weights = None if self.weights is None else self.weights[start:end][inside]
+        grid = np.bincount(by * size + bx, weights=weights, minlength=size * size).reshape(size, size).astype(np.float64)
+
+        # Separable Gaussian blur: one pass of shifted, weighted sums per axis
+        rows = np.zeros((size, bins))
+        for i, weight in enumerate(kernel):
+            rows += weight * grid[:, i:i + bins]
+        density = np.zeros((bins, bins))
+        for i, weight in enumerate(kernel):
+            density += weight * rows[i:i + bins, :]
+        return density
+
+    def _tile_image(self, zoom: int, tile_x: int, tile_y: int) -> QImage:
+        """
+        Renders the heatmap of a tile at the bin resolution, or returns None for an empty tile.
+        """
+        image = None
+        density = self._tile_density(zoom, tile_x, tile_y)
+        if density is not None:
+            # Logarithmic scale: sparse points stay visible next to dense clusters
+            intensity = np.log1p(density) / np.log1p(max(self._scale(zoom), 1.0))
+            levels = np.clip(intensity * (len(self.colors) - 1), 0, len(self.colors) - 1).astype(np.intp)
+            pixels = np.ascontiguousarray(self.colors[levels])
+            if pixels.any():
+                bins = pixels.shape[0]
+                # The QImage only wraps the array: copy it into Qt-owned memory before the array is released
+                image = QImage(pixels.data, bins, bins, bins * 4, QImage.Format_ARGB32_Premultiplied).copy()
+        self.stats["computed"] += 1
+        self.stats["empty"] += int(image is None)
+        return image
+
+    ##### PAINTING #####
+    def render_tiles(self, zoom: int, tiles: List[int], res: int) -> Dict[int, QImage]:
+        # Rendered at the bin resolution (independent of res); drawn scaled by MapLayer.paint()
+        if len(self.x) == 0:
+            return {}
+        return {tile: self._tile_image(zoom, tile_x(tile), tile_y(tile)) for tile in tiles}
+
+    def get_stats(self) -> dict:
+        """
+        Returns the number of points and of tiles computed (and how many of them were empty).
+        """
+        return dict(self.stats, points=len(self.x))
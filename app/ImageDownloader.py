@@ -1,15 +1,18 @@
-from PyQt5.QtCore import QRunnable, QObject, pyqtSignal, QThreadPool, pyqtSlot, QEventLoop, QCoreApplication
-from PyQt5.QtGui import QPixmap
+from PyQt5.QtCore import QRunnable, QObject, pyqtSignal, QThreadPool, pyqtSlot, QEventLoop, QCoreApplication, QRect, Qt
+from PyQt5.QtGui import QImage
 from PyQt5.QtWidgets import QProgressBar
 
-import urllib.request
-import certifi
-import ssl
 import traceback, sys
+import urllib.error
 from io import BytesIO
-from PIL import Image
 from typing import Callable, Tuple
 
+from app.profiling import span
+from app.TileFetcher import TileFetcher, get_default_fetcher
+from app.TileStore import TileStore
+from app.TileTranscoder import DEFAULT_QUALITY, save_codec
+from app.tile_id import tile_id, tile_zyx, tile_parent, tile_key, tile_file_name
+
 # Define worker signals for runtime checks
 class WorkerSignals(QObject):
     finished = pyqtSignal()
@@ -22,7 +25,7 @@ class WorkerSignals(QObject):
 
 
 class Worker(QRunnable):
-    def __init__(self, func: Callable[[str], Tuple], key: str):
+    def __init__(self, func: Callable[[int], Tuple], key: int):
         super().__init__()
         self.func = func
         self.key = key
@@ -42,15 +45,60 @@ class Worker(QRunnable):
             self.signals.finished.emit()
 
 
+_fetch_pool: QThreadPool = None
+
+def get_fetch_pool() -> QThreadPool:
+    """
+    Returns the thread pool dedicated to tile fetching, leaving the global QThreadPool untouched.
+    The TileFetcher bounds the concurrent network requests within it adaptively.
+    """
+    global _fetch_pool
+    if _fetch_pool is None:
+        _fetch_pool = QThreadPool()
+        _fetch_pool.setMaxThreadCount(max(4, get_default_fetcher().max_concurrency))
+    return _fetch_pool
+
+
+def duplicate_samples(entries: list) -> bool:
+    """
+    Checks fetch results for duplicated data: the server answers tiles it has no imagery for with one
+    placeholder image, so repeated subsampled data among the first new tiles means there is nothing to show.
+
+    Args:
+        entries (list): fetch results, (image, sampled data, data) tuples or 'cached'. Only tuples with
+            data (newly loaded tiles) are compared.
+
+    Returns:
+        bool: True if the sampled data of the first new tiles repeats.
+    """
+    uncached = [entry for entry in entries if isinstance(entry, tuple) and entry[2] is not None]
+    if len(uncached) < 2:
+        return False
+
+    data = uncached[0][1]
+    count = 0
+    for entry in uncached[1:4]:
+        count += int(data == entry[1])
+    return count > 1
+
+
 class ImageDownloader(QObject):
-    def __init__(self, jobs: list = [], threads: int = None, cache_keys: list = [], file_dir: bool = None, is_batch=False):
+    def __init__(self, jobs: list = [], threads: int = None, cache_keys: list = [], file_dir: bool = None, is_batch=False,
+                 warm_lookup: Callable[[int], bytes] = None, tile_store: TileStore = None, fetcher: TileFetcher = None,
+                 revalidator = None, transcoder = None, codec: str = "original", quality: int = None):
         super().__init__()
         self.jobs: list = jobs
         self.threads: int = threads
         self.loop: QEventLoop = None
         
         self.imgCache: dict = {}
-        self.keys: list = cache_keys
+        self.keys: set = set(cache_keys)
+        self.warm_lookup: Callable[[int], bytes] = warm_lookup
+        self.tile_store: TileStore = tile_store
+        self.revalidator = revalidator # TileRevalidator of the tile store, if tiles expire
+        self.transcoder = transcoder # BackgroundTranscoder of the tile store, if it has a storage codec
+        self.codec: str = codec # Storage codec of batch downloads (see app.TileTranscoder)
+        self.quality: int = quality
         self.is_batch = is_batch
         self.bar = QProgressBar()
         self.bar.setMinimum(0)
@@ -58,14 +106,15 @@ class ImageDownloader(QObject):
         
         self.workers = []
         
-        self.pool = QThreadPool.globalInstance()
-        self.pool.setMaxThreadCount(max(4, self.threads))
+        self.fetcher: TileFetcher = fetcher or get_default_fetcher()
+        self.pool: QThreadPool = get_fetch_pool()
+        if self.pool.maxThreadCount() < self.threads:
+            self.pool.setMaxThreadCount(self.threads)
 
         self.timer_check: int = 0
         self.completed: int = 0
 
         self.file_dir: bool = file_dir
-        self.context: object = ssl.create_default_context(cafile=certifi.where())
 
     def print_result(self, r: list) -> None:
         self.imgCache[r[0]] = r[1]
@@ -101,41 +150,100 @@ class ImageDownloader(QObject):
         # self.pool.waitForDone()
         self.loop.exec_()
         
-    def download_image(self, key: str) -> Tuple[any, any]:
+    def download_image(self, key: int) -> Tuple[any, any]:
         """
-        Fetches image data from the arcgis server.
+        Fetches image data from the arcgis server. Runs on a worker thread, so the image is decoded here
+        into a QImage (thread-safe, unlike QPixmap) in the pixmap-native RGB32 format; the GUI thread only
+        performs the cheap QImage to QPixmap conversion. Compressed bytes found through `warm_lookup`
+        (the warm in-memory cache tier) or in the on-disk tile store are decoded without a network request;
+        downloaded tiles are written to the tile store. With a `revalidator`, expired tiles are served as
+        they are and revalidated in the background; with a `transcoder`, downloaded tiles are transcoded
+        to the storage codec in the background.
 
         Args:
-            key (str): unique key for the image data (tile).
+            key (int): tile id of the image data (see app.tile_id).
 
         Returns:
-            pixmap (QPixmap): image data or returns 'cached' if already downloaded.
+            image (QImage): decoded image data or returns 'cached' if already downloaded.
             cache (str): sampled cache key from every 16th byte.
+            data (bytes): the compressed image data.
         """
         if key not in self.keys:
-            addr = key.replace('-', "/")
-
-            url = "https://server.arcgisonline.com/arcgis/rest/services/World_Imagery/MapServer/tile/" + addr + ".JPEG"
-            data = urllib.request.urlopen(url, context=self.context).read()
+            data = None
+            if self.warm_lookup is not None:
+                data = self.warm_lookup(key)
+            if data is None and self.tile_store is not None:
+                data = self.tile_store.read(key)
+            if data is None:
+                try:
+                    response = self.fetcher.fetch_response(key)
+                except urllib.error.HTTPError as e:
+                    # Beyond the source imagery: upsample a stored ancestor tile instead
+                    overzoom = self.overzoom_image(key) if e.code == 404 and not self.is_batch else None
+                    if overzoom is None:
+                        raise
+                    return overzoom, ' ', None
+                data = response.data
+                if self.tile_store is not None:
+                    self.tile_store.write(key, data)
+                    if self.revalidator is not None:
+                        self.revalidator.record_download(key, response)
+                    if self.transcoder is not None:
+                        self.transcoder.submit(key)
+            elif self.revalidator is not None:
+                self.revalidator.check(key)
             d = ' '
             if len(str(data)) > 16:
                 d = data[::16]
 
             p = None
             if self.is_batch:
+                from PIL import Image
                 image_file = Image.open(BytesIO(data))
-                file_key = str(addr.split('/')[0]) + '/' + '-'.join(key.split('-')[1:])
-                image_file.save('/'.join([self.file_dir, file_key + '.JPG']))
+                file_key = str(tile_zyx(key)[0]) + '/' + tile_file_name(key)
+                if self.codec == "webp":
+                    # Same file name: readers detect the format from the bytes
+                    image_file.save('/'.join([self.file_dir, file_key + '.JPG']), format="WEBP", quality=self.quality or DEFAULT_QUALITY)
+                else:
+                    image_file.save('/'.join([self.file_dir, file_key + '.JPG']))
             else:
-                p = QPixmap()
-                p.loadFromData(data)
+                with span("decode"):
+                    p = QImage.fromData(data).convertToFormat(QImage.Format_RGB32)
                 if self.file_dir:
-                    p.save(self.file_dir + key, ".JPG")
+                    p.save(self.file_dir + tile_key(key), "JPG")
 
-            return p, d
+            return p, d, data
 
         return 'cached'
 
+    def overzoom_image(self, key: int, max_levels: int = 4) -> QImage:
+        """
+        Builds an overzoom image for a tile the server does not have, by cropping and upsampling the
+        closest ancestor tile available in the warm cache tier or the tile store.
+
+        Args:
+            key (int): tile id of the image data (see app.tile_id).
+            max_levels (int): how many levels up to search for an ancestor.
+
+        Returns:
+            QImage: the upsampled image, or None if no ancestor is available.
+        """
+        zoom, y, x = tile_zyx(key)
+        for levels in range(1, min(max_levels, zoom) + 1):
+            ancestor = tile_parent(key, levels)
+            data = self.warm_lookup(ancestor) if self.warm_lookup is not None else None
+            if data is None and self.tile_store is not None:
+                data = self.tile_store.read(ancestor)
+            if data is None:
+                continue
+            with span("decode"):
+                image = QImage.fromData(data)
+                cell_x = image.width() >> levels
+                cell_y = image.height() >> levels
+                crop = image.copy(QRect((x % (1 << levels)) * cell_x, (y % (1 << levels)) * cell_y, cell_x, cell_y))
+                return crop.scaled(image.width(), image.height(), Qt.IgnoreAspectRatio, Qt.SmoothTransformation).convertToFormat(QImage.Format_RGB32)
+        return None
+
     def no_data_assert(self) -> bool:
         """
         Assert that no new image data is received from fetching."
@@ -150,38 +258,22 @@ class ImageDownloader(QObject):
             bool: True if the image is already cached. False if new or dissimilar data exists.
         """
         if self.check_completed():
-            data = self.imgCache[self.jobs[0]][1]
-            count = 0
-            uncached = []
-            k = list(self.imgCache.keys())
-            for c, j in zip(range(0, len(k)), self.imgCache.values()):
-                if j != 'cached':
-                    uncached.append(c)
-
-            if len(uncached) < 2:
-                return False
-            else:
-                data = self.imgCache[k[uncached[0]]][1]
-
-            cap = 4
-            if cap > len(uncached):
-                cap = len(uncached)
-
-            for i in range(1,cap):
-                data2 = self.imgCache[k[uncached[i]]][1]
-                count += int(data == data2)
-
-            if count > 1:
-                return True
+            return duplicate_samples(list(self.imgCache.values()))
         return False
 
+    def get_fetch_stats(self) -> dict:
+        """
+        Returns the statistics of the tile fetcher: requests, retries, concurrency limit, circuit state, etc.
+        """
+        return self.fetcher.get_stats()
+
     def get_cache(self) -> dict:
         return self.imgCache
 
     def get_jobs(self) -> list:
         return self.jobs
 
-    def get_image_for_key(self, key: str) -> bool:
+    def get_image_for_key(self, key: int) -> bool:
         if key in self.imgCache:
             return self.imgCache[key]
         return None
@@ -211,6 +303,10 @@ if __name__ == "__main__":
                             help='Highest Level of Detail to download.')
         parser.add_argument('-mem', '--memory_limit', type=int, default=101, required=False,
                     help='Maximum allowed megabytes of disk storage to use. Downloading will stop prematurely if breached.')
+        parser.add_argument('--codec', type=str, default="original", choices=["original", "webp"], required=False,
+                            help='Storage codec of the downloaded tiles (see app.TileTranscoder).')
+        parser.add_argument('--quality', type=int, default=DEFAULT_QUALITY, required=False,
+                            help='Encoder quality of the storage codec, 1-100.')
 
         args = parser.parse_args()
 
@@ -262,9 +358,12 @@ if __name__ == "__main__":
             tiles = list(product(range(0, grid_resolution), repeat=2))
             if n == 0:
                 tiles = [(0, 0)]
-            jobs += ['-'.join([str(n), str(tile[0]), str(tile[1])]) for tile in tiles]
+            jobs += [tile_id(n, tile[1], tile[0]) for tile in tiles]
 
-        img_downloader = ImageDownloader(jobs, threads=max(4, os.cpu_count()), file_dir=download_directory, is_batch=True)
+        if args.codec != "original":
+            save_codec(download_directory, args.codec, args.quality)
+        img_downloader = ImageDownloader(jobs, threads=max(4, os.cpu_count()), file_dir=download_directory, is_batch=True,
+                                         codec=args.codec, quality=args.quality)
         img_downloader.start()            
 
     download_query()
@@ -0,0 +1,291 @@
+'''
+Streaming ingest of marker updates.
+
+Sources read records on their own threads and hand them to a LiveFeed, which applies them to a
+MarkerLayer in batches on the GUI thread. A record has an "id", "lat" and "lon", optionally an "op"
+("upsert" by default; "delete" or "remove" removes the marker) and any other fields as attributes.
+'''
+import csv
+import json
+import time
+import socket
+import threading
+import numpy as np
+from collections import deque
+from pathlib import Path
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+from typing import Callable, List, Tuple
+
+from app.profiling import span
+
+LAT_FIELDS = ("lat", "latitude")
+LON_FIELDS = ("lon", "lng", "long", "longitude")
+REMOVE_OPS = ("delete", "remove")
+
+def parse_record(fields: dict) -> Tuple[str, str, float, float, dict]:
+    """
+    Normalizes a record parsed from a feed.
+
+    Args:
+        fields (dict): the record fields (CSV row or JSON object).
+
+    Returns:
+        Tuple[str, str, float, float, dict]: (op, id, latitude, longitude, attributes). The coordinates
+        are NaN for removals.
+    """
+    fields = {str(key).strip().lower(): value for key, value in fields.items()}
+    if fields.get("id") in (None, ""):
+        raise ValueError("record without an id")
+    marker_id = str(fields.pop("id"))
+    op = str(fields.pop("op", None) or "upsert").strip().lower()
+    if op in REMOVE_OPS:
+        return "remove", marker_id, float("nan"), float("nan"), {}
+    lat = lon = None
+    for key in LAT_FIELDS:
+        if key in fields:
+            lat = float(fields.pop(key))
+    for key in LON_FIELDS:
+        if key in fields:
+            lon = float(fields.pop(key))
+    if lat is None or lon is None or not (-90.0 <= lat <= 90.0) or not (-180.0 <= lon <= 180.0):
+        raise ValueError(f"record '{marker_id}' without valid coordinates")
+    return "upsert", marker_id, lat, lon, fields
+
+##### SOURCES #####
+class FileTailSource(threading.Thread):
+    """
+    Tails a growing CSV (with a header line) or NDJSON file, like `tail -f`. Incomplete trailing lines
+    are held back until they are terminated, and a truncated or replaced file is read again from the
+    start.
+
+    Args:
+        path (str): feed file; NDJSON for .json/.ndjson/.jsonl files, CSV otherwise.
+        sink (Callable[[list], None]): receives lists of parsed records.
+        from_start (bool): whether existing content is ingested, or only lines appended from now on.
+        poll_interval (float): seconds between checks for new content.
+    """
+    def __init__(self, path: str, sink: Callable[[list], None], from_start: bool = True, poll_interval: float = 0.05):
+        super().__init__(name="FileTailSource", daemon=True)
+        self.path: str = path
+        self.sink: Callable[[list], None] = sink
+        self.from_start: bool = from_start
+        self.poll_interval: float = poll_interval
+        self.is_json: bool = Path(path).suffix.lower() in (".json", ".ndjson", ".jsonl")
+        self.header: List[str] = None
+        self.malformed: int = 0
+        self._stop_event: threading.Event = threading.Event()
+
+    def run(self) -> None:
+        position, partial, inode = None, b"", None
+        while not self._stop_event.is_set():
+            try:
+                stat = Path(self.path).stat()
+            except OSError:
+                self._stop_event.wait(self.poll_interval)
+                continue
+            if position is None or stat.st_ino != inode or stat.st_size < position:
+                # First open, replaced or truncated file: (re)start from the top
+                position = 0 if (self.from_start or inode is not None) else stat.st_size
+                partial, inode, self.header = b"", stat.st_ino, None
+                if position > 0 and not self.is_json:
+                    with open(self.path, "rb") as f:
+                        self.header = self._parse_header(f.readline())
+            if stat.st_size > position:
+                with open(self.path, "rb") as f:
+                    f.seek(position)
+                    chunk = f.read(stat.st_size - position)
+                position += len(chunk)
+                lines = (partial + chunk).split(b"\n")
+                partial = lines.pop()
+                records = self.parse_lines(lines)
+                if records:
+                    self.sink(records)
+            else:
+                self._stop_event.wait(self.poll_interval)
+
+    def _parse_header(self, line: bytes) -> List[str]:
+        return next(csv.reader([line.decode("utf-8", "replace").strip()]), None)
+
+    def parse_lines(self, lines: List[bytes]) -> list:
+        records = []
+        for line in lines:
+            line = line.decode("utf-8", "replace").strip()
+            if not line:
+                continue
+            try:
+                if self.is_json:
+                    records.append(parse_record(json.loads(line)))
+                elif self.header is None:
+                    self.header = next(csv.reader([line]))
+                else:
+                    records.append(parse_record(dict(zip(self.header, next(csv.reader([line]))))))
+            except (ValueError, TypeError, AttributeError):
+                self.malformed += 1
+        return records
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+
+class SocketSource(threading.Thread):
+    """
+    Listens on a local TCP port for NDJSON records; any number of clients may connect and stream lines.
+
+    Args:
+        host (str): interface to bind, localhost by default.
+        port (int): port to listen on; 0 picks a free port (see `port` once started).
+        sink (Callable[[list], None]): receives lists of parsed records.
+    """
+    def __init__(self, sink: Callable[[list], None], host: str = "127.0.0.1", port: int = 0):
+        super().__init__(name="SocketSource", daemon=True)
+        self.sink: Callable[[list], None] = sink
+        self.server: socket.socket = socket.create_server((host, port))
+        self.server.settimeout(0.2)
+        self.port: int = self.server.getsockname()[1]
+        self.malformed: int = 0
+        self._stop_event: threading.Event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                connection, _ = self.server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            threading.Thread(target=self._serve, args=(connection,), name="SocketSourceClient", daemon=True).start()
+        self.server.close()
+
+    def _serve(self, connection: socket.socket) -> None:
+        partial = b""
+        connection.settimeout(0.2)
+        with connection:
+            while not self._stop_event.is_set():
+                try:
+                    chunk = connection.recv(1 << 16)
+                except socket.timeout:
+                    continue
+                except OSError:
+                    break
+                if not chunk:
+                    break
+                lines = (partial + chunk).split(b"\n")
+                partial = lines.pop()
+                records = []
+                for line in lines:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        records.append(parse_record(json.loads(line)))
+                    except (ValueError, TypeError, AttributeError):
+                        self.malformed += 1
+                if records:
+                    self.sink(records)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+def open_source(spec: str, sink: Callable[[list], None], from_start: bool = True) -> threading.Thread:
+    """
+    Creates the source for a feed specification: "tcp://host:port" for a socket listener, or a file path.
+    """
+    if spec.startswith("tcp://"):
+        host, _, port = spec[len("tcp://"):].rpartition(":")
+        return SocketSource(sink, host or "127.0.0.1", int(port))
+    return FileTailSource(spec, sink, from_start)
+
+##### FEED #####
+class LiveFeed(QObject):
+    """
+    Applies streamed marker records to a MarkerLayer. Records from the source threads are queued, and
+    on every tick the queue is drained on the GUI thread: updates are coalesced per id (the last record
+    wins), applied to the layer as one upsert and one removal, and only the tiles the changes touched
+    are recomposed in the map view.
+
+    Args:
+        layer (MarkerLayer): the layer receiving the updates.
+        view (MapView): the map view showing the layer.
+        source (str, optional): feed specification (see open_source()); records may also be push()ed.
+        interval_ms (int): milliseconds between applied batches.
+    """
+    applied = pyqtSignal(int, int)
+
+    def __init__(self, layer, view, source: str = None, interval_ms: int = 100):
+        super().__init__()
+        self.layer = layer
+        self.view = view
+        self.queue: deque = deque()
+        self.source: threading.Thread = open_source(source, self.push) if source else None
+        self.stats: dict = {"records": 0, "upserts": 0, "removals": 0, "batches": 0, "tiles": 0, "apply_ms": 0.0}
+
+        self.timer: QTimer = QTimer()
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.apply_pending)
+
+    def start(self) -> None:
+        if self.source is not None and not self.source.is_alive():
+            self.source.start()
+        self.timer.start()
+
+    def stop(self) -> None:
+        self.timer.stop()
+        if self.source is not None:
+            self.source.stop()
+
+    def push(self, records: list) -> None:
+        """
+        Queues parsed records (see parse_record()); safe to call from any thread.
+        """
+        self.queue.extend(records)
+
+    def apply_pending(self) -> int:
+        """
+        Applies the queued records to the layer and recomposes the affected tiles.
+
+        Returns:
+            int: the number of records applied.
+        """
+        count = len(self.queue)
+        if count == 0:
+            return 0
+        start = time.perf_counter()
+        latest = {}
+        for _ in range(count):
+            record = self.queue.popleft()
+            latest[record[1]] = record
+
+        upserts = [record for record in latest.values() if record[0] == "upsert"]
+        removals = [record[1] for record in latest.values() if record[0] == "remove"]
+        with span("feed"):
+            if upserts:
+                ids, lat, lon, attributes = zip(*[record[1:] for record in upserts])
+                self.layer.upsert(list(ids), np.array(lat), np.array(lon), list(attributes))
+            if removals:
+                self.layer.remove(removals)
+            tiles = self.layer.dirty_tiles()
+            if self.layer.visible:
+                self.view.refresh_layers(tiles)
+
+        self.stats["records"] += count
+        self.stats["upserts"] += len(upserts)
+        self.stats["removals"] += len(removals)
+        self.stats["batches"] += 1
+        self.stats["tiles"] += len(tiles) if tiles is not None else 0
+        self.stats["apply_ms"] += (time.perf_counter() - start) * 1000
+        self.applied.emit(len(upserts), len(removals))
+        return count
+
+    def get_stats(self) -> dict:
+        """
+        Returns the ingest statistics: records received, upserts and removals applied, batches, recomposed
+        tiles and the total time spent applying batches.
+        """
+        stats = dict(self.stats)
+        stats["queued"] = len(self.queue)
+        stats["malformed"] = getattr(self.source, "malformed", 0)
+        return stats
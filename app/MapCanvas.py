@@ -0,0 +1,169 @@
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtGui import QPainter, QPixmap, QImage, QRegion, QTransform, QPolygon, QPen, QColor
+from PyQt5.QtCore import Qt, QRect
+from typing import Dict, Iterable, List
+
+from app.MapLayer import MapLayer, paint_layers
+from app.tile_id import tile_zoom, tile_x, tile_y
+from app.profiling import span
+
+class FrameViewport:
+    """
+    Snapshot of the tile range shown by a MapCanvas, with the MapView attributes overlay layers paint
+    against. The canvas paints against its own snapshot, so the frame on screen stays consistent while
+    the view has already moved on (e.g. a zoom level is being fetched).
+    """
+    def __init__(self, zoom_level: int, x_tile_start: int, x_tile_end: int, y_tile_start: int, y_tile_end: int,
+                 img_res_x: int, img_res_y: int, max_zoom_level: int):
+        self.zoom_level: int = zoom_level
+        self.x_tile_start: int = x_tile_start
+        self.x_tile_end: int = x_tile_end
+        self.y_tile_start: int = y_tile_start
+        self.y_tile_end: int = y_tile_end
+        self.img_res_x: int = img_res_x
+        self.img_res_y: int = img_res_y
+        self.max_zoom_level: int = max_zoom_level
+
+    @classmethod
+    def from_view(cls, view) -> "FrameViewport":
+        return cls(view.zoom_level, view.x_tile_start, view.x_tile_end, view.y_tile_start, view.y_tile_end,
+                   view.img_res_x, view.img_res_y, view.max_zoom_level)
+
+    def key(self) -> tuple:
+        return (self.zoom_level, self.x_tile_start, self.x_tile_end, self.y_tile_start, self.y_tile_end, self.img_res_x, self.img_res_y)
+
+    def tile_rect(self, tile: int) -> QRect:
+        """
+        Returns the rectangle of a tile of the snapshot zoom level in frame pixels.
+        """
+        return QRect((tile_x(tile) - self.x_tile_start) * self.img_res_x, (tile_y(tile) - self.y_tile_start) * self.img_res_y,
+                     self.img_res_x, self.img_res_y)
+
+
+class MapCanvas(QWidget):
+    """
+    Map widget with dirty-region repaints. Imagery tiles are individual pixmaps placed by tile id, and
+    the overlay layers are painted over them from their per-tile overlay images (see MapLayer.paint()),
+    directly in paintEvent() without any intermediate full-frame buffer. Changes invalidate only the
+    rectangles of the tiles they touch (set_tiles(), update_tiles()), and Qt repaints just that region:
+    a moving marker costs the repaint of its tiles, not of the viewport. Zoom previews and animations
+    are view transforms of the frame on screen (set_view_transform()) instead of rescaled copies.
+    """
+    def __init__(self, parent: QWidget = None):
+        super().__init__(parent)
+        self.viewport: FrameViewport = None
+        self.tiles: Dict[int, QPixmap] = {}
+        self.layers: List[MapLayer] = []
+        self.view_transform: QTransform = QTransform()
+        self.outline: QPolygon = None
+        self.stats: dict = {"paints": 0, "pixels": 0}
+        self.setAttribute(Qt.WA_OpaquePaintEvent) # paintEvent() covers the whole exposed region
+
+    def set_tiles(self, viewport: FrameViewport, tiles: Dict[int, QPixmap]) -> None:
+        """
+        Shows imagery tiles. Tiles of a new viewport replace the frame; tiles of the viewport on screen
+        are merged into it, repainting only the tiles whose pixmap changed.
+
+        Args:
+            viewport (FrameViewport): tile range of the tiles.
+            tiles (dict): tile id to pixmap.
+        """
+        if self.viewport is None or viewport.key() != self.viewport.key():
+            self.viewport = viewport
+            self.tiles = dict(tiles)
+            self.update()
+            return
+        region = QRegion()
+        for tile, pixmap in tiles.items():
+            if self.tiles.get(tile) is not pixmap:
+                self.tiles[tile] = pixmap
+                region += viewport.tile_rect(tile)
+        self.update_region(region)
+
+    def update_tiles(self, tiles: Iterable[int]) -> None:
+        """
+        Schedules the repaint of tiles (e.g. overlay tiles changed in place); tiles of other zoom levels
+        than the one on screen are ignored.
+        """
+        if self.viewport is None:
+            return
+        region = QRegion()
+        for tile in tiles:
+            if tile_zoom(tile) == self.viewport.zoom_level:
+                region += self.viewport.tile_rect(tile)
+        self.update_region(region)
+
+    def update_region(self, region: QRegion) -> None:
+        if region.isEmpty():
+            return
+        if not self.view_transform.isIdentity():
+            self.update() # Frame regions are transformed on screen
+        else:
+            self.update(region)
+
+    def set_view_transform(self, transform: QTransform) -> None:
+        """
+        Sets the transform of the frame on screen (pan offset, zoom scaling); the identity shows the frame as is.
+        """
+        if transform != self.view_transform:
+            self.view_transform = QTransform(transform)
+            self.update()
+
+    def set_outline(self, outline: QPolygon) -> None:
+        """
+        Shows a closed outline in widget pixels over the frame (e.g. a lasso being drawn); None removes it.
+        """
+        region = QRegion()
+        for polygon in (self.outline, outline):
+            if polygon is not None:
+                region += polygon.boundingRect().adjusted(-2, -2, 2, 2)
+        self.outline = QPolygon(outline) if outline is not None else None
+        if not region.isEmpty():
+            self.update(region)
+
+    def paintEvent(self, event) -> None:
+        with span("paint"):
+            painter = QPainter(self)
+            painter.setClipRegion(event.region()) # Layers only compose the tiles within the clip
+            self.paint_content(painter, event.rect())
+            painter.end()
+        self.stats["paints"] += 1
+        self.stats["pixels"] += sum(rect.width() * rect.height() for rect in event.region().rects())
+
+    def paint_content(self, painter: QPainter, exposed: QRect) -> None:
+        """
+        Paints the imagery tiles and overlay layers within an exposed rectangle of the widget.
+        """
+        painter.fillRect(exposed, Qt.black)
+        if self.viewport is None:
+            return
+        if not self.view_transform.isIdentity():
+            painter.setRenderHint(QPainter.SmoothPixmapTransform)
+            painter.setTransform(self.view_transform)
+            exposed = self.view_transform.inverted()[0].mapRect(exposed)
+        for tile, pixmap in self.tiles.items():
+            rect = self.viewport.tile_rect(tile)
+            if rect.intersects(exposed):
+                painter.drawPixmap(rect, pixmap, pixmap.rect())
+        paint_layers(painter, self.layers, self.viewport)
+        if self.outline is not None:
+            painter.setTransform(QTransform()) # The outline is in widget pixels
+            painter.setPen(QPen(QColor("#FFD700"), 1.5, Qt.DashLine))
+            painter.setBrush(QColor(255, 215, 0, 40))
+            painter.drawPolygon(self.outline)
+
+    def grab_frame(self) -> QImage:
+        """
+        Renders the frame as it would appear on screen into an image.
+        """
+        image = QImage(self.size(), QImage.Format_RGB32)
+        painter = QPainter(image)
+        self.paint_content(painter, image.rect())
+        painter.end()
+        return image
+
+    def get_stats(self) -> dict:
+        """
+        Returns the number of paint events and the total number of pixels they covered.
+        """
+        return dict(self.stats)
@@ -12,10 +12,11 @@ from app.MouseEventWidget import MouseEventWidget
 
 class MapInterface(QMainWindow):
     def __init__(self, window_width_px: int = None, window_height_px: int = None, 
-                 storage_path: str = None, update_interval: int = 1000):
+                 storage_path: str = None, update_interval: int = 1000, session_path: str = None):
         super(MapInterface, self).__init__(parent=None)
         self.update_interval: int = update_interval
         self.storage_path: str = storage_path
+        self.session_path: str = session_path
         self.tile_dimensions: np.array = np.array([256, 256])
         self.control_panel_height: int = 80
         self.max_tile_width: int = 8
@@ -40,12 +41,20 @@ class MapInterface(QMainWindow):
             self.storage_path = root_path / "resources" / "images"
 
         self.map_view = MapView(self.img_buffer_width, self.img_buffer_height, self.tile_dimensions[0], self.tile_dimensions[1],
-                                thread_count= 4, update_interval= self.update_interval)
+                                storage_path= str(self.storage_path), thread_count= 4, update_interval= self.update_interval,
+                                session_path= self.session_path)
         central_layout = self.create_central_layout()
         self.configure_map_view(central_layout)
         self.configure_control_panel(central_layout)
         self.map_view.set_active_state(True)
                 
+    def closeEvent(self, event) -> None:
+        """
+        Persists the viewport on close so the next launch warm-starts where this session ended.
+        """
+        self.map_view.save_session()
+        super().closeEvent(event)
+
     def create_central_layout(self) -> QVBoxLayout:
         central_widget = QWidget()    
         layout = QVBoxLayout()
@@ -58,6 +67,12 @@ class MapInterface(QMainWindow):
         widget = MouseEventWidget()
         widget.clickedZoomIn.connect(lambda: self.map_view.click_zoom(widget.clickPos, True))
         widget.clickedZoomOut.connect(lambda: self.map_view.click_zoom(widget.clickPos, False))
+        widget.scrolled.connect(self.map_view.wheel_event_func)
+        widget.inspected.connect(self.map_view.inspect)
+        widget.lassoMoved.connect(self.map_view.draw_lasso)
+        widget.lassoed.connect(self.map_view.select_lasso)
+        self.map_view.featuresInspected.connect(self.show_inspection)
+        self.map_view.featuresSelected.connect(self.show_selection)
         map_layout = QVBoxLayout()
         map_layout.setContentsMargins(0, 0, 0, 0)
         map_layout.addWidget(self.map_view.map_view_frame)
@@ -100,8 +115,35 @@ class MapInterface(QMainWindow):
         """
         Helper method for creating all other elements on the interface control panel.
         """
-        # panel_layout.addWidget(...)
-        pass
+        self.inspect_label = QLabel("Ctrl+click a marker to inspect it, Shift+drag to select markers.")
+        self.inspect_label.setWordWrap(True)
+        self.inspect_label.setFixedHeight(height)
+        panel_layout.addWidget(self.inspect_label)
+
+    def show_inspection(self, lat: float, lon: float, hits: list) -> None:
+        """
+        Shows the result of a click-to-inspect query on the control panel.
+        """
+        text = f"{lat:.5f}, {lon:.5f}: "
+        if not hits:
+            text += "no features."
+        else:
+            layer, indices, distances = hits[0]
+            text += f"{sum(len(h[1]) for h in hits)} feature(s). Nearest in '{layer.name}' (#{indices[0]}, {distances[0]:.2f} nm)"
+            features = layer.features(indices[:1])
+            if features is not None:
+                text += f":\n{features}"
+        self.inspect_label.setText(text)
+
+    def show_selection(self, selections: list) -> None:
+        """
+        Shows the result of a lasso selection on the control panel.
+        """
+        if not selections:
+            self.inspect_label.setText("No features selected.")
+            return
+        counts = ", ".join(f"{len(indices)} in '{layer.name}'" for layer, indices, _ in selections)
+        self.inspect_label.setText(f"Selected {sum(len(s[1]) for s in selections)} feature(s): {counts}.")
     
     def compute_interface_size(self, window_width_px: int = None, window_height_px: int = None) -> Tuple[int, int]:
         """
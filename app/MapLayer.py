@@ -0,0 +1,154 @@
+import math
+import itertools
+import numpy as np
+from PyQt5.QtGui import QPainter, QImage
+from PyQt5.QtCore import QRect
+from typing import Dict, List, Tuple
+
+from app.profiling import span
+from app.tile_id import tile_id, tile_x, tile_y
+from app.OverlayCache import OverlayTileCache, get_overlay_cache
+
+_layer_ids = itertools.count()
+
+class MapLayer:
+    """
+    Base class for overlay layers drawn over the imagery by MapView. Layers are painted from per-tile
+    overlay images: subclasses implement render_tiles(), rendering their content for tiles of a zoom
+    level, and paint() composes the tiles of the viewport, rendering only the tiles missing from the
+    overlay tile cache (keyed by layer id, tile id and layer version). Subclasses call invalidate()
+    whenever their content changes as a whole; layers updated in place drop only the touched tiles (see
+    dirty_tiles()). Layers may instead override paint() and draw directly. Layers with pickable features
+    override hit_test() for click-to-inspect and select_polygon() for lasso selection.
+
+    Args:
+        name (str): layer name.
+        visible (bool): whether the layer is painted.
+        z_order (int): painting order; higher layers are painted on top.
+    """
+    def __init__(self, name: str, visible: bool = True, z_order: int = 0):
+        self.name: str = name
+        self.visible: bool = visible
+        self.z_order: int = z_order
+        self.version: int = 0
+        self.layer_id: int = next(_layer_ids)
+        self.overlay_cache: OverlayTileCache = get_overlay_cache() # None renders every paint
+
+    def invalidate(self) -> None:
+        """
+        Marks the layer content as changed.
+        """
+        self.version += 1
+        if self.overlay_cache is not None:
+            self.overlay_cache.drop_layer(self.layer_id)
+
+    def paint(self, painter: QPainter, view) -> None:
+        """
+        Paints the layer for the viewport of a MapView from its overlay tiles. Cached tiles are reused;
+        the missing ones are rendered together with one render_tiles() call and cached. With a clip set
+        on the painter (a partial repaint), only the tiles within the clip are composed.
+
+        Args:
+            painter (QPainter): active painter on the frame buffer.
+            view (MapView): the map view (zoom level, tile range and tile resolution).
+        """
+        res = view.img_res_x
+        zoom = view.zoom_level
+        x_start, x_end, y_start, y_end = view.x_tile_start, view.x_tile_end, view.y_tile_start, view.y_tile_end
+        if painter.hasClipping():
+            clip = painter.clipBoundingRect()
+            x_start = max(x_start, view.x_tile_start + math.floor(clip.left() / res))
+            x_end = min(x_end, view.x_tile_start + math.ceil(clip.right() / res) - 1)
+            y_start = max(y_start, view.y_tile_start + math.floor(clip.top() / res))
+            y_end = min(y_end, view.y_tile_start + math.ceil(clip.bottom() / res) - 1)
+        images, missing = {}, []
+        for y in range(y_start, y_end + 1):
+            for x in range(x_start, x_end + 1):
+                tile = tile_id(zoom, x, y)
+                hit, image = self.overlay_cache.get(self.layer_id, self.version, tile, res) if self.overlay_cache else (False, None)
+                if hit:
+                    images[tile] = image
+                else:
+                    missing.append(tile)
+        if missing:
+            rendered = self.render_tiles(zoom, missing, res)
+            for tile in missing:
+                images[tile] = rendered.get(tile)
+                if self.overlay_cache is not None:
+                    self.overlay_cache.put(self.layer_id, self.version, tile, res, images[tile])
+
+        painter.save()
+        painter.setRenderHint(QPainter.SmoothPixmapTransform) # For tiles rendered below the view resolution
+        for tile, image in images.items():
+            if image is not None:
+                painter.drawImage(QRect((tile_x(tile) - view.x_tile_start) * res, (tile_y(tile) - view.y_tile_start) * res, res, res),
+                                  image, image.rect())
+        painter.restore()
+
+    def render_tiles(self, zoom: int, tiles: List[int], res: int) -> Dict[int, QImage]:
+        """
+        Renders the layer content of tiles of one zoom level into transparent images.
+
+        Args:
+            zoom (int): zoom level of the tiles.
+            tiles (List[int]): tile ids to render.
+            res (int): tile resolution in pixels.
+
+        Returns:
+            Dict[int, QImage]: tile id to image; empty tiles may be omitted or None.
+        """
+        raise NotImplementedError
+
+    def dirty_tiles(self) -> set:
+        """
+        Returns the ids of the tiles of the current frame whose content changed since the layer was last
+        painted, for layers updated in place (without invalidate()). Empty if nothing changed in place,
+        None if the whole frame has to be recomposed.
+        """
+        return set()
+
+    def hit_test(self, lat: float, lon: float, radius_nm: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the layer features within a great-circle distance of a location.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (feature indices, distances in nautical miles), nearest first.
+        """
+        return np.empty(0, dtype=np.intp), np.empty(0)
+
+    def select_polygon(self, x: np.ndarray, y: np.ndarray, zoom: int, tile_res: int) -> np.ndarray:
+        """
+        Finds the layer features inside a polygon in projected (Web Mercator world pixel) coordinates.
+
+        Args:
+            x (np.ndarray): x-coordinates of the polygon vertices in world pixels.
+            y (np.ndarray): y-coordinates of the polygon vertices in world pixels.
+            zoom (int): zoom level of the pixel coordinates.
+            tile_res (int): tile resolution of the pixel coordinates.
+
+        Returns:
+            np.ndarray: feature indices, ascending.
+        """
+        return np.empty(0, dtype=np.intp)
+
+    def features(self, indices: np.ndarray):
+        """
+        Returns the attributes of features found by hit_test() or select_polygon(), or None if the layer has none.
+        """
+        return None
+
+
+def paint_layers(painter: QPainter, layers: List[MapLayer], view) -> None:
+    """
+    Paints the visible layers in ascending z-order with antialiasing.
+
+    Args:
+        painter (QPainter): active painter on the frame buffer.
+        layers (List[MapLayer]): the overlay layers.
+        view (MapView): the map view, or any viewport with the same tile range attributes.
+    """
+    painter.setRenderHint(QPainter.Antialiasing)
+    for layer in sorted(layers, key=lambda layer: layer.z_order):
+        if layer.visible:
+            with span(f"layer:{layer.name}"):
+                layer.paint(painter, view)
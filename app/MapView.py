@@ -1,20 +1,45 @@
-from PyQt5.QtWidgets import QLabel, QWidget
-from PyQt5.QtGui import QPixmap, QPainter # , QBrush, QPen, QColor
-from PyQt5.QtCore import QTimer, QPoint, QRect, QEvent
+import json
+import math
+import numpy as np
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtGui import QPixmap, QImage, QTransform, QPolygon # , QBrush, QPen, QColor
+from PyQt5.QtCore import QTimer, QPoint, QEvent, QEasingCurve, QVariantAnimation, pyqtSignal
+from pathlib import Path
 from typing import Tuple
 
-from app.ImageDownloader import ImageDownloader
+from app.ImageDownloader import duplicate_samples
+from app.MapCanvas import MapCanvas, FrameViewport
+from app.MapLayer import MapLayer
+from app.TileCache import TileCache
+from app.TileStore import TileStore
+from app.TileService import TileService, get_tile_service
+from app.SessionRecorder import SessionRecorder
+from app.tile_id import tile_id
+from app.util import RADIUS_OF_EARTH, tile_to_degree
+from app.profiling import span
 
 # TODO: Util usage of geodetic, tile-layer and pixel conversions and operations for drawn elements
 # from util import *
 
 class MapView(QWidget):
+    framePainted = pyqtSignal(str)
+    featuresInspected = pyqtSignal(float, float, list)
+    featuresSelected = pyqtSignal(list)
+
     def __init__(self, map_width_px: int, map_height_px: int, img_res_width: int, img_res_height: int, 
-                 storage_path: str = None, thread_count: int = 4, update_interval: int = 1000, max_zoom_level: int = 10):
+                 storage_path: str = None, thread_count: int = 4, update_interval: int = 1000, max_zoom_level: int = 10,
+                 session_path: str = None, tile_service: TileService = None):
         super().__init__()
         self.update_interval: int = update_interval
         self.storage_path: str = storage_path
+        self.tile_service: TileService = tile_service or get_tile_service(storage_path)
+        self.tile_store: TileStore = self.tile_service.tile_store
+        self.session_path: str = session_path
+        self.restored_session: bool = False
+        self.restored_tiles: int = 0
+        self.fetch_results: dict = {}
         self.is_active: bool = False
+        self.trace: SessionRecorder = None # Records navigation when set (see SessionRecorder.attach())
         
         self.min_zoom_level: int = 3 # Hard Requirement
         self.max_zoom_level: int = max_zoom_level
@@ -33,55 +58,148 @@ class MapView(QWidget):
 
         self.img_fetch_threads: int = thread_count
         self.mouse_timer_stop_request: bool = False
-        self.map_view_frame: QLabel = QLabel()
-        self.map_image: QPixmap = QPixmap()
-
-        self.thread_timer: QTimer = QTimer()
-        self.thread_timer_scroll: QTimer = QTimer()
-        self.thread_timer_scroll_done: bool = True
-        self.thread_queue_timer: QTimer = QTimer()
-        self.thread_queue: list = []
-        self.thread_queue_timer_request_stop: bool = False
-        self.thread_queue_timer_done: bool = True
-
-        self.wheel_timer: QTimer = QTimer()
-        self.can_change_tile_layer: bool = True
-        # self.zoom_center_point: QPoint = QPoint(0, 0)
-        self.zoom_dist: int = 0
-        self.last_zoom_dist: int = 0
+        self.map_view_frame: MapCanvas = MapCanvas()
+        self.layers: list = []
+        self.map_view_frame.layers = self.layers
+
+        # Wheel zoom: input accumulates into a target zoom; one fetch once scrolling settles.
+        self.wheel_angle_per_level: int = 120 # One notch of a standard mouse wheel
+        self.wheel_angle_accumulated: int = 0
+        self.wheel_anchor: QPoint = None
+        self.wheel_settle_timer: QTimer = QTimer()
+        self.wheel_settle_timer.setSingleShot(True)
+        self.wheel_settle_timer.setInterval(min(250, self.update_interval))
+        self.wheel_settle_timer.timeout.connect(self.wheel_settled)
+
+        # Click zoom: the frame on screen is scaled towards the new level while its imagery is fetched.
+        self.zoom_animation: QVariantAnimation = QVariantAnimation()
+        self.zoom_animation.setDuration(200)
+        self.zoom_animation.setEasingCurve(QEasingCurve.OutCubic)
+        self.zoom_animation_anchor: QPoint = None
+        self.zoom_animation.valueChanged.connect(lambda value: self.paint_zoom_preview(value, self.zoom_animation_anchor))
+
+        # Revalidated tiles that changed on the server: one reload of the viewport per burst of changes.
+        self.tile_change_timer: QTimer = QTimer()
+        self.tile_change_timer.setSingleShot(True)
+        self.tile_change_timer.setInterval(200)
+        self.tile_change_timer.timeout.connect(self._fetch_imagery)
+        self.tile_service.tileChanged.connect(self.tile_changed)
 
         self.widgets: dict = None
 
         self.jobs: list = []
-        self.img_cache: dict = dict()
-        self.img_cache_indexer: list = []
         self.paint_queue: list = []
-        memory_limit = 100 * (1024 ** 2) # 100 Mb
-        image_cache_limit: int = int(memory_limit / (self.img_res_x * self.img_res_y * 3))
-        self.image_cache_limit: int = min(1000, image_cache_limit)
+        '''
+        The tile cache (100Mb for all views), worker pool and fetcher are shared through the tile service.
+        Hot tier: decoded pixmaps for about three viewports per view (current view plus zoom neighbourhood).
+        Warm tier: compressed tile bytes (~20Kb per) in the remaining budget, thousands of tiles.
+        '''
+        self.img_cache: TileCache = self.tile_service.cache
+        self.subscriber: int = self.tile_service.subscribe(self.max_tile_width * self.max_tile_height)
         
         self.installEventFilter(self)
 
-        self._fetch_imagery()
         self.set_map_window(map_width_px, map_height_px)
-        
-        # Threading for ImageDownloader object
-        self.thread_timer: QTimer = QTimer()
-        self.thread_timer.setInterval(self.update_interval)
-        self.thread_timer.timeout.connect(self.thread_timer_func)
-        self.thread_timer.start()
+        if self.session_path:
+            self.restore_session(self.session_path)
+        self.map_view_frame.set_tiles(FrameViewport.from_view(self), {}) # Layers show before any imagery
+
+        # Warm start: paint stored tiles right away, then fetch once the event loop is running.
+        self.paint_from_store()
+        QTimer.singleShot(0, self._start_fetching)
 
     def set_active_state(self, state: bool) -> None:
         self.is_active = state
 
+    def _start_fetching(self) -> None:
+        """
+        Internal method for the deferred initial image fetch.
+        """
+        self._fetch_imagery()
+
+    ##### SESSION STATE FUNCTIONS #####
+    def save_session(self, file: str = None) -> None:
+        """
+        Persists the current viewport (zoom level and tile ranges) as JSON.
+
+        Args:
+            file (str, optional): session file path. Defaults to the session path given at construction.
+        """
+        file = file or self.session_path
+        if not file:
+            return
+        state = {
+            "zoom_level": self.zoom_level,
+            "x_tile_start": self.x_tile_start,
+            "x_tile_end": self.x_tile_end,
+            "y_tile_start": self.y_tile_start,
+            "y_tile_end": self.y_tile_end,
+        }
+        Path(file).parent.mkdir(parents=True, exist_ok=True)
+        with open(file, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+
+    def restore_session(self, file: str) -> bool:
+        """
+        Restores a viewport persisted by save_session. The restored view is re-centred on the saved
+        centre tile, so sessions saved with a different window size still restore sensibly.
+
+        Args:
+            file (str): session file path.
+
+        Returns:
+            bool: True if a session was restored.
+        """
+        try:
+            with open(file, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            zoom = int(state["zoom_level"])
+            x_center = (int(state["x_tile_start"]) + int(state["x_tile_end"]) + 1) / 2
+            y_center = (int(state["y_tile_start"]) + int(state["y_tile_end"]) + 1) / 2
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        if not (self.min_zoom_level <= zoom <= self.max_zoom_level):
+            return False
+
+        zoom_res = 2 ** zoom
+        self.zoom_level = zoom
+        self.x_tile_start = min(max(int(x_center - self.max_tile_width / 2), 0), zoom_res - self.max_tile_width)
+        self.x_tile_end = self.x_tile_start + self.max_tile_width - 1
+        self.y_tile_start = min(max(int(y_center - self.max_tile_height / 2), 0), zoom_res - self.max_tile_height)
+        self.y_tile_end = self.y_tile_start + self.max_tile_height - 1
+        self.restored_session = True
+        return True
+
+    def paint_from_store(self) -> int:
+        """
+        Paints the current viewport from the on-disk tile store without any network activity.
+        Stored tiles are also placed in the in-memory cache, so the following fetch skips them.
+
+        Returns:
+            int: the number of tiles painted.
+        """
+        if self.tile_store is None:
+            return 0
+        imgs = {}
+        for i in range(self.x_tile_start, self.x_tile_end + 1):
+            for j in range(self.y_tile_start, self.y_tile_end + 1):
+                key = tile_id(self.zoom_level, i, j)
+                data = self.tile_store.read(key)
+                if data is not None:
+                    with span("decode"):
+                        imgs[key] = (QImage.fromData(data), None, data)
+        if imgs:
+            self.paint_frame(imgs, source="store")
+        self.restored_tiles = len(imgs)
+        return len(imgs)
+
     def set_map_window(self, width: int, height: int, x_offset: int = 0, y_offset: int = 0) -> None:
         """
-        Configures the image window frame that holds the primary Pixmap image buffer.
-        Also defines the Pixmap image buffer size.
+        Configures the map canvas (the image window frame) and its size.
 
         Args:
-            width (int): width of the image buffer.
-            height (int): height of the image buffer.
+            width (int): width of the frame.
+            height (int): height of the frame.
             x_offset (int): X-dimension pixel offset of the frame within the main UI window.
             y_offset (int): Y-dimension pixel offset of the frame within the main UI window.
 
@@ -91,7 +209,6 @@ class MapView(QWidget):
         self.map_view_frame.setFixedSize(width, height)
         self.map_view_frame.setGeometry(x_offset, y_offset, width, height)
         self.map_view_frame.setVisible(True)
-        self.map_image = QPixmap(width, height)
         # self.verify_frame()
 
     def verify_frame(self) -> None:
@@ -99,14 +216,14 @@ class MapView(QWidget):
         Forces the height and width of the image buffer to be within the specified range limits and ensures
         the image buffer fits within the UI window.
         """
-        img = self.img_downloader.get_image_for_key('-'.join([str(x) for x in [self.zoom_level, self.y_tile_start, self.x_tile_start]]))
+        img = self.img_cache.get_pixmap(tile_id(self.zoom_level, self.x_tile_start, self.y_tile_start))
         if img:
             self.img_res_x = img.size().width()
             self.img_res_y = img.size().height()
         buffer_width = self.img_res_x * self.max_tile_width
         buffer_height = self.img_res_y * self.max_tile_height
 
-        if buffer_width != self.map_image.size().width() or buffer_height != self.map_image.size().height():
+        if buffer_width != self.map_view_frame.width() or buffer_height != self.map_view_frame.height():
             raise Exception(f"Map buffer size is invalid: size [{buffer_width}, {buffer_height}] does not match the preset.")
 
     ##### INTERFACE CONTROL FUNCTIONS #####
@@ -124,10 +241,6 @@ class MapView(QWidget):
             return
         
         self._fetch_imagery()
-        self.thread_timer = QTimer()
-        self.thread_timer.setInterval(self.update_interval)
-        self.thread_timer.timeout.connect(self.thread_timer_func)
-        self.thread_timer.start()
 
     def wheel_event(self, event: QEvent) -> None:
         """
@@ -138,65 +251,62 @@ class MapView(QWidget):
 
     def wheel_event_func(self, angle_delta: QPoint, mouse_pos: QPoint) -> None:
         """
-        Mouse scroll wheel event callback. Handles both in/out zooming and evokes image fetching.
-        TODO: angle_delta feature not implemented: Zoom multiple levels per the changed amount.
-        
+        Mouse scroll wheel event callback. Wheel input is accumulated into a (fractional) target zoom and
+        previewed by scaling the current buffer about the mouse position; the imagery for the final level
+        is fetched once, after scrolling settles.
+
         Args:
-            angle_delta (QPoint): the amount of change that the mouse wheel scrolled. (UNUSED)
+            angle_delta (QPoint): the amount of change that the mouse wheel scrolled (1/8 degree units).
             mouse_pos (QPoint): the position of the mouse cursor when the mouse wheel scrolled.
 
         Returns:
             None.
         """
-        self.thread_queue_timer_request_stop = True
-        if self.can_change_tile_layer:
-            self.can_change_tile_layer = False
+        if self.trace is not None:
+            self.trace.record("wheel", dy=angle_delta.y(), x=mouse_pos.x(), y=mouse_pos.y())
+        if not self.is_active or angle_delta.y() == 0:
+            return
+        if self.wheel_anchor is None:
+            self.wheel_anchor = QPoint(mouse_pos)
 
-            next_zoom = self.zoom_level
-            if a.y() > 0:
-                next_zoom += 1
-            else:
-                next_zoom -= 1
-
-            if next_zoom > self.max_zoom_level:
-                next_zoom = self.max_zoom_level
-            if next_zoom < self.min_zoom_level:
-                next_zoom = self.min_zoom_level
-
-            self.wheel_timer = QTimer()
-            self.wheel_timer.setInterval(self.update_interval)
-            self.wheel_timer.timeout.connect(self.reset_wheel_func)
-            self.wheel_timer.start()
-            if next_zoom != self.zoom_level:
-                self.get_imagery(next_zoom, p)
-                
-    def reset_wheel_func(self) -> None:
-        """
-        Method for resetting the thread queue timer. Triggered on detection of mouse wheel scrolling stopped.
-        """
-        if self.thread_queue_timer_done:
-            self.thread_queue_timer.stop()
-            self.can_change_tile_layer = True
-            '''
-            self.currPanJobs = []
-            self.triggeredXPos = False
-            self.triggeredXNeg = False
-            self.triggeredYPos = False
-            self.triggeredYNeg = False
-            self.panOffset = QPoint(0, 0)
-            self.mouse_timer_stop_request = False
-            self.translateMapQPoint = QPoint(0, 0)
-            '''
-
-            self.thread_queue = []
-            self.thread_queue_timer = QTimer()
-            self.thread_queue_timer.setInterval(100)
-            self.thread_queue_timer.timeout.connect(self.process_thread_queue)
-            self.thread_queue_timer.start()
-            self.thread_queue_timer_done = False
-            self.thread_queue_timer_request_stop = False
-
-            self.wheel_timer.stop()
+        # Clamp the accumulated input to the reachable zoom range
+        max_angle = (self.max_zoom_level - self.zoom_level) * self.wheel_angle_per_level
+        min_angle = (self.min_zoom_level - self.zoom_level) * self.wheel_angle_per_level
+        self.wheel_angle_accumulated = min(max(self.wheel_angle_accumulated + angle_delta.y(), min_angle), max_angle)
+
+        self.paint_zoom_preview(self.wheel_angle_accumulated / self.wheel_angle_per_level, self.wheel_anchor)
+        self.wheel_settle_timer.start()
+
+    def wheel_settled(self) -> None:
+        """
+        Fetches the imagery for the target zoom level once the mouse wheel has stopped scrolling.
+        """
+        target_zoom = self.zoom_level + int(round(self.wheel_angle_accumulated / self.wheel_angle_per_level))
+        anchor = self.wheel_anchor
+        self.wheel_angle_accumulated = 0
+        self.wheel_anchor = None
+
+        # The preview stays on screen until the fetched frame is painted
+        if target_zoom == self.zoom_level or not self.get_imagery(target_zoom, anchor):
+            # No level change: drop the preview and show the frame as is
+            self.map_view_frame.set_view_transform(QTransform())
+
+    def paint_zoom_preview(self, zoom_delta: float, anchor: QPoint) -> None:
+        """
+        Shows the frame on screen scaled by 2^zoom_delta about an anchor point (a view transform of the
+        canvas), as a placeholder for the imagery of a (possibly fractional) zoom level that has not been
+        fetched.
+
+        Args:
+            zoom_delta (float): zoom levels relative to the frame on screen.
+            anchor (QPoint): fixed point of the scaling, in frame pixels.
+
+        Returns:
+            None.
+        """
+        scale = 2 ** zoom_delta
+        transform = QTransform().translate(anchor.x(), anchor.y()).scale(scale, scale).translate(-anchor.x(), -anchor.y())
+        self.map_view_frame.set_view_transform(transform)
 
     def click_zoom(self, click_pos: QPoint, zoom_direction: bool) -> None:
         """
@@ -209,12 +319,31 @@ class MapView(QWidget):
         Returns:
             None.
         """
-        self.get_imagery(self.zoom_level + (2*int(zoom_direction)-1), click_pos) 
+        if self.trace is not None:
+            self.trace.record("click_zoom", x=click_pos.x(), y=click_pos.y(), zoom_in=bool(zoom_direction))
+        if not self.is_active:
+            return
+        # Animated towards the new level until its frame is painted (possibly right away, from the cache)
+        self.zoom_animation_anchor = QPoint(click_pos)
+        self.zoom_animation.setStartValue(0.0)
+        self.zoom_animation.setEndValue(float(2*int(zoom_direction)-1))
+        self.zoom_animation.start()
+        if not self.get_imagery(self.zoom_level + (2*int(zoom_direction)-1), click_pos):
+            self.stop_zoom_animation()
+
+    def stop_zoom_animation(self) -> None:
+        """
+        Stops a click zoom animation and shows the frame untransformed.
+        """
+        self.zoom_animation.stop()
+        self.zoom_animation_anchor = None
+        self.map_view_frame.set_view_transform(QTransform())
 
     ##### GEOGRAPHIC IMAGERY FUNCTIONS #####
     def _fetch_imagery(self, job_list: list = None) -> bool:
         """
-        Internal method for initializing and firing thread workers for image retreival from the ArcGIS server.
+        Internal method for requesting the imagery of the viewport from the shared tile service. The frame
+        is painted by tiles_ready() once all tiles are resolved; a newer request supersedes this one.
         
         Args:
             job_list (list, optional): specified list of image jobs for retreival. Useful for area-based reloading.
@@ -228,50 +357,61 @@ class MapView(QWidget):
         else:
             for i in range(self.x_tile_start, self.x_tile_end+1):
                 for j in range(self.y_tile_start, self.y_tile_end+1):
-                    tileStr = str(self.zoom_level) + "-" + str(j) + "-" + str(i)
-                    jobs.append(tileStr)
+                    jobs.append(tile_id(self.zoom_level, i, j))
 
         self.jobs = jobs
         if len(self.jobs) > 0:
-            self.img_downloader = ImageDownloader(self.jobs, self.img_fetch_threads, list(self.img_cache.keys()), file_dir=self.storage_path)
-            self.img_downloader.start()
+            self.tile_service.request(self.subscriber, self.jobs, self.tiles_ready)
             return True
         return False
 
-    def _cache_image(self, pixmap: QPixmap, key: str) -> QPixmap:
+    def tile_changed(self, key: int) -> None:
         """
-        Internal method for caching an image (pixmap) for a supplied key.
+        Reloads the viewport shortly after a tile in it changed on the tile server (see TileRevalidator).
+        """
+        if key in self.jobs and not self.tile_change_timer.isActive():
+            self.tile_change_timer.start()
+
+    def _cache_image(self, pixmap: QPixmap, key: int, data: bytes = None) -> QPixmap:
+        """
+        Internal method for caching an image (pixmap) for a supplied key. Images decoded by the worker
+        threads arrive as QImage and are converted to QPixmap here, on the GUI thread. Pixmaps are already
+        cached (the tile service answers with cached pixmaps and caches the ones it converts), so they
+        are used as they are, without another (counted) cache lookup.
         
         Args:
-            pixmap (QPixmap): pixmap image to be stored in cache.
-            key (str): unique key for accessing the pixmap image.
+            pixmap (QPixmap | QImage): pixmap image to be stored in cache, or None to look the key up.
+            key (int): tile id for accessing the pixmap image.
+            data (bytes, optional): compressed image data, kept in the warm cache tier.
 
         Returns:
-            QPixmap: the pixmap stored in cache, if exists. Otherwise returns the pixmap supplied.
-        """
-        in_cache_test = "was "
-        if key in self.img_cache:
-            # Recently accessed, put at front of list.
-            i = self.img_cache_indexer.index(key)
-            del self.img_cache_indexer[i]
-            self.img_cache_indexer.insert(0, key)
-            pixmap = self.img_cache[key]
-        else:
-            in_cache_test += "not"
-            self.img_cache[key] = pixmap
-            self.img_cache_indexer.insert(0, key)
-
-            '''
-            DO NOT EXCEED 100Mb storage during runtime
-            Estimate: image_cache_limit of about 400 images (~262Kb per) results in 100Mb
-            '''
-            if len(self.img_cache_indexer) + 2 > self.image_cache_limit:
-                delete_key = self.img_cache_indexer[-1]
-                del self.img_cache[delete_key]
-                del self.img_cache_indexer[-1]
-        
+            QPixmap: the pixmap supplied or converted, or the cached pixmap if none was supplied.
+        """
+        if isinstance(pixmap, QPixmap):
+            return pixmap
+        if pixmap is None:
+            return self.img_cache.get_pixmap(key)
+
+        if isinstance(pixmap, QImage):
+            with span("handoff"):
+                pixmap = QPixmap.fromImage(pixmap)
+            self.img_cache.put_pixmap(key, pixmap)
+        if data:
+            self.img_cache.put_bytes(key, data)
         return pixmap
 
+    def cache_stats(self) -> dict:
+        """
+        Returns the hit/miss statistics of the hot (pixmap) and warm (compressed) cache tiers.
+        """
+        return self.img_cache.get_stats()
+
+    def fetch_stats(self) -> dict:
+        """
+        Returns the statistics of the tile fetcher (requests, retries, adaptive concurrency limit, circuit state).
+        """
+        return self.tile_service.fetcher.get_stats()
+
     def get_imagery(self, zoom_to: int, position: QPoint) -> bool:
         """
         Computes the set of image keys ("tiles") about a mouse position and zoom level to fetch.
@@ -298,8 +438,8 @@ class MapView(QWidget):
         curr_zoom_resolution = 2 ** curr_zoom
         next_zoom_resolution = 2 ** zoom_to
         
-        x_pos = position.x() / self.map_image.size().width()
-        y_pos = position.y() / self.map_image.size().height()
+        x_pos = position.x() / self.map_view_frame.width()
+        y_pos = position.y() / self.map_view_frame.height()
 
         # x_tile_at_pos = (x_start_tile * 2) + int(x_pos * (next_zoom_resolution * self.max_tile_width / curr_zoom_resolution))
         # y_tile_at_pos = (y_start_tile * 2) + int(y_pos * (next_zoom_resolution * self.max_tile_height / curr_zoom_resolution))
@@ -352,7 +492,7 @@ class MapView(QWidget):
         """
         print('\n=== TEST === TEST === TEST ===')
         print(x_tiles_lower, x_tiles_upper, y_tiles_lower, y_tiles_upper)
-        print(f"Img buffer = {self.map_image.size().width()} x {self.map_image.size().height()}")
+        print(f"Img buffer = {self.map_view_frame.width()} x {self.map_view_frame.height()}")
         print(f"Zoom Mouse Pos. = {x_pos} x {y_pos}")
         print(f"Zoom-From Mouse Tile = {x_pos * self.max_tile_width} x {y_pos * self.max_tile_height}")
         print('curr zoom: ' + str(curr_zoom))
@@ -370,86 +510,175 @@ class MapView(QWidget):
         print()
         """
         
-        fetch_result = self._fetch_imagery()
-
-        self.thread_timer = QTimer()
-        self.thread_timer.setInterval(self.update_interval)
-        self.thread_timer.timeout.connect(self.thread_timer_func)
-        self.thread_timer.start()
-        
-        return fetch_result
+        return self._fetch_imagery()
 
     ##### THREAD HANDLER FUNCTIONS #####
-    def thread_timer_func(self) -> bool:
+    def tiles_ready(self, imgs: dict) -> bool:
         """
-        Computes the set of image keys ("tiles") about a mouse position and zoom level to fetch.
-        
+        Tile service callback: paints the viewport once all of its tiles are resolved.
+
         Args:
-            zoom_to (int): level to zoom to (in or out).
-            position (position): the position of the mouse cursor; serves as the center point for zooming.
+            imgs (dict): tile id to (image, cache key, data) entries of the requested viewport.
 
         Returns:
-            bool: the status of retreival.
+            bool: whether the frame was painted.
         """
-        if self.img_downloader.check_completed():
-            self.thread_timer.stop()
-            if self.img_downloader.no_data_assert():
-                return False
-
-            self.paint_frame()
-            return True
-
-        return False
+        if duplicate_samples(list(imgs.values())):
+            # Nothing to show: drop a zoom animation or wheel preview still waiting for this frame
+            if self.wheel_anchor is None:
+                self.stop_zoom_animation()
+            return False
 
-    def process_thread_queue(self) -> None:
-        if len(self.thread_queue) < 1:
-            if self.thread_queue_timer_request_stop and self.thread_timer_scroll_done:
-                self.thread_queue_timer_request_stop = False
-                self.thread_queue_timer.stop()
-                self.thread_queue_timer_done = True
-            return
+        self.fetch_results = imgs
+        self.paint_frame(imgs)
+        return True
 
-        if self.thread_timer_scroll_done:
-            self.img_downloader = ImageDownloader(self.thread_queue[0], 2, list(self.img_cache.keys()))
-            self.img_downloader.start()
-        
-            self.thread_timer_scroll = QTimer()
-            self.thread_timer_scroll.setInterval(self.update_interval)
-            self.thread_timer_scroll.timeout.connect(self.thread_timer_func)
-            self.thread_timer_scroll_done = False
-            self.thread_timer_scroll.start()
-        
     def tile_to_pixel(self, xTile: float, yTile: float, ignoreFrame=False) -> Tuple[int, int]:
-        if not ignoreFrame and (xTile * self.img_res_x > self.map_image.size().width() or yTile * self.img_res_y > self.map_image.size().height()):      
+        if not ignoreFrame and (xTile * self.img_res_x > self.map_view_frame.width() or yTile * self.img_res_y > self.map_view_frame.height()):      
             return (0, 0)        
         return (int(xTile * self.img_res_x), int(yTile * self.img_res_y))
 
     ##### PAINT FUNCTIONS #####
-    def paint_frame(self) -> None:
-        """
-        Paint all visualization elements.
-        """
-        # INITIALIZE PAINTER OBJECT
-        self.painter = QPainter(self.map_image)
-        self.painter.setRenderHint(QPainter.Antialiasing)
-
-        # PAINT BACKGROUND (ARCGIS SATELLITE IMAGERY)        
-        imgs = self.img_downloader.get_cache()
-        for key in list(imgs.keys()):
-            ci = int(key.split('-')[2])
-            cj = int(key.split('-')[1])
-            r = QRect(self.img_res_x * (ci - self.x_tile_start), self.img_res_y * (cj - self.y_tile_start), self.img_res_x, self.img_res_y)
-            if key in imgs:
-                img = self._cache_image(imgs[key][0], key)
-                if isinstance(img, QPixmap):
-                    self.painter.drawPixmap(r, img, QRect(img.rect()))
-                else:
-                    print(f"Error: Image not retrieved. Got {type(img)} type containing '{img}'.")
-
-        # Paint Distinct Layer Elements
-        # draw_circles(...)
-        # draw_rectangles(...)
-
-        # STOP PAINTING AND SET FRAME
-        self.painter.end()
-        self.map_view_frame.setPixmap(self.map_image)
\ No newline at end of file
+    def paint_frame(self, imgs: dict = None, source: str = "network") -> None:
+        """
+        Shows imagery tiles on the map canvas. Tiles of the viewport on screen only repaint where they
+        changed; tiles of a new viewport replace the frame (and end a zoom preview).
+
+        Args:
+            imgs (dict, optional): tile id to (image, cache key, data) entries. Defaults to the results of the last fetch.
+            source (str): origin of the tiles, reported through the framePainted signal.
+        """
+        if imgs is None:
+            imgs = self.fetch_results
+        pixmaps = {}
+        for key, entry in imgs.items():
+            if isinstance(entry, tuple):
+                img = self._cache_image(entry[0], key, entry[2])
+            else:
+                img = self._cache_image(None, key)
+            if isinstance(img, QPixmap):
+                pixmaps[key] = img
+            else:
+                print(f"Error: Image not retrieved. Got {type(img)} type containing '{img}'.")
+
+        self.map_view_frame.set_tiles(FrameViewport.from_view(self), pixmaps)
+        if self.wheel_anchor is None and self.zoom_animation_anchor is not None:
+            self.stop_zoom_animation()
+        self.framePainted.emit(source)
+
+    def compose_frame(self) -> None:
+        """
+        Repaints the whole frame, e.g. after layers were added, removed or changed as a whole. The layers
+        are recomposed from their overlay tiles; the imagery tiles are drawn as they are.
+        """
+        self.map_view_frame.update()
+
+    def grab_frame(self) -> QImage:
+        """
+        Returns an image of the frame as shown (imagery, overlay layers and any zoom preview).
+        """
+        return self.map_view_frame.grab_frame()
+
+    ##### LAYER FUNCTIONS #####
+    def add_layer(self, layer: MapLayer) -> None:
+        """
+        Adds an overlay layer, painted in ascending z-order over the imagery.
+        """
+        self.layers.append(layer)
+        self.layers.sort(key=lambda l: l.z_order)
+        self.compose_frame()
+
+    def remove_layer(self, layer: MapLayer) -> None:
+        if layer in self.layers:
+            self.layers.remove(layer)
+            if layer.overlay_cache is not None:
+                layer.overlay_cache.drop_layer(layer.layer_id)
+            self.compose_frame()
+
+    def refresh_layers(self, tiles: set = None) -> None:
+        """
+        Redraws the overlay layers (e.g. after their content changed) without touching the imagery.
+
+        Args:
+            tiles (set, optional): ids of the only tiles to repaint (see MapLayer.dirty_tiles()). The whole
+                frame is repainted if omitted.
+        """
+        if tiles is None:
+            self.compose_frame()
+        elif tiles:
+            self.map_view_frame.update_tiles(tiles)
+
+    def pixel_to_degree(self, position: QPoint) -> Tuple[float, float]:
+        """
+        Converts a position in the image buffer to latitude and longitude in degrees.
+        """
+        x_tile = self.x_tile_start + position.x() / self.img_res_x
+        y_tile = self.y_tile_start + position.y() / self.img_res_y
+        return tile_to_degree(x_tile, y_tile, self.zoom_level)
+
+    def inspect(self, position: QPoint, tolerance_px: float = 6.0) -> list:
+        """
+        Click-to-inspect: hit tests the visible layers (topmost first) for features within a pixel
+        tolerance of a position and emits featuresInspected(lat, lon, hits).
+
+        Args:
+            position (QPoint): the position of the mouse cursor in the image buffer.
+            tolerance_px (float): pick radius in pixels.
+
+        Returns:
+            list: (layer, feature indices, distances in nautical miles) per layer with hits, nearest first.
+        """
+        if self.trace is not None:
+            self.trace.record("inspect", x=position.x(), y=position.y())
+        lat, lon = self.pixel_to_degree(position)
+        # Ground distance of one pixel at this latitude and zoom level
+        nm_per_px = 2 * math.pi * RADIUS_OF_EARTH * math.cos(math.radians(lat)) / (self.img_res_x * 2 ** self.zoom_level)
+        hits = []
+        for layer in reversed(self.layers):
+            if layer.visible:
+                indices, distances = layer.hit_test(lat, lon, tolerance_px * nm_per_px)
+                if len(indices):
+                    hits.append((layer, indices, distances))
+        self.featuresInspected.emit(lat, lon, hits)
+        return hits
+
+    def draw_lasso(self, points: list) -> None:
+        """
+        Shows the outline of a lasso being drawn.
+
+        Args:
+            points (list): lasso positions (QPoint) in the image buffer.
+        """
+        self.map_view_frame.set_outline(QPolygon(points))
+
+    def select_lasso(self, points: list) -> list:
+        """
+        Completes a lasso: removes its outline and selects the features inside (see select_polygon()).
+        """
+        self.map_view_frame.set_outline(None)
+        return self.select_polygon(points)
+
+    def select_polygon(self, points: list) -> list:
+        """
+        Lasso selection: converts a polygon drawn on the map to projected (world pixel) coordinates and
+        selects the features of the visible layers inside it (topmost first), emitting featuresSelected(selections).
+
+        Args:
+            points (list): polygon vertices (QPoint) in the image buffer.
+
+        Returns:
+            list: (layer, feature indices, features) per layer with selected features, where features are
+                the attribute rows of the selection (a DataFrame subset for marker layers).
+        """
+        selections = []
+        if len(points) >= 3:
+            x = np.array([point.x() for point in points], dtype=np.float64) + self.x_tile_start * self.img_res_x
+            y = np.array([point.y() for point in points], dtype=np.float64) + self.y_tile_start * self.img_res_y
+            for layer in reversed(self.layers):
+                if layer.visible:
+                    with span("select"):
+                        indices = layer.select_polygon(x, y, self.zoom_level, self.img_res_x)
+                    if len(indices):
+                        selections.append((layer, indices, layer.features(indices)))
+        self.featuresSelected.emit(selections)
+        return selections
@@ -0,0 +1,308 @@
+import numpy as np
+from PyQt5.QtGui import QPainter, QImage, QPen, QColor
+from PyQt5.QtCore import Qt, QPointF
+from typing import Dict, Hashable, List, Tuple
+
+from app.MapLayer import MapLayer
+from app.SpatialIndex import DynamicSpatialIndex
+from app.util import RADIUS_OF_EARTH, degree_to_tile_array, tile_to_degree_array, haversine_nm_array, points_in_polygon
+from app.tile_id import tile_x, tile_y, ZOOM_SHIFT, Y_SHIFT
+
+class MarkerLayer(MapLayer):
+    """
+    Overlay layer of point markers with click-to-inspect support and incremental updates.
+
+    Markers live in slots (stable indices into the coordinate arrays); streamed markers are addressed by
+    id and may be inserted, moved and removed one batch at a time. Projected pixel positions are cached
+    per (zoom level, tile resolution) and patched for changed slots only. Painting culls markers to the
+    visible tile range and stamps an antialiased marker sprite once per occupied pixel with NumPy
+    (coincident markers are merged), which keeps painting millions of markers well under a second. The
+    rendered overlay tiles are cached (see MapLayer.paint()), and updates drop only the cached tiles
+    they touch, at every zoom level painted so far (see dirty_tiles()). Hit testing and lasso selection
+    use an incrementally updated spatial index. Overlays are QImages, so the layer can also be painted off the
+    GUI thread (see app.RenderService).
+
+    Args:
+        name (str): layer name.
+        lat (np.ndarray, optional): latitudes in degrees.
+        lon (np.ndarray, optional): longitudes in degrees.
+        data (pd.DataFrame, optional): feature attributes, one row per marker.
+        color (QColor): marker color.
+        radius_px (float): marker radius in pixels.
+        visible (bool): whether the layer is painted.
+        z_order (int): painting order; higher layers are painted on top.
+    """
+    def __init__(self, name: str = "markers", lat: np.ndarray = None, lon: np.ndarray = None, data=None,
+                 color: QColor = QColor("#D62728"), radius_px: float = 4.0, visible: bool = True, z_order: int = 1):
+        super().__init__(name, visible, z_order)
+        self.pen: QPen = QPen(color, 2 * radius_px, Qt.SolidLine, Qt.RoundCap)
+        self.radius_px: float = radius_px
+        self.lat: np.ndarray = np.empty(0)
+        self.lon: np.ndarray = np.empty(0)
+        self.alive: np.ndarray = np.zeros(0, dtype=bool)
+        self.size: int = 0 # Slots in use, including free ones
+        self.free_slots: List[int] = []
+        self.slot_of: Dict[Hashable, int] = {}
+        self.slot_ids: List[Hashable] = []
+        self.attributes: List[dict] = []
+        self.data = None
+        self.index: DynamicSpatialIndex = DynamicSpatialIndex()
+        self.pixel_cache: Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray]] = {}
+        self.sprite_cache: tuple = None
+        self.pending_tiles: set = set()
+        if lat is not None and lon is not None:
+            self.set_points(lat, lon, data)
+
+    def __len__(self) -> int:
+        return self.size - len(self.free_slots)
+
+    def set_points(self, lat: np.ndarray, lon: np.ndarray, data=None) -> None:
+        """
+        Replaces the markers. Feature indices (hit_test) are the row positions of the points.
+
+        Args:
+            lat (np.ndarray): latitudes in degrees.
+            lon (np.ndarray): longitudes in degrees.
+            data (pd.DataFrame, optional): feature attributes, one row per marker.
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        if len(lat) != len(lon) or (data is not None and len(data) != len(lat)):
+            raise Exception(f"Marker layer '{self.name}' requires equal numbers of latitudes, longitudes and data rows.")
+        self.lat, self.lon = lat.copy(), lon.copy()
+        self.alive = np.ones(len(lat), dtype=bool)
+        self.size = len(lat)
+        self.free_slots = []
+        self.slot_of = {}
+        self.slot_ids = [None] * len(lat)
+        self.attributes = [None] * len(lat)
+        self.data = data
+        self.index = DynamicSpatialIndex()
+        self.index.set(np.arange(len(lat)), lat, lon)
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        super().invalidate()
+        self.pixel_cache.clear()
+        self.pending_tiles.clear()
+
+    ##### INCREMENTAL UPDATES #####
+    def _grow(self, capacity: int) -> None:
+        if capacity <= len(self.lat):
+            return
+        capacity = max(capacity, 2 * len(self.lat), 64)
+        extra = capacity - len(self.lat)
+        self.lat = np.concatenate([self.lat, np.zeros(extra)])
+        self.lon = np.concatenate([self.lon, np.zeros(extra)])
+        self.alive = np.concatenate([self.alive, np.zeros(extra, dtype=bool)])
+        self.slot_ids.extend([None] * extra)
+        self.attributes.extend([None] * extra)
+        for key, (x, y) in self.pixel_cache.items():
+            self.pixel_cache[key] = (np.concatenate([x, np.zeros(extra)]), np.concatenate([y, np.zeros(extra)]))
+
+    def upsert(self, ids: List[Hashable], lat: np.ndarray, lon: np.ndarray, attributes: List[dict] = None) -> None:
+        """
+        Inserts markers with new ids and moves (and updates the attributes of) markers with known ids.
+
+        Args:
+            ids (list): marker ids.
+            lat (np.ndarray): latitudes in degrees.
+            lon (np.ndarray): longitudes in degrees.
+            attributes (list, optional): attribute dict per marker.
+        """
+        if len(ids) == 0:
+            return
+        slots = np.empty(len(ids), dtype=np.intp)
+        for i, marker_id in enumerate(ids):
+            slot = self.slot_of.get(marker_id)
+            if slot is None:
+                if self.free_slots:
+                    slot = self.free_slots.pop()
+                else:
+                    slot = self.size
+                    self.size += 1
+                    self._grow(self.size)
+                self.slot_of[marker_id] = slot
+                self.slot_ids[slot] = marker_id
+            slots[i] = slot
+            if attributes is not None:
+                self.attributes[slot] = attributes[i]
+
+        self._mark_dirty(slots[self.alive[slots]]) # Old positions
+        self.lat[slots] = lat
+        self.lon[slots] = lon
+        self.alive[slots] = True
+        for key, (x, y) in self.pixel_cache.items():
+            x[slots], y[slots] = degree_to_tile_array(self.lat[slots], self.lon[slots], key[0])
+            x[slots] *= key[1]
+            y[slots] *= key[1]
+        self._mark_dirty(slots) # New positions
+        self.index.set(slots, self.lat[slots], self.lon[slots])
+
+    def remove(self, ids: List[Hashable]) -> None:
+        """
+        Removes markers by id; unknown ids are ignored.
+        """
+        slots = np.array([self.slot_of.pop(marker_id) for marker_id in ids if marker_id in self.slot_of], dtype=np.intp)
+        if len(slots) == 0:
+            return
+        self._mark_dirty(slots)
+        self.alive[slots] = False
+        for slot in slots.tolist():
+            self.slot_ids[slot] = None
+            self.attributes[slot] = None
+        self.free_slots.extend(slots.tolist())
+        self.index.remove(slots)
+
+    def _mark_dirty(self, slots: np.ndarray) -> None:
+        """
+        Records the tiles covered by the markers in slots at their current positions, at every zoom level
+        and tile resolution painted so far, and drops them from the overlay tile cache.
+        """
+        if len(slots) == 0:
+            return
+        r = int(np.ceil(self.radius_px)) + 1 # Reach of the marker sprite
+        tiles = set()
+        for (zoom, res), (x, y) in self.pixel_cache.items():
+            for dx in (-r, r):
+                for dy in (-r, r):
+                    tx = np.floor((x[slots] + dx) / res).astype(np.int64)
+                    ty = np.floor((y[slots] + dy) / res).astype(np.int64)
+                    valid = (tx >= 0) & (ty >= 0)
+                    tiles.update(((zoom << ZOOM_SHIFT) | (ty[valid] << Y_SHIFT) | tx[valid]).tolist())
+        self.pending_tiles.update(tiles)
+        if self.overlay_cache is not None:
+            self.overlay_cache.invalidate_tiles(self.layer_id, tiles)
+
+    def dirty_tiles(self) -> set:
+        if not self.pixel_cache:
+            return None # Not painted yet: the whole frame
+        return set(self.pending_tiles)
+
+    ##### HIT TESTING #####
+    def hit_test(self, lat: float, lon: float, radius_nm: float) -> Tuple[np.ndarray, np.ndarray]:
+        if len(self) == 0:
+            return super().hit_test(lat, lon, radius_nm)
+        return self.index.within(lat, lon, radius_nm)
+
+    def select_polygon(self, x: np.ndarray, y: np.ndarray, zoom: int, tile_res: int) -> np.ndarray:
+        """
+        Lasso selection: the spatial index prefilters the markers within the bounding cap of the polygon,
+        and a vectorised point-in-polygon test on their projected positions selects the markers inside.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if len(self) == 0 or len(x) < 3:
+            return np.empty(0, dtype=np.intp)
+        # Straight projected edges are not great circles: the cap has to cover points along the edges too
+        steps = np.linspace(0.0, 1.0, 8, endpoint=False)
+        edge_x = (x[:, None] + (np.roll(x, -1) - x)[:, None] * steps).ravel() / tile_res
+        edge_y = (y[:, None] + (np.roll(y, -1) - y)[:, None] * steps).ravel() / tile_res
+        edge_lat, edge_lon = tile_to_degree_array(edge_x, edge_y, zoom)
+        center_lat, center_lon = tile_to_degree_array((edge_x.min() + edge_x.max()) / 2, (edge_y.min() + edge_y.max()) / 2, zoom)
+        radius_nm = float(haversine_nm_array(center_lat, center_lon, edge_lat, edge_lon).max()) * 1.01
+        if radius_nm < np.pi / 2 * RADIUS_OF_EARTH:
+            slots = self.index.within_unordered(float(center_lat), float(center_lon), radius_nm)
+        else:
+            slots = np.flatnonzero(self.alive[:self.size]) # Wider than a hemisphere: the cap prefilters nothing
+
+        cached = self.pixel_cache.get((zoom, tile_res))
+        if cached is not None:
+            px, py = cached[0][slots], cached[1][slots]
+        else:
+            px, py = degree_to_tile_array(self.lat[slots], self.lon[slots], zoom)
+            px, py = px * tile_res, py * tile_res
+        return np.sort(slots[points_in_polygon(px, py, x, y)])
+
+    def features(self, indices: np.ndarray):
+        """
+        Returns the attribute rows of markers: rows of the layer data, rows built from the streamed
+        attributes, or the coordinates (lat, lon columns) if the layer has neither.
+        """
+        if self.data is not None:
+            return self.data.iloc[indices]
+        import pandas as pd
+        if any(self.attributes[i] is not None for i in indices):
+            return pd.DataFrame([self.attributes[i] or {} for i in indices], index=[self.slot_ids[i] for i in indices])
+        return pd.DataFrame({"lat": self.lat[indices], "lon": self.lon[indices]}, index=indices)
+
+    ##### PAINTING #####
+    def _pixels(self, zoom: int, tile_res: int) -> Tuple[np.ndarray, np.ndarray]:
+        key = (zoom, tile_res)
+        if key not in self.pixel_cache:
+            x, y = degree_to_tile_array(self.lat, self.lon, zoom)
+            self.pixel_cache[key] = (x * tile_res, y * tile_res)
+        return self.pixel_cache[key]
+
+    def _sprite(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the antialiased marker disc as premultiplied ARGB32 pixel values with their offsets from
+        the marker position: (dx, dy, values) of the non-transparent sprite pixels.
+        """
+        key = (self.pen.color().rgba(), self.radius_px)
+        if self.sprite_cache is None or self.sprite_cache[0] != key:
+            half = int(np.ceil(self.radius_px)) + 1
+            image = QImage(2 * half + 1, 2 * half + 1, QImage.Format_ARGB32_Premultiplied)
+            image.fill(Qt.transparent)
+            painter = QPainter(image)
+            painter.setRenderHint(QPainter.Antialiasing)
+            painter.setPen(self.pen)
+            painter.drawPoint(QPointF(half, half))
+            painter.end()
+            bits = image.constBits()
+            bits.setsize(image.byteCount())
+            pixels = np.frombuffer(bits, dtype=np.uint32).reshape(image.height(), image.bytesPerLine() // 4)
+            dy, dx = np.nonzero(pixels)
+            self.sprite_cache = (key, (dx - half, dy - half, pixels[dy, dx].copy()))
+        return self.sprite_cache[1]
+
+    def _render(self, x: np.ndarray, y: np.ndarray, selected: np.ndarray, left: int, top: int, width: int, height: int) -> np.ndarray:
+        """
+        Renders the selected markers into transparent premultiplied ARGB32 pixels ([height, width]) of a
+        world pixel rectangle. Every occupied
+        pixel is stamped once with the marker sprite, keeping the most opaque value where markers overlap.
+        Overlapping markers are indistinguishable anyway, and the result does not depend on the drawing
+        order, so any part of the overlay can be re-rendered on its own.
+        """
+        dx, dy, values = self._sprite()
+        half = int(max(np.abs(dx).max(), np.abs(dy).max()))
+        pad = 2 * (half + 1) # Markers up to a radius outside the rectangle, plus the sprite around them
+        stride = width + 2 * pad
+        px = np.round(x[selected] - left).astype(np.int64) + pad
+        py = np.round(y[selected] - top).astype(np.int64) + pad
+        inside = (px >= half) & (px < stride - half) & (py >= half) & (py < height + 2 * pad - half)
+        canvas = np.zeros((height + 2 * pad) * stride, dtype=np.uint32)
+        occupied = np.zeros(len(canvas), dtype=bool)
+        occupied[py[inside] * stride + px[inside]] = True
+        pixels = np.flatnonzero(occupied)
+        for ox, oy, value in zip(dx.tolist(), dy.tolist(), values.tolist()):
+            # Unique pixels: no duplicate targets within one sprite offset
+            target = pixels + (oy * stride + ox)
+            canvas[target] = np.maximum(canvas[target], value)
+        return canvas.reshape(height + 2 * pad, stride)[pad:pad + height, pad:pad + width]
+
+    def render_tiles(self, zoom: int, tiles: List[int], res: int) -> Dict[int, QImage]:
+        # One render of the bounding rectangle of the tiles, cut into tile images
+        x_start, x_end = min(tile_x(tile) for tile in tiles), max(tile_x(tile) for tile in tiles)
+        y_start, y_end = min(tile_y(tile) for tile in tiles), max(tile_y(tile) for tile in tiles)
+        left, top = x_start * res, y_start * res
+        right, bottom = (x_end + 1) * res, (y_end + 1) * res
+        x, y = self._pixels(zoom, res)
+        x, y = x[:self.size], y[:self.size]
+        r = int(np.ceil(self.radius_px)) + 1 # Reach of the marker sprite
+        near = self.alive[:self.size] & (x >= left - r) & (x < right + r) & (y >= top - r) & (y < bottom + r)
+        if not near.any():
+            return {}
+        canvas = self._render(x, y, near, left, top, right - left, bottom - top)
+        images = {}
+        for tile in tiles:
+            pixels = canvas[tile_y(tile) * res - top:(tile_y(tile) + 1) * res - top, tile_x(tile) * res - left:(tile_x(tile) + 1) * res - left]
+            if pixels.any():
+                pixels = np.ascontiguousarray(pixels)
+                # The QImage only wraps the array: copy it into Qt-owned memory before the array is released
+                images[tile] = QImage(pixels.data, res, res, res * 4, QImage.Format_ARGB32_Premultiplied).copy()
+        return images
+
+    def paint(self, painter: QPainter, view) -> None:
+        super().paint(painter, view)
+        self.pending_tiles.clear()
@@ -6,10 +6,15 @@ from PyQt5.QtCore import QEvent, QPoint
 class MouseEventWidget(QWidget):
     clickedZoomIn = pyqtSignal()
     clickedZoomOut = pyqtSignal()
+    scrolled = pyqtSignal(QPoint, QPoint)
+    inspected = pyqtSignal(QPoint)
+    lassoMoved = pyqtSignal(list)
+    lassoed = pyqtSignal(list)
 
     def __init__(self, parent=None):
         super(MouseEventWidget, self).__init__(parent=parent)
         self.clickPos: QPoint = None
+        self.lassoPoints: list = None
     
     def mousePressEvent(self, event: QEvent) -> None:
         """
@@ -22,9 +27,39 @@ class MouseEventWidget(QWidget):
             None.
         """
         if event.pos() in self.rect():
-            if event.button() == Qt.LeftButton:
+            if event.button() == Qt.LeftButton and event.modifiers() & Qt.ShiftModifier:
+                self.lassoPoints = [event.pos()]
+            elif event.button() == Qt.LeftButton and event.modifiers() & Qt.ControlModifier:
+                self.clickPos = event.pos()
+                self.inspected.emit(event.pos())
+            elif event.button() == Qt.LeftButton:
                 self.clickPos = event.pos()
                 self.clickedZoomIn.emit()
             elif event.button() == Qt.RightButton:
                 self.clickPos = event.pos()
                 self.clickedZoomOut.emit()
+
+    def mouseMoveEvent(self, event: QEvent) -> None:
+        """
+        Extends a lasso (Shift+drag) with the cursor positions, emitting the points drawn so far.
+        """
+        if self.lassoPoints is not None:
+            self.lassoPoints.append(event.pos())
+            self.lassoMoved.emit(list(self.lassoPoints))
+
+    def mouseReleaseEvent(self, event: QEvent) -> None:
+        """
+        Completes a lasso, emitting its points.
+        """
+        if self.lassoPoints is not None and event.button() == Qt.LeftButton:
+            points = self.lassoPoints
+            self.lassoPoints = None
+            self.lassoed.emit(points)
+
+    def wheelEvent(self, event: QEvent) -> None:
+        """
+        Method for handling mouse wheel events. Emits the angle delta and the cursor position.
+        """
+        if event.pos() in self.rect():
+            self.scrolled.emit(event.angleDelta(), event.pos())
+            event.accept()
@@ -0,0 +1,113 @@
+import threading
+from collections import OrderedDict
+from PyQt5.QtGui import QImage
+from typing import Dict, Iterable, Tuple
+
+class OverlayTileCache:
+    """
+    LRU cache of rendered overlay tiles: transparent per-tile images of the overlay layers, keyed by
+    (layer id, tile id, tile resolution) and tagged with the layer version they were rendered for.
+    Entries of an older layer version are misses. Empty tiles are cached too (as None): they hold no
+    image memory, so the number of entries is capped as well, or panning over sparse layers would grow
+    the cache without bound.
+
+    Layers updated in place invalidate only the tiles their changes touched (invalidate_tiles()), and
+    layers changed as a whole drop all of their tiles (drop_layer()), so pans and zoom round trips reuse
+    previously rendered overlay tiles.
+
+    Args:
+        memory_limit (int): memory budget of the tile images in bytes.
+        max_entries (int): maximum number of cached tiles, empty ones included.
+    """
+    def __init__(self, memory_limit: int = 128 * (1024 ** 2), max_entries: int = 65536):
+        self.entries: OrderedDict = OrderedDict() # (layer id, tile id, resolution) -> (version, image)
+        self.layer_entries: Dict[int, Dict[int, set]] = {} # layer id -> tile id -> entry keys
+        self.memory_limit: int = memory_limit
+        self.max_entries: int = max_entries
+        self.bytes: int = 0
+        self.lock: threading.Lock = threading.Lock()
+        self.stats: dict = {"hits": 0, "misses": 0, "evictions": 0, "invalidated": 0}
+
+    def get(self, layer_id: int, version: int, tile: int, res: int) -> Tuple[bool, QImage]:
+        """
+        Returns (hit, image); the image is None for a cached empty tile.
+        """
+        key = (layer_id, tile, res)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                self.stats["misses"] += 1
+                return False, None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return True, entry[1]
+
+    def put(self, layer_id: int, version: int, tile: int, res: int, image: QImage) -> None:
+        key = (layer_id, tile, res)
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = (version, image)
+            self.layer_entries.setdefault(layer_id, {}).setdefault(tile, set()).add(key)
+            self.bytes += image.byteCount() if image is not None else 0
+            while (self.bytes > self.memory_limit or len(self.entries) > self.max_entries) and self.entries:
+                self._remove(next(iter(self.entries)))
+                self.stats["evictions"] += 1
+
+    def _remove(self, key: tuple) -> bool:
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return False
+        self.bytes -= entry[1].byteCount() if entry[1] is not None else 0
+        tiles = self.layer_entries[key[0]]
+        tiles[key[1]].discard(key)
+        if not tiles[key[1]]:
+            del tiles[key[1]]
+        return True
+
+    def invalidate_tiles(self, layer_id: int, tiles: Iterable[int]) -> int:
+        """
+        Drops the cached tiles (any resolution) of a layer.
+
+        Returns:
+            int: number of entries dropped.
+        """
+        dropped = 0
+        with self.lock:
+            layer_tiles = self.layer_entries.get(layer_id, {})
+            for tile in tiles:
+                for key in list(layer_tiles.get(tile, ())):
+                    dropped += int(self._remove(key))
+            self.stats["invalidated"] += dropped
+        return dropped
+
+    def drop_layer(self, layer_id: int) -> None:
+        with self.lock:
+            for keys in list(self.layer_entries.pop(layer_id, {}).values()):
+                for key in keys:
+                    entry = self.entries.pop(key, None)
+                    if entry is not None and entry[1] is not None:
+                        self.bytes -= entry[1].byteCount()
+
+    def get_stats(self) -> dict:
+        """
+        Returns hit/miss/eviction/invalidation counts, entry count and memory use.
+        """
+        with self.lock:
+            stats = dict(self.stats, entries=len(self.entries), bytes=self.bytes)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+_overlay_cache: OverlayTileCache = None
+_overlay_cache_lock: threading.Lock = threading.Lock()
+
+def get_overlay_cache() -> OverlayTileCache:
+    """
+    Returns the process-wide overlay tile cache shared by all layers.
+    """
+    global _overlay_cache
+    with _overlay_cache_lock:
+        if _overlay_cache is None:
+            _overlay_cache = OverlayTileCache()
+        return _overlay_cache
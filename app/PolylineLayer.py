@@ -0,0 +1,174 @@
+import numpy as np
+from PyQt5.QtGui import QPainter, QImage, QPolygonF, QPen, QColor
+from PyQt5.QtCore import Qt, QPointF, QRect
+from typing import Dict, List, Tuple
+
+from app.MapLayer import MapLayer
+from app.tile_id import tile_x, tile_y
+from app.util import degree_to_tile_array, interpolate_interval, douglas_peucker_ranks
+
+class PolylineLayer(MapLayer):
+    """
+    Overlay layer of polylines (routes, tracks) drawn over the imagery.
+
+    Vertices are projected once to normalized Web Mercator coordinates and ranked by Douglas-Peucker
+    significance, so the simplification for a zoom level (`tolerance_px` at that level's scale) is a
+    threshold on the ranks. Per (zoom level, tile resolution), each simplified polyline is cut into
+    chunks of pixel-space polygons with bounding boxes. Rendering culls the chunks against the tiles to
+    render and draws them into transparent overlay tiles, which are cached while the layer content is
+    unchanged (see MapLayer.paint()).
+
+    Args:
+        name (str): layer name.
+        tolerance_px (float): simplification tolerance in screen pixels.
+        max_zoom (int, optional): deepest zoom level the vertex ranks are resolved for. Defaults to the
+            maximum zoom level of the view the layer is painted on.
+        visible (bool): whether the layer is painted.
+        z_order (int): painting order; higher layers are painted on top.
+    """
+    CHUNK_VERTICES = 256
+
+    def __init__(self, name: str = "polylines", tolerance_px: float = 0.5, max_zoom: int = None,
+                 visible: bool = True, z_order: int = 0):
+        super().__init__(name, visible, z_order)
+        self.tolerance_px: float = tolerance_px
+        self.max_zoom: int = max_zoom
+        self.ranked_zoom: int = None
+        self.lines: List[list] = [] # [x, y, ranks, style index]
+        self.styles: List[QPen] = []
+        self.vertex_count: int = 0
+        self.path_cache: Dict[Tuple[int, int], tuple] = {}
+
+    ##### CONTENT #####
+    def add_polyline(self, lat: np.ndarray, lon: np.ndarray, color: QColor = QColor("#1F77B4"), width: float = 2.0) -> None:
+        """
+        Adds a polyline through points in degrees. Lines are split where they cross the antimeridian.
+
+        Args:
+            lat (np.ndarray): latitudes in degrees.
+            lon (np.ndarray): longitudes in degrees.
+            color (QColor): line color.
+            width (float): line width in pixels.
+        """
+        x, y = degree_to_tile_array(lat, lon, 0)
+        if len(x) < 2:
+            return
+        style = self._style_index(color, width)
+        breaks = np.flatnonzero(np.abs(np.diff(x)) > 0.5) + 1
+        for part_x, part_y in zip(np.split(x, breaks), np.split(y, breaks)):
+            if len(part_x) < 2:
+                continue
+            self.lines.append([part_x, part_y, None, style]) # Ranked on first paint
+            self.vertex_count += len(part_x)
+        self.invalidate()
+
+    def add_route(self, lat1: float, lon1: float, lat2: float, lon2: float, interval: float = 10.0,
+                  color: QColor = QColor("#1F77B4"), width: float = 2.0) -> None:
+        """
+        Adds the great-circle route between two points, sampled every `interval` nautical miles.
+        """
+        points = interpolate_interval(lat1, lon1, lat2, lon2, interval) + [[lat2, lon2]]
+        points = np.array(points, dtype=np.float64)
+        self.add_polyline(points[:, 0], points[:, 1], color, width)
+
+    def clear(self) -> None:
+        self.lines = []
+        self.vertex_count = 0
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        super().invalidate()
+        self.path_cache.clear()
+
+    def _style_index(self, color: QColor, width: float) -> int:
+        for i, pen in enumerate(self.styles):
+            if pen.color() == color and pen.widthF() == width:
+                return i
+        pen = QPen(color, width, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
+        self.styles.append(pen)
+        return len(self.styles) - 1
+
+    ##### PATH CACHE #####
+    def _rank_lines(self, max_zoom: int) -> None:
+        """
+        Ranks the vertices of unranked lines, or of all lines if a deeper zoom level is required than
+        they were ranked for. Detail finer than the tolerance at max_zoom is never resolved.
+        """
+        if self.ranked_zoom is None or max_zoom > self.ranked_zoom:
+            self.ranked_zoom = max_zoom
+            for line in self.lines:
+                line[2] = None
+        min_tolerance = self.tolerance_px / (256 * (2 ** self.ranked_zoom))
+        for line in self.lines:
+            if line[2] is None:
+                line[2] = douglas_peucker_ranks(line[0], line[1], min_tolerance)
+
+    def _zoom_paths(self, zoom: int, tile_res: int) -> tuple:
+        """
+        Returns the simplified polygon chunks for a zoom level and tile resolution: (bounding boxes in
+        world pixels [n, 4] as left, top, right, bottom; QPolygonF list; style index array).
+        """
+        key = (zoom, tile_res)
+        if key in self.path_cache:
+            return self.path_cache[key]
+
+        scale = tile_res * (2 ** zoom)
+        tolerance = self.tolerance_px / scale
+        bboxes, paths, styles = [], [], []
+        step = self.CHUNK_VERTICES - 1
+        for x, y, ranks, style in self.lines:
+            keep = ranks > tolerance
+            xs = x[keep] * scale
+            ys = y[keep] * scale
+            for start in range(0, max(len(xs) - 1, 1), step):
+                cx = xs[start:start + self.CHUNK_VERTICES]
+                cy = ys[start:start + self.CHUNK_VERTICES]
+                paths.append(QPolygonF([QPointF(px, py) for px, py in zip(cx.tolist(), cy.tolist())]))
+                bboxes.append((cx.min(), cy.min(), cx.max(), cy.max()))
+                styles.append(style)
+
+        entry = (np.array(bboxes, dtype=np.float64).reshape(-1, 4), paths, np.array(styles, dtype=np.int32))
+        self.path_cache[key] = entry
+        return entry
+
+    ##### PAINTING #####
+    def paint(self, painter: QPainter, view) -> None:
+        if not self.lines:
+            return
+        self._rank_lines(max(self.max_zoom or view.max_zoom_level, view.zoom_level))
+        super().paint(painter, view)
+
+    def render_tiles(self, zoom: int, tiles: List[int], res: int) -> Dict[int, QImage]:
+        # One render of the bounding rectangle of the tiles, cut into tile images
+        left, top = min(tile_x(tile) for tile in tiles) * res, min(tile_y(tile) for tile in tiles) * res
+        right, bottom = (max(tile_x(tile) for tile in tiles) + 1) * res, (max(tile_y(tile) for tile in tiles) + 1) * res
+        bboxes, paths, styles = self._zoom_paths(zoom, res)
+        pad = max((pen.widthF() for pen in self.styles), default=0.0)
+        visible = np.flatnonzero((bboxes[:, 0] <= right + pad) & (bboxes[:, 2] >= left - pad) &
+                                 (bboxes[:, 1] <= bottom + pad) & (bboxes[:, 3] >= top - pad))
+        if len(visible) == 0:
+            return {}
+        # Grouped by style (one pen change each); the stable sort keeps the insertion order within a style
+        visible = visible[np.argsort(styles[visible], kind="stable")]
+
+        overlay = QImage(right - left, bottom - top, QImage.Format_ARGB32_Premultiplied)
+        overlay.fill(Qt.transparent)
+        overlay_painter = QPainter(overlay)
+        overlay_painter.setRenderHint(QPainter.Antialiasing)
+        overlay_painter.translate(-left, -top)
+        current_style = None
+        for i in visible.tolist():
+            if styles[i] != current_style:
+                current_style = styles[i]
+                overlay_painter.setPen(self.styles[current_style])
+            overlay_painter.drawPolyline(paths[i])
+        overlay_painter.end()
+
+        images = {}
+        visible_boxes = bboxes[visible]
+        for tile in tiles:
+            tile_left, tile_top = tile_x(tile) * res, tile_y(tile) * res
+            if np.any((visible_boxes[:, 0] <= tile_left + res + pad) & (visible_boxes[:, 2] >= tile_left - pad) &
+                      (visible_boxes[:, 1] <= tile_top + res + pad) & (visible_boxes[:, 3] >= tile_top - pad)):
+                images[tile] = overlay.copy(QRect(tile_left - left, tile_top - top, res, res))
+        return images
@@ -0,0 +1,587 @@
+'''
+Headless static map rendering: "map image of this bounding box at this zoom level, with these markers".
+
+Renders reuse the composition path of MapView offscreen: the tiles of the (tile aligned) viewport are
+drawn into a frame buffer, the overlay layers (MarkerLayer, PolylineLayer) are painted over it with
+paint_layers(), and the frame is cropped to the bounding box and encoded as PNG. Everything is drawn
+into QImages, which unlike QPixmaps may be used off the GUI thread, so requests are rendered
+concurrently on a worker pool. The workers share one tile loader: compressed tiles are kept in the warm
+tier of a TileCache and decoded tiles in a small LRU, and a tile requested by several renders at once
+is loaded once.
+
+Every result carries its timing (queue, tiles, compose, layers, encode, total in milliseconds), which
+the HTTP server also reports in a Server-Timing header.
+
+Usage:
+    python -m app.RenderService serve --port 8600 --store resources/images
+    python -m app.RenderService batch requests.ndjson -o renders --store resources/images
+    python -m app.RenderService bench -n 200 --workers 8
+'''
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import urllib.error
+import urllib.parse
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from PyQt5.QtCore import QRect, QBuffer, QByteArray, QIODevice
+from PyQt5.QtGui import QImage, QPainter, QColor
+from typing import Dict, List, Tuple
+
+from app.profiling import span
+from app.util import degree_to_tile, tile_to_degree
+from app.tile_id import tile_id, tile_x, tile_y
+from app.MapLayer import MapLayer, paint_layers
+from app.MarkerLayer import MarkerLayer
+from app.PolylineLayer import PolylineLayer
+from app.TileCache import TileCache
+from app.TileStore import TileStore
+from app.TileArchive import open_tile_store
+from app.TileFetcher import TileFetcher, get_default_fetcher
+from app.TileExport import encode_png
+
+TILE_SIZE = 256
+MAX_RENDER_PIXELS = 4096 * 4096
+BACKGROUND_COLOR = QColor("#202020")
+
+##### REQUESTS #####
+class RenderRequest:
+    """
+    A static map to render.
+
+    Args:
+        bbox (tuple): (south, west, north, east) in degrees.
+        zoom (int): level of detail.
+        markers (np.ndarray, optional): marker positions in degrees, shape [n, 2] as (latitude, longitude).
+        marker_color (str): marker color as #RRGGBB.
+        marker_radius (float): marker radius in pixels.
+        polylines (list, optional): polylines, each a list of (latitude, longitude) points.
+        line_color (str): polyline color as #RRGGBB.
+        line_width (float): polyline width in pixels.
+        name (str, optional): request name, used for output files in batch mode.
+    """
+    def __init__(self, bbox: Tuple[float, float, float, float], zoom: int, markers: np.ndarray = None,
+                 marker_color: str = "#D62728", marker_radius: float = 4.0, polylines: list = None,
+                 line_color: str = "#1F77B4", line_width: float = 2.0, name: str = None):
+        self.bbox: Tuple[float, float, float, float] = tuple(bbox)
+        self.zoom: int = zoom
+        self.markers: np.ndarray = np.empty((0, 2)) if markers is None else np.asarray(markers, dtype=np.float64).reshape(-1, 2)
+        self.marker_color: str = marker_color
+        self.marker_radius: float = marker_radius
+        self.polylines: list = polylines or []
+        self.line_color: str = line_color
+        self.line_width: float = line_width
+        self.name: str = name
+        self.submitted: float = time.perf_counter()
+
+
+def parse_request(spec: dict) -> RenderRequest:
+    """
+    Builds a render request from its JSON form, e.g.
+    {"bbox": [south, west, north, east], "zoom": 9, "markers": [[lat, lon], ...], "polylines": [[[lat, lon], ...]]}.
+    Markers may also be given as a "lat,lon;lat,lon" string (query parameters).
+
+    Raises:
+        ValueError: if the request is malformed or the image would be too large.
+    """
+    try:
+        bbox = spec["bbox"]
+        if isinstance(bbox, str):
+            bbox = bbox.split(",")
+        bbox = tuple(float(value) for value in bbox)
+        zoom = int(spec["zoom"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("a render request requires a bbox (south, west, north, east) and a zoom level")
+    south, west, north, east = bbox if len(bbox) == 4 else (None,) * 4
+    if south is None or not (-90.0 <= south < north <= 90.0) or not (-180.0 <= west < east <= 180.0):
+        raise ValueError(f"invalid bbox {bbox}")
+    if not 0 <= zoom <= 23:
+        raise ValueError(f"invalid zoom level {zoom}")
+
+    markers = spec.get("markers")
+    if isinstance(markers, str):
+        markers = [point.split(",") for point in markers.split(";") if point]
+    markers = np.array(markers or [], dtype=np.float64).reshape(-1, 2)
+    polylines = [np.array(line, dtype=np.float64).reshape(-1, 2) for line in spec.get("polylines") or []]
+    request = RenderRequest(bbox, zoom, markers, str(spec.get("marker_color", "#D62728")), float(spec.get("marker_radius", 4.0)),
+                            polylines, str(spec.get("line_color", "#1F77B4")), float(spec.get("line_width", 2.0)), spec.get("name"))
+    viewport = RenderViewport(request.bbox, request.zoom)
+    if viewport.width * viewport.height > MAX_RENDER_PIXELS:
+        raise ValueError(f"image of {viewport.width} x {viewport.height} px exceeds the render limit")
+    return request
+
+
+class RenderViewport:
+    """
+    The tile aligned viewport covering a bounding box at a zoom level, with the tile range attributes of
+    MapView that overlay layers paint against, and the crop rectangle of the bounding box within it.
+    """
+    def __init__(self, bbox: Tuple[float, float, float, float], zoom: int, tile_res: int = TILE_SIZE):
+        south, west, north, east = bbox
+        x0, y0 = degree_to_tile(min(north, 85.0511), west, zoom)
+        x1, y1 = degree_to_tile(max(south, -85.0511), east, zoom)
+        self.zoom_level: int = zoom
+        self.max_zoom_level: int = zoom
+        self.img_res_x: int = tile_res
+        self.img_res_y: int = tile_res
+        left, top = int(x0 * tile_res), int(y0 * tile_res)
+        self.width: int = max(1, int(x1 * tile_res) - left)
+        self.height: int = max(1, int(y1 * tile_res) - top)
+        self.x_tile_start: int = left // tile_res
+        self.y_tile_start: int = top // tile_res
+        self.x_tile_end: int = (left + self.width - 1) // tile_res
+        self.y_tile_end: int = (top + self.height - 1) // tile_res
+        self.crop: QRect = QRect(left - self.x_tile_start * tile_res, top - self.y_tile_start * tile_res, self.width, self.height)
+
+    def tiles(self) -> List[int]:
+        return [tile_id(self.zoom_level, x, y) for y in range(self.y_tile_start, self.y_tile_end + 1)
+                for x in range(self.x_tile_start, self.x_tile_end + 1)]
+
+
+class RenderResult:
+    """
+    A rendered static map: PNG bytes, size, per-stage timing (ms) and tile counts.
+    """
+    def __init__(self, png: bytes, width: int, height: int, timing: Dict[str, float], tiles: Dict[str, int], name: str = None):
+        self.png: bytes = png
+        self.width: int = width
+        self.height: int = height
+        self.timing: Dict[str, float] = timing
+        self.tiles: Dict[str, int] = tiles
+        self.name: str = name
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{stage};dur={ms:.1f}" for stage, ms in self.timing.items())
+
+
+##### SERVICE #####
+class RenderService:
+    """
+    Renders static maps concurrently on a worker pool sharing one tile loader.
+
+    Args:
+        storage_path (str, optional): tile store (or packed tile archive) directory, read first and filled with downloaded tiles.
+        workers (int): concurrent renders.
+        memory_limit (int): memory budget of the compressed tile cache in bytes.
+        decoded_tiles (int): number of decoded tiles kept in memory.
+        fetcher (TileFetcher, optional): tile fetcher; defaults to the process-wide fetcher.
+        cache (TileCache, optional): tile cache to share (only its thread-safe warm tier is used).
+        offline (bool): never contact the tile server; missing tiles are left blank.
+        png_level (int): zlib compression level of the PNG images.
+    """
+    def __init__(self, storage_path: str = None, workers: int = None, memory_limit: int = 100 * (1024 ** 2),
+                 decoded_tiles: int = 512, fetcher: TileFetcher = None, cache: TileCache = None, offline: bool = False,
+                 png_level: int = 3):
+        self.workers: int = workers or max(2, min(8, os.cpu_count() or 2))
+        self.tile_store: TileStore = open_tile_store(storage_path) if storage_path else None
+        self.cache: TileCache = cache or TileCache(memory_limit, hot_limit=1)
+        self.fetcher: TileFetcher = None if offline else (fetcher or get_default_fetcher())
+        self.pool: ThreadPoolExecutor = ThreadPoolExecutor(self.workers, thread_name_prefix="render")
+        self.tile_pool: ThreadPoolExecutor = ThreadPoolExecutor(max(4, self.fetcher.max_concurrency if self.fetcher else 4),
+                                                                thread_name_prefix="render-tiles")
+        self.decoded: OrderedDict = OrderedDict()
+        self.decoded_limit: int = decoded_tiles
+        self.png_level: int = png_level
+        self.loading: Dict[int, Future] = {}
+        self.lock: threading.Lock = threading.Lock()
+        self.stats: dict = {"renders": 0, "failed": 0, "render_ms": 0.0,
+                            "tiles": {"decoded": 0, "cache": 0, "store": 0, "network": 0, "missing": 0, "shared": 0}}
+
+    ##### TILES #####
+    def _tile_future(self, key: int) -> Future:
+        """
+        Returns a future of the decoded tile, loading it unless it is decoded already or being loaded
+        for another render.
+        """
+        with self.lock:
+            image = self.decoded.get(key)
+            if image is not None:
+                self.decoded.move_to_end(key)
+                self.stats["tiles"]["decoded"] += 1
+                future = Future()
+                future.set_result(image)
+                return future
+            future = self.loading.get(key)
+            if future is not None:
+                self.stats["tiles"]["shared"] += 1
+                return future
+            future = self.tile_pool.submit(self._load_tile, key)
+            self.loading[key] = future
+            return future
+
+    def _load_tile(self, key: int) -> QImage:
+        image = None
+        try:
+            data = self.cache.get_bytes(key)
+            source = "cache"
+            if data is None and self.tile_store is not None:
+                data = self.tile_store.read(key)
+                source = "store"
+            if data is None and self.fetcher is not None:
+                try:
+                    data = self.fetcher.fetch(key)
+                    source = "network"
+                    if self.tile_store is not None:
+                        self.tile_store.write(key, data)
+                except Exception as e:
+                    if not isinstance(e, urllib.error.HTTPError) or e.code != 404:
+                        print(f"Error: Tile {key} not retrieved: {e}")
+                    data = None
+            if data is not None:
+                self.cache.put_bytes(key, data)
+                with span("decode"):
+                    image = QImage.fromData(data).convertToFormat(QImage.Format_RGB32)
+                if image.isNull():
+                    image = None
+        finally:
+            with self.lock:
+                self.loading.pop(key, None)
+                self.stats["tiles"]["missing" if image is None else source] += 1
+                if image is not None:
+                    self.decoded[key] = image
+                    while len(self.decoded) > self.decoded_limit:
+                        self.decoded.popitem(last=False)
+        return image
+
+    ##### RENDERING #####
+    def submit(self, request: RenderRequest) -> Future:
+        """
+        Queues a render; the future resolves to a RenderResult.
+        """
+        request.submitted = time.perf_counter()
+        return self.pool.submit(self._render, request)
+
+    def render(self, request: RenderRequest) -> RenderResult:
+        return self.submit(request).result()
+
+    def _layers(self, request: RenderRequest) -> List[MapLayer]:
+        layers = []
+        if request.polylines:
+            polylines = PolylineLayer("polylines")
+            for line in request.polylines:
+                polylines.add_polyline(line[:, 0], line[:, 1], QColor(request.line_color), request.line_width)
+            layers.append(polylines)
+        if len(request.markers):
+            layers.append(MarkerLayer("markers", request.markers[:, 0], request.markers[:, 1],
+                                      color=QColor(request.marker_color), radius_px=request.marker_radius))
+        for layer in layers:
+            layer.overlay_cache = None # Rendered once: not worth caching, and the cache is shared with the GUI
+        return layers
+
+    def _render(self, request: RenderRequest) -> RenderResult:
+        start = time.perf_counter()
+        timing = {"queue": (start - request.submitted) * 1000}
+        try:
+            viewport = RenderViewport(request.bbox, request.zoom)
+            res = viewport.img_res_x
+            keys = viewport.tiles()
+            futures = [self._tile_future(key) for key in keys]
+            images = [future.result() for future in futures]
+            tiles_done = time.perf_counter()
+            timing["tiles"] = (tiles_done - start) * 1000
+
+            # Tile composition as in MapView.paint_frame(), into a QImage frame buffer
+            frame = QImage((viewport.x_tile_end - viewport.x_tile_start + 1) * res,
+                           (viewport.y_tile_end - viewport.y_tile_start + 1) * res, QImage.Format_RGB32)
+            frame.fill(BACKGROUND_COLOR)
+            painter = QPainter(frame)
+            for key, image in zip(keys, images):
+                if image is not None:
+                    painter.drawImage(QRect((tile_x(key) - viewport.x_tile_start) * res, (tile_y(key) - viewport.y_tile_start) * res, res, res),
+                                      image, image.rect())
+            compose_done = time.perf_counter()
+            timing["compose"] = (compose_done - tiles_done) * 1000
+
+            layers = self._layers(request)
+            if layers:
+                paint_layers(painter, layers, viewport)
+            painter.end()
+            layers_done = time.perf_counter()
+            timing["layers"] = (layers_done - compose_done) * 1000
+
+            with span("encode"):
+                # QImage.save() holds the GIL throughout; encoding with zlib lets workers encode in parallel
+                frame = frame.copy(viewport.crop)
+                bits = frame.constBits()
+                bits.setsize(frame.byteCount())
+                pixels = np.frombuffer(bits, dtype=np.uint8).reshape(frame.height(), frame.bytesPerLine() // 4, 4)
+                png = encode_png(pixels[:, :frame.width(), 2::-1], self.png_level)
+            end = time.perf_counter()
+            timing["encode"] = (end - layers_done) * 1000
+            timing["total"] = (end - request.submitted) * 1000
+        except Exception:
+            with self.lock:
+                self.stats["failed"] += 1
+            raise
+
+        with self.lock:
+            self.stats["renders"] += 1
+            self.stats["render_ms"] += timing["total"]
+        tiles = {"tiles": len(keys), "missing": sum(image is None for image in images)}
+        return RenderResult(png, viewport.width, viewport.height, {stage: round(ms, 2) for stage, ms in timing.items()},
+                            tiles, request.name)
+
+    ##### STATISTICS #####
+    def get_stats(self) -> dict:
+        """
+        Returns the render statistics (renders, failures, mean render time), the tile sources and the
+        cache and fetcher statistics.
+        """
+        with self.lock:
+            stats = {"renders": self.stats["renders"], "failed": self.stats["failed"], "tiles": dict(self.stats["tiles"]),
+                     "decoded_entries": len(self.decoded)}
+            stats["mean_ms"] = round(self.stats["render_ms"] / self.stats["renders"], 2) if self.stats["renders"] else 0.0
+        stats["workers"] = self.workers
+        stats["cache"] = self.cache.get_stats()
+        stats["fetcher"] = self.fetcher.get_stats() if self.fetcher else None
+        return stats
+
+    def close(self) -> None:
+        self.pool.shutdown(wait=True)
+        self.tile_pool.shutdown(wait=True)
+
+
+##### HTTP SERVER #####
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /render?bbox=S,W,N,E&zoom=Z[&markers=lat,lon;lat,lon], POST /render (JSON request) and GET /stats.
+    """
+    service: RenderService = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: dict = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, content: dict) -> None:
+        self._send(status, json.dumps(content).encode(), "application/json")
+
+    def _render(self, spec: dict) -> None:
+        try:
+            request = parse_request(spec)
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        try:
+            result = self.service.render(request)
+        except Exception as e:
+            self._send_json(500, {"error": repr(e)})
+            return
+        self._send(200, result.png, "image/png", {"Server-Timing": result.server_timing(),
+                                                  "X-Tiles-Missing": str(result.tiles["missing"])})
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == "/stats":
+            self._send_json(200, self.service.get_stats())
+        elif url.path == "/render":
+            self._render(dict(urllib.parse.parse_qsl(url.query)))
+        else:
+            self._send_json(404, {"error": f"unknown path '{url.path}'"})
+
+    def do_POST(self):
+        if urllib.parse.urlsplit(self.path).path != "/render":
+            self._send_json(404, {"error": f"unknown path '{self.path}'"})
+            return
+        try:
+            spec = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except ValueError:
+            self._send_json(400, {"error": "malformed JSON request"})
+            return
+        self._render(spec)
+
+def serve(service: RenderService, host: str = "127.0.0.1", port: int = 8600) -> ThreadingHTTPServer:
+    """
+    Creates the HTTP server of a render service; call serve_forever() on it (port 0 picks a free port).
+    """
+    handler = type("BoundRenderRequestHandler", (RenderRequestHandler,), {"service": service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+##### BATCH MODE #####
+def render_batch(service: RenderService, requests: List[RenderRequest], output_dir: str = None, verbose: bool = False) -> dict:
+    """
+    Renders requests concurrently and optionally writes them as <output_dir>/<name>.png.
+
+    Returns:
+        dict: renders, failures, wall time, throughput (renders/s) and latency percentiles (ms).
+    """
+    if output_dir:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    futures = [service.submit(request) for request in requests]
+    totals, failed = [], 0
+    for i, future in enumerate(futures):
+        try:
+            result = future.result()
+        except Exception as e:
+            failed += 1
+            print(f"Error: Render {requests[i].name or i} failed: {e!r}")
+            continue
+        totals.append(result.timing["total"])
+        if output_dir:
+            (Path(output_dir) / f"{result.name or i}.png").write_bytes(result.png)
+        if verbose:
+            print(json.dumps({"name": result.name or i, "size": [result.width, result.height], "timing": result.timing}))
+    elapsed = time.perf_counter() - start
+    totals = np.array(totals) if totals else np.zeros(1)
+    return {"renders": len(requests) - failed, "failed": failed, "seconds": round(elapsed, 3),
+            "renders_per_s": round((len(requests) - failed) / elapsed, 1) if elapsed > 0 else 0.0,
+            "p50_ms": round(float(np.percentile(totals, 50)), 2), "p95_ms": round(float(np.percentile(totals, 95)), 2),
+            "max_ms": round(float(totals.max()), 2)}
+
+
+##### LOCAL TILE STAND-IN #####
+class StandInTileHandler(BaseHTTPRequestHandler):
+    """
+    Serves generated JPEG tiles at /{z}/{y}/{x}, after an artificial latency: the latency of the tile's
+    "z-y-x" key in `latencies` if present, else `latency`. Tiles listed in `statuses` are answered with
+    that HTTP status instead (e.g. 404 beyond the source imagery).
+    """
+    tiles: List[bytes] = []
+    latency: float = 0.0
+    latencies: Dict[str, float] = {}
+    statuses: Dict[str, int] = {}
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        key = "-".join(parts)
+        delay = self.latencies.get(key, self.latency)
+        if delay:
+            time.sleep(delay)
+        status = self.statuses.get(key, 200)
+        if status != 200:
+            self.send_error(status)
+            return
+        # Neighbouring tiles get distinct variants, so they never look like a server placeholder
+        z, y, x = [int(part) if part.isdigit() else 0 for part in (parts + ["0", "0", "0"])[:3]]
+        body = self.tiles[(x + 4 * y + z) % len(self.tiles)]
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_tile_stand_in(latency: float = 0.0, variants: int = 16, latencies: Dict[str, float] = None,
+                        statuses: Dict[str, int] = None) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Starts a local tile server answering every tile with one of a few generated tiles (noisy gradients,
+    about the size of compressed imagery tiles). JPEG encoding requires a QGuiApplication.
+
+    Args:
+        latency (float): response latency in seconds.
+        variants (int): number of distinct generated tiles.
+        latencies (dict, optional): per-tile latencies in seconds by "z-y-x" key, overriding `latency`.
+        statuses (dict, optional): HTTP error statuses by "z-y-x" key.
+
+    Returns:
+        Tuple[ThreadingHTTPServer, str]: the server and its tile URL template.
+    """
+    rng = np.random.default_rng(0)
+    tiles = []
+    for _ in range(variants):
+        gradient = np.add.outer(np.arange(TILE_SIZE), np.arange(TILE_SIZE)) // 8
+        pixels = (rng.integers(0, 24, (TILE_SIZE, TILE_SIZE, 4)) + gradient[..., None] + rng.integers(0, 160, 4)).astype(np.uint8)
+        pixels[..., 3] = 255
+        image = QImage(pixels.data, TILE_SIZE, TILE_SIZE, TILE_SIZE * 4, QImage.Format_RGB32)
+        data = QByteArray()
+        buffer = QBuffer(data)
+        buffer.open(QIODevice.WriteOnly)
+        image.save(buffer, "JPEG", 75)
+        tiles.append(bytes(data))
+    handler = type("BoundStandInTileHandler", (StandInTileHandler,), {"tiles": tiles, "latency": latency,
+                                                                       "latencies": latencies or {}, "statuses": statuses or {}})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, name="TileStandIn", daemon=True).start()
+    return server, "http://127.0.0.1:%d/{z}/{y}/{x}" % server.server_port
+
+def random_requests(count: int, zoom: int = 10, width_px: int = 800, height_px: int = 600, markers: int = 500,
+                    seed: int = 0) -> List[RenderRequest]:
+    """
+    Generates render requests of random areas over the continental US, with random markers in each.
+    """
+    rng = random.Random(seed)
+    requests = []
+    for i in range(count):
+        lat, lon = rng.uniform(26.0, 48.0), rng.uniform(-122.0, -72.0)
+        x, y = degree_to_tile(lat, lon, zoom)
+        dx, dy = width_px / TILE_SIZE / 2, height_px / TILE_SIZE / 2
+        north, west = tile_to_degree(x - dx, y - dy, zoom)
+        south, east = tile_to_degree(x + dx, y + dy, zoom)
+        points = np.column_stack([[rng.uniform(south, north) for _ in range(markers)], [rng.uniform(west, east) for _ in range(markers)]])
+        requests.append(RenderRequest((south, west, north, east), zoom, points, name=f"render-{i:05d}"))
+    return requests
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtGui import QGuiApplication
+    app = QGuiApplication(sys.argv[:1]) # Image format plugins (JPEG tiles) are loaded through the application
+
+    parser = argparse.ArgumentParser(description="Headless static map rendering service.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="Serve renders over HTTP.")
+    serve_parser.add_argument('--host', type=str, default="127.0.0.1", help='Interface to bind.')
+    serve_parser.add_argument('--port', type=int, default=8600, help='Port to listen on.')
+    batch_parser = commands.add_parser("batch", help="Render the requests of an NDJSON file (one JSON request per line).")
+    batch_parser.add_argument('requests', type=str, help='NDJSON file of render requests.')
+    batch_parser.add_argument('-o', '--output', type=str, required=True, help='Output directory of the PNG files.')
+    bench_parser = commands.add_parser("bench", help="Measure render throughput against a local tile stand-in.")
+    bench_parser.add_argument('-n', '--count', type=int, default=200, help='Number of renders.')
+    bench_parser.add_argument('--zoom', type=int, default=10, help='Level of detail of the renders.')
+    bench_parser.add_argument('--markers', type=int, default=500, help='Markers per render.')
+    bench_parser.add_argument('--latency', type=float, default=0.01, help='Artificial tile server latency in seconds.')
+    for command in (serve_parser, batch_parser, bench_parser):
+        command.add_argument('-s', '--store', type=str, default=None, help='Tile store or tile archive directory.')
+        command.add_argument('--workers', type=int, default=None, help='Concurrent renders.')
+        command.add_argument('--offline', action='store_true', default=False, help='Only use tiles in the store.')
+        command.add_argument('--tile-url', type=str, default=None, help='Tile server URL template with {z}, {y} and {x}.')
+    args = parser.parse_args()
+
+    tile_url = args.tile_url
+    if args.command == "bench" and tile_url is None:
+        stand_in, tile_url = start_tile_stand_in(args.latency)
+    fetcher = TileFetcher(tile_url) if tile_url else None
+    service = RenderService(args.store, workers=args.workers, fetcher=fetcher, offline=args.offline)
+
+    if args.command == "serve":
+        server = serve(service, args.host, args.port)
+        print(f"Rendering on http://{args.host}:{server.server_port}/render")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.shutdown()
+    elif args.command == "batch":
+        requests = []
+        with open(args.requests) as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    requests.append(parse_request(json.loads(line)))
+                except ValueError as e:
+                    print(f"Error: Skipping request on line {number}: {e}")
+        print(render_batch(service, requests, args.output, verbose=True))
+    else:
+        requests = random_requests(args.count, args.zoom, markers=args.markers)
+        print("cold:", render_batch(service, requests))
+        print("warm:", render_batch(service, requests))
+        print(service.get_stats()["tiles"])
+    service.close()
@@ -0,0 +1,131 @@
+import json
+import time
+import threading
+import numpy as np
+from typing import IO, List
+
+TRACE_VERSION = 1
+
+class SessionRecorder:
+    """
+    Opt-in recorder of a viewing session for later replay (see app.SessionReplay). Events are written as
+    NDJSON, one object per line with the seconds since the recording started (`t`) and the event `type`:
+        session         view geometry and initial viewport (the first event).
+        click_zoom      click position (x, y) and direction (zoom_in).
+        wheel           wheel angle delta (dy) and cursor position (x, y).
+        inspect         click-to-inspect position (x, y).
+        frame           a frame was shown: its viewport and the source of its tiles.
+        tile_request    a viewport request of a view: tile count, cache hits and tiles queued.
+        request_done    a viewport request was answered: tiles resolved and latency in ms.
+        tile            a tile worker finished: tile key, latency in ms (dispatch to result) and success.
+        fetch           a tile server response: tile key, latency in ms, HTTP status (0 without one) and bytes.
+    Fetch events are recorded from worker threads; record() is thread-safe.
+
+    Args:
+        file (str, optional): trace file to write. Events are kept in memory (`events`) if omitted.
+    """
+    def __init__(self, file: str = None):
+        self.file: str = file
+        self.stream: IO = open(file, "w", encoding="utf-8") if file else None
+        self.events: List[dict] = []
+        self.start: float = time.perf_counter()
+        self.lock: threading.Lock = threading.Lock()
+        self.view = None
+
+    def record(self, event_type: str, **fields) -> None:
+        event = {"t": round(time.perf_counter() - self.start, 6), "type": event_type}
+        event.update(fields)
+        with self.lock:
+            if self.stream is not None:
+                self.stream.write(json.dumps(event) + "\n")
+            else:
+                self.events.append(event)
+
+    def attach(self, view) -> None:
+        """
+        Starts recording a map view: its navigation, frames, and the requests of its tile service and fetcher.
+
+        Args:
+            view (MapView): the map view.
+        """
+        self.view = view
+        self.record("session", version=TRACE_VERSION, width=view.map_view_frame.width(), height=view.map_view_frame.height(),
+                    img_res=view.img_res_x, max_zoom_level=view.max_zoom_level, update_interval=view.update_interval,
+                    store=view.tile_store is not None, **viewport_fields(view))
+        view.trace = self
+        view.tile_service.trace = self
+        view.tile_service.fetcher.trace = self
+        view.framePainted.connect(self._frame_painted)
+
+    def _frame_painted(self, source: str) -> None:
+        self.record("frame", source=source, **viewport_fields(self.view))
+
+    def close(self) -> None:
+        if self.view is not None:
+            self.view.framePainted.disconnect(self._frame_painted)
+            for owner in (self.view, self.view.tile_service, self.view.tile_service.fetcher):
+                if owner.trace is self:
+                    owner.trace = None
+            self.view = None
+        with self.lock:
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+
+
+def viewport_fields(view) -> dict:
+    return {"zoom": view.zoom_level, "x_tile_start": view.x_tile_start, "x_tile_end": view.x_tile_end,
+            "y_tile_start": view.y_tile_start, "y_tile_end": view.y_tile_end}
+
+def load_trace(file: str) -> List[dict]:
+    """
+    Reads the events of a trace file; malformed lines (e.g. of a session that crashed mid-write) are skipped.
+    """
+    events = []
+    with open(file, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line)
+                event["t"], event["type"]
+            except (ValueError, KeyError, TypeError):
+                print(f"Error: Skipping malformed trace line {number} of '{file}'.")
+                continue
+            events.append(event)
+    if not events or events[0]["type"] != "session":
+        raise Exception(f"Error: '{file}' is not a session trace (no session event).")
+    return events
+
+def trace_summary(events: List[dict]) -> dict:
+    """
+    Summarizes a trace: navigation events, frames, requests with their latency percentiles (ms), the
+    share of requested tiles answered from the cache, and tile fetches with their latency percentiles.
+    """
+    def percentiles(values: list) -> dict:
+        if not values:
+            return {"p50": None, "p95": None, "max": None}
+        values = np.asarray(values, dtype=np.float64)
+        return {"p50": round(float(np.percentile(values, 50)), 1), "p95": round(float(np.percentile(values, 95)), 1),
+                "max": round(float(values.max()), 1)}
+
+    by_type = {}
+    for event in events:
+        by_type.setdefault(event["type"], []).append(event)
+    requests = by_type.get("tile_request", [])
+    tiles = sum(event["tiles"] for event in requests)
+    fetches = by_type.get("fetch", [])
+    return {
+        "duration_s": round(max(event["t"] for event in events), 2),
+        "navigation": sum(len(by_type.get(name, [])) for name in ("click_zoom", "wheel", "inspect")),
+        "frames": len(by_type.get("frame", [])),
+        "requests": len(requests),
+        "request_ms": percentiles([event["ms"] for event in by_type.get("request_done", [])]),
+        "tiles_requested": tiles,
+        "cache_hit_rate": round(sum(event["cache_hits"] for event in requests) / tiles, 3) if tiles else 0.0,
+        "tiles_loaded": len(by_type.get("tile", [])),
+        "tile_ms": percentiles([event["ms"] for event in by_type.get("tile", [])]),
+        "fetches": len(fetches),
+        "fetch_failures": sum(1 for event in fetches if event["status"] not in (200, 304)),
+        "fetch_ms": percentiles([event["ms"] for event in fetches]),
+    }
@@ -0,0 +1,182 @@
+'''
+Deterministic replay of recorded viewing sessions, for load testing the tile scheduler and caches.
+
+A session recorded with `python -m app.main --trace FILE` (see app.SessionRecorder) is replayed on an
+offscreen MapView: its navigation events are applied at the recorded times, and tiles are served by a
+local tile stand-in answering every tile after the latency (and with the error status) recorded for it,
+or after the median recorded latency for tiles the session never fetched. The replay is recorded
+itself and summarized next to the original session, so scheduler and cache changes can be compared on
+real workloads: replay the same trace before and after a change and compare the summaries (--json).
+
+Tiles the session loaded from its tile store were never fetched and are served by the stand-in unless
+the replay is given a store (--store). The tile content is generated, so decoding costs are similar
+but not identical to real imagery.
+
+Usage:
+    python -m app.main --trace data/trace.ndjson
+    python -m app.SessionReplay data/trace.ndjson
+    python -m app.SessionReplay data/trace.ndjson --speed 4 --json data/replay-summary.json
+'''
+import os
+import json
+import argparse
+import numpy as np
+from PyQt5.QtCore import Qt, QPoint, QTimer, QEventLoop
+from typing import Dict, List, Tuple
+
+from app.MapView import MapView
+from app.RenderService import start_tile_stand_in
+from app.SessionRecorder import SessionRecorder, load_trace, trace_summary
+from app.TileFetcher import TileFetcher
+from app.TileService import TileService
+
+NAVIGATION_EVENTS = ("click_zoom", "wheel", "inspect")
+
+def tile_timing(events: List[dict]) -> Tuple[Dict[str, float], Dict[str, int], float]:
+    """
+    Returns the tile server timing of a trace: the latency (seconds) and error status of every fetched
+    tile (its last response), and the median latency of all fetches.
+    """
+    latencies, statuses = {}, {}
+    for event in events:
+        if event["type"] == "fetch":
+            latencies[event["key"]] = event["ms"] / 1e3
+            if event["status"] not in (200, 304):
+                statuses[event["key"]] = event["status"] or 503 # Connection errors replay as server errors
+            else:
+                statuses.pop(event["key"], None)
+    median = float(np.median(list(latencies.values()))) if latencies else 0.05
+    return latencies, statuses, median
+
+
+class SessionReplay:
+    """
+    Replays a recorded session on an offscreen MapView against a local tile stand-in (see module docstring).
+    Requires a QApplication.
+
+    Args:
+        events (list): trace events (see load_trace()).
+        speed (float): time compression of the navigation; 2 replays the events twice as fast.
+        latency (float, optional): fixed tile latency in seconds instead of the recorded latencies.
+        storage_path (str, optional): tile store of the replayed view; none by default.
+        settle (float): seconds to wait for outstanding tiles after the last event.
+        output (str, optional): trace file of the replay; kept in memory if omitted.
+    """
+    def __init__(self, events: List[dict], speed: float = 1.0, latency: float = None, storage_path: str = None,
+                 settle: float = 30.0, output: str = None):
+        if speed <= 0:
+            raise Exception(f"Error: Invalid replay speed {speed}.")
+        self.events: List[dict] = events
+        self.speed: float = speed
+        self.latency: float = latency
+        self.storage_path: str = storage_path
+        self.settle: float = settle
+        self.output: str = output
+        self.applied: int = 0
+
+    def create_view(self, service: TileService) -> MapView:
+        header = self.events[0]
+        view = MapView(header["width"], header["height"], header["img_res"], header["img_res"], storage_path=self.storage_path,
+                       update_interval=header["update_interval"], max_zoom_level=header["max_zoom_level"], tile_service=service)
+        # The recorded viewport; the initial fetch is deferred to the event loop, so it requests this one
+        view.zoom_level = header["zoom"]
+        view.x_tile_start, view.x_tile_end = header["x_tile_start"], header["x_tile_end"]
+        view.y_tile_start, view.y_tile_end = header["y_tile_start"], header["y_tile_end"]
+        view.set_active_state(True)
+        return view
+
+    def apply(self, view: MapView, event: dict) -> None:
+        """
+        Applies a recorded navigation event to the view.
+        """
+        position = QPoint(event["x"], event["y"])
+        if event["type"] == "click_zoom":
+            view.click_zoom(position, event["zoom_in"])
+        elif event["type"] == "wheel":
+            view.wheel_event_func(QPoint(0, event["dy"]), position)
+        elif event["type"] == "inspect":
+            view.inspect(position)
+        self.applied += 1
+
+    def run(self) -> dict:
+        """
+        Runs the replay to completion: all events applied and all tiles resolved (or `settle` elapsed).
+
+        Returns:
+            dict: summary of the replay (see trace_summary()).
+        """
+        latencies, statuses, median = tile_timing(self.events)
+        if self.latency is not None:
+            latencies, median = {}, self.latency
+        server, url_template = start_tile_stand_in(median, latencies=latencies, statuses=statuses)
+        service = TileService(self.storage_path, fetcher=TileFetcher(url_template=url_template))
+        view = self.create_view(service)
+        recorder = SessionRecorder(self.output)
+        recorder.attach(view)
+
+        navigation = [event for event in self.events if event["type"] in NAVIGATION_EVENTS]
+        for event in navigation:
+            QTimer.singleShot(int(event["t"] / self.speed * 1000), Qt.PreciseTimer, lambda event=event: self.apply(view, event))
+
+        loop = QEventLoop()
+        waited = [0]
+        def check_done():
+            idle = not service.requests and not service.in_flight and not view.wheel_settle_timer.isActive()
+            waited[0] += 50
+            if self.applied == len(navigation) and (idle or waited[0] > self.settle * 1000):
+                loop.quit()
+        poll = QTimer()
+        poll.timeout.connect(check_done)
+        end = int(navigation[-1]["t"] / self.speed * 1000) if navigation else 0
+        QTimer.singleShot(end, lambda: poll.start(50))
+        loop.exec_()
+
+        poll.stop()
+        recorder.close()
+        server.shutdown()
+        server.server_close()
+        return trace_summary(recorder.events if self.output is None else load_trace(self.output))
+
+
+def format_comparison(recorded: dict, replayed: dict) -> str:
+    """
+    Formats two trace summaries side by side.
+    """
+    def flatten(summary: dict) -> dict:
+        rows = {}
+        for name, value in summary.items():
+            if isinstance(value, dict):
+                rows.update({f"{name} {stat}": stat_value for stat, stat_value in value.items()})
+            else:
+                rows[name] = value
+        return rows
+
+    recorded, replayed = flatten(recorded), flatten(replayed)
+    lines = [f"{'':<24}{'recorded':>12}{'replayed':>12}"]
+    for name in recorded:
+        lines.append(f"{name:<24}{str(recorded[name]):>12}{str(replayed.get(name)):>12}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+
+    parser = argparse.ArgumentParser(description="Replays a recorded viewing session against a local tile stand-in.")
+    parser.add_argument('trace', type=str, help='Session trace (NDJSON) recorded with app.main --trace.')
+    parser.add_argument('--speed', type=float, default=1.0, help='Time compression of the navigation events.')
+    parser.add_argument('--latency', type=float, default=None, help='Fixed tile latency in seconds instead of the recorded ones.')
+    parser.add_argument('-s', '--store', type=str, default=None, help='Tile store or tile archive for the replayed view.')
+    parser.add_argument('--settle', type=float, default=30.0, help='Seconds to wait for outstanding tiles after the last event.')
+    parser.add_argument('-o', '--output', type=str, default=None, help='Write the trace of the replay to this file.')
+    parser.add_argument('--json', type=str, default=None, help='Write the summaries (recorded and replayed) as JSON.')
+    args = parser.parse_args()
+
+    app = QApplication([])
+    events = load_trace(args.trace)
+    recorded = trace_summary(events)
+    replayed = SessionReplay(events, args.speed, args.latency, args.store, args.settle, args.output).run()
+    print(format_comparison(recorded, replayed))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"trace": args.trace, "speed": args.speed, "recorded": recorded, "replayed": replayed}, f, indent=2)
@@ -0,0 +1,304 @@
+'''
+Cross-process shared-memory tile cache: one named shared memory segment that all app instances on a
+workstation attach to, so a tile fetched or read from disk by one instance is available to the others
+without another network round trip.
+
+The segment holds compressed tile bytes, like the warm tier of TileCache: decoded pixmaps are process
+local (and ~10 times larger), so each instance still decodes the tiles it shows. Layout:
+    header      64 bytes: magic, version, index slots, data size, write head, puts (u64 each).
+    index       open-addressing hash table (linear probing) of (tile id + 1 u64, position u64,
+                length u32) records; 0 marks an empty slot.
+    data        ring buffer of records: the same (tile id + 1, position, length) header followed by
+                the tile bytes. Positions are absolute (monotonically increasing); a record lives at
+                position % data size.
+
+Writers append at the head of the ring under a cross-process file lock, overwriting the oldest records:
+the segment size is the global memory cap and eviction is first-in first-out, approximating LRU because
+hits on records about to be overwritten copy them to the head again. Reads take no lock: a reader
+copies the record found through the index and accepts it only if its header matches the index entry and
+the head has not advanced over it in the meantime, so torn or overwritten records read as misses.
+
+The segment outlives the processes that use it (on Windows, until the last one closes it), so a new
+instance starts with the tiles of the earlier ones; `clear` removes it.
+
+Usage:
+    python -m app.main --shared-cache 256
+    python -m app.SharedTileCache info
+    python -m app.SharedTileCache clear
+'''
+import os
+import struct
+import tempfile
+import threading
+import numpy as np
+from multiprocessing import shared_memory
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+DEFAULT_NAME = "tilemap_tiles"
+SEGMENT_MAGIC = int.from_bytes(b"TSHM", "little")
+SEGMENT_VERSION = 1
+HEADER_BYTES = 64
+ENTRY = struct.Struct("<QQI4x") # (tile id + 1, position, length), 24 bytes; index slots and record headers
+ENTRY_DTYPE = np.dtype([("key", "<u8"), ("position", "<u8"), ("length", "<u4"), ("pad", "<u4")])
+HEAD = struct.Struct("<Q")
+HEAD_OFFSET = 32
+PUTS_OFFSET = 40
+MAX_PROBE = 8
+AVERAGE_TILE_BYTES = 16 * 1024 # Sizes the index for a load factor of about 0.5
+REFRESH_AGE = 0.75 # Hits on records older than this share of the ring move them to the head
+
+class SegmentLock:
+    """
+    Exclusive lock shared by unrelated processes (no common parent to hand a multiprocessing lock
+    to): a lock on a file next to the segment, combined with a thread lock for the threads of this process.
+    """
+    def __init__(self, path: str):
+        self.file = open(path, "a+b")
+        self.thread_lock: threading.Lock = threading.Lock()
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if os.name == "nt":
+            self.file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError: # LK_LOCK gives up after 10 seconds
+                    continue
+        else:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if os.name == "nt":
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        self.thread_lock.release()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class SharedTileCache:
+    """
+    Shared-memory cache of compressed tile bytes, attached to by every local app instance (see module
+    docstring). Creates the segment if no instance has yet, otherwise attaches to it with its size.
+    Thread-safe.
+
+    Args:
+        name (str): segment name; instances with the same name share their tiles.
+        size (int): size of the segment in bytes when it is created (the global memory cap).
+        create (bool): whether to create the segment if it does not exist.
+    """
+    def __init__(self, name: str = DEFAULT_NAME, size: int = 256 * (1024 ** 2), create: bool = True):
+        self.name: str = name
+        self.lock: SegmentLock = SegmentLock(os.path.join(tempfile.gettempdir(), f"{name}.lock"))
+        self.stats: dict = {"hits": 0, "misses": 0, "puts": 0, "refreshes": 0}
+        self.stats_lock: threading.Lock = threading.Lock() # Lookups run on the fetch workers and the GUI thread
+        with self.lock:
+            try:
+                if not create:
+                    raise FileExistsError
+                slots = max(64, 2 * size // AVERAGE_TILE_BYTES)
+                data_size = max(4096, size - HEADER_BYTES - slots * ENTRY.size)
+                self.shm: shared_memory.SharedMemory = shared_memory.SharedMemory(
+                    name, create=True, size=HEADER_BYTES + slots * ENTRY.size + data_size)
+                np.ndarray(5, np.uint64, buffer=self.shm.buf)[:4] = [SEGMENT_MAGIC, SEGMENT_VERSION, slots, data_size]
+            except FileExistsError:
+                try:
+                    self.shm = shared_memory.SharedMemory(name)
+                except FileNotFoundError:
+                    self.lock.close()
+                    raise Exception(f"Error: No shared tile cache '{name}' exists.")
+            if os.name != "nt":
+                # The resource tracker would unlink the segment when this process exits, under the other instances
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+            magic, version, slots, data_size = struct.unpack_from("<4Q", self.shm.buf, 0)
+        if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION:
+            self.shm.close()
+            raise Exception(f"Error: Shared memory segment '{name}' is not a version {SEGMENT_VERSION} tile cache.")
+        self.buf: memoryview = self.shm.buf
+        self.slots: int = slots
+        self.data_size: int = data_size
+        self.index_offset: int = HEADER_BYTES
+        self.data_offset: int = HEADER_BYTES + slots * ENTRY.size
+        self.max_tile_bytes: int = data_size // 4 - ENTRY.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _head(self) -> int:
+        return HEAD.unpack_from(self.buf, HEAD_OFFSET)[0]
+
+    def _probe(self, stored: int):
+        """
+        Yields the index slots of a tile id (stored as id + 1) in probe order.
+        """
+        base = ((stored * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) % self.slots
+        for i in range(MAX_PROBE):
+            yield (base + i) % self.slots
+
+    def _read(self, stored: int, position: int, length: int) -> bytes:
+        """
+        Copies a record, or returns None if it is not the record of the index entry or was overwritten.
+        """
+        if self._head() > position + self.data_size:
+            return None
+        offset = self.data_offset + position % self.data_size
+        if ENTRY.unpack_from(self.buf, offset) != (stored, position, length):
+            return None
+        data = bytes(self.buf[offset + ENTRY.size:offset + ENTRY.size + length])
+        if self._head() > position + self.data_size: # Overwritten while copying
+            return None
+        return data
+
+    ##### LOOKUPS #####
+    def get(self, key: int) -> bytes:
+        """
+        Returns the compressed bytes of a tile, or None on a miss.
+
+        Args:
+            key (int): tile id (see app.tile_id).
+        """
+        stored = key + 1
+        for slot in self._probe(stored):
+            entry_key, position, length = ENTRY.unpack_from(self.buf, self.index_offset + slot * ENTRY.size)
+            if entry_key == 0:
+                break
+            if entry_key != stored:
+                continue
+            data = self._read(stored, position, length)
+            if data is None:
+                break
+            refresh = self._head() - position > REFRESH_AGE * self.data_size
+            with self.stats_lock:
+                self.stats["hits"] += 1
+                self.stats["refreshes"] += int(refresh)
+            if refresh:
+                self.put(key, data, refresh=True)
+            return data
+        with self.stats_lock:
+            self.stats["misses"] += 1
+        return None
+
+    def __contains__(self, key: int) -> bool:
+        return self._find(key + 1) is not None
+
+    def _find(self, stored: int):
+        """
+        Returns the index slot of a live record of a tile id, or None.
+        """
+        head = self._head()
+        for slot in self._probe(stored):
+            entry_key, position, _ = ENTRY.unpack_from(self.buf, self.index_offset + slot * ENTRY.size)
+            if entry_key == 0:
+                return None
+            if entry_key == stored and head <= position + self.data_size:
+                return slot
+        return None
+
+    ##### WRITES #####
+    def put(self, key: int, data: bytes, refresh: bool = False) -> bool:
+        """
+        Stores the compressed bytes of a tile, overwriting the oldest records if the segment is full.
+        Tiles already cached are not written again unless `refresh` is set.
+
+        Returns:
+            bool: whether the tile was written.
+        """
+        stored = key + 1
+        if not data or len(data) > self.max_tile_bytes or (not refresh and self._find(stored) is not None):
+            return False
+        total = ENTRY.size + len(data)
+        with self.lock:
+            head = self._head()
+            target, oldest = None, None
+            for slot in self._probe(stored):
+                entry_key, position, _ = ENTRY.unpack_from(self.buf, self.index_offset + slot * ENTRY.size)
+                if entry_key == stored:
+                    if not refresh and head <= position + self.data_size:
+                        return False # Written by another process meanwhile
+                    target = slot
+                    break
+                if target is None and (entry_key == 0 or head > position + self.data_size):
+                    target = slot # Empty, or its record was overwritten
+                if oldest is None or position < oldest[1]:
+                    oldest = (slot, position)
+            if target is None:
+                target = oldest[0] # Probe window full: the oldest record loses its index entry
+
+            position = head
+            if position % self.data_size + total > self.data_size:
+                position += self.data_size - position % self.data_size # Records do not wrap around the ring
+            HEAD.pack_into(self.buf, HEAD_OFFSET, position + total) # Advanced first, so readers detect the overwrite
+            offset = self.data_offset + position % self.data_size
+            ENTRY.pack_into(self.buf, offset, stored, position, len(data))
+            self.buf[offset + ENTRY.size:offset + total] = data
+            ENTRY.pack_into(self.buf, self.index_offset + target * ENTRY.size, stored, position, len(data))
+            HEAD.pack_into(self.buf, PUTS_OFFSET, HEAD.unpack_from(self.buf, PUTS_OFFSET)[0] + 1)
+        with self.stats_lock:
+            self.stats["puts"] += 1
+        return True
+
+    ##### STATISTICS #####
+    def get_stats(self) -> dict:
+        """
+        Returns the lookups and writes of this process, and the live tiles, bytes used, capacity and
+        total writes of the segment (all processes).
+        """
+        index = np.frombuffer(self.buf, ENTRY_DTYPE, self.slots, self.index_offset)
+        head = self._head()
+        live = (index["key"] != 0) & (index["position"] + self.data_size >= head)
+        with self.stats_lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["entries"] = int(live.sum())
+        stats["bytes"] = int(index["length"][live].sum(dtype=np.uint64))
+        stats["capacity"] = self.data_size
+        stats["segment_puts"] = HEAD.unpack_from(self.buf, PUTS_OFFSET)[0]
+        del index, live # Release the buffer export, or the segment cannot be closed
+        return stats
+
+    def close(self) -> None:
+        """
+        Detaches from the segment; the tiles remain available to the other instances.
+        """
+        self.shm.close()
+        self.lock.close()
+
+    def unlink(self) -> None:
+        """
+        Removes the segment. Attached instances keep their mapping; new ones start empty.
+        """
+        if os.name != "nt":
+            from multiprocessing import resource_tracker
+            resource_tracker.register(self.shm._name, "shared_memory") # unlink() unregisters it again
+        self.shm.unlink()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Inspect or remove the tile cache shared by local app instances.")
+    parser.add_argument("command", choices=["info", "clear"], help="Print the cache statistics, or remove the cache.")
+    parser.add_argument("--name", type=str, default=DEFAULT_NAME, help="Segment name.")
+    args = parser.parse_args()
+
+    cache = SharedTileCache(args.name, create=False)
+    if args.command == "info":
+        print(cache.get_stats())
+    elif args.command == "clear":
+        cache.unlink()
+        print(f"Removed the shared tile cache '{args.name}'.")
+    cache.close()
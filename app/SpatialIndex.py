@@ -0,0 +1,228 @@
+import numpy as np
+from scipy.spatial import cKDTree
+from typing import List, Tuple
+
+from app.util import RADIUS_OF_EARTH, get_cartesian_coordinates_unit_array
+
+def nm_to_chord(distance_nm: float) -> float:
+    """
+    Converts a great-circle distance in nautical miles to the chord length on the unit sphere.
+    """
+    return 2.0 * np.sin(np.minimum(np.asarray(distance_nm, dtype=np.float64) / RADIUS_OF_EARTH, np.pi) / 2.0)
+
+def chord_to_nm(chord: float) -> float:
+    """
+    Converts a chord length on the unit sphere to the great-circle distance in nautical miles.
+    """
+    return 2.0 * RADIUS_OF_EARTH * np.arcsin(np.clip(np.asarray(chord, dtype=np.float64) / 2.0, 0.0, 1.0))
+
+class SpatialIndex:
+    """
+    Nearest-neighbour and radius queries over geographic points in nautical miles. Points are indexed as
+    unit-sphere Cartesian coordinates in a KD-tree: the chord length between two points is monotonic in
+    their great-circle distance, so tree queries are exact on the sphere (matching haversine_nm) and run
+    in logarithmic time, with no distortion near the poles or the antimeridian.
+
+    Args:
+        lat (np.ndarray): latitudes in degrees.
+        lon (np.ndarray): longitudes in degrees.
+        leafsize (int): KD-tree leaf size.
+    """
+    # Relative slack on query radii so points at exactly the radius are not lost to rounding
+    RADIUS_SLACK = 1e-12
+
+    def __init__(self, lat: np.ndarray, lon: np.ndarray, leafsize: int = 32):
+        self.points: np.ndarray = get_cartesian_coordinates_unit_array(lat, lon)
+        self.tree: cKDTree = cKDTree(self.points, leafsize=leafsize, balanced_tree=False, compact_nodes=False)
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def _query_points(self, lat, lon) -> np.ndarray:
+        return get_cartesian_coordinates_unit_array(np.atleast_1d(lat), np.atleast_1d(lon))
+
+    def nearest(self, lat: float, lon: float, k: int = 1, max_distance_nm: float = np.inf) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the k nearest points to a location.
+
+        Args:
+            lat (float): latitude in degrees.
+            lon (float): longitude in degrees.
+            k (int): number of neighbours.
+            max_distance_nm (float): ignore points farther than this distance.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (point indices, distances in nautical miles), nearest first.
+        """
+        if len(self) == 0:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        bound = np.inf if np.isinf(max_distance_nm) else float(nm_to_chord(max_distance_nm)) * (1 + self.RADIUS_SLACK)
+        chords, indices = self.tree.query(self._query_points(lat, lon), k=k, distance_upper_bound=bound)
+        chords, indices = np.ravel(chords), np.ravel(indices)
+        found = indices < len(self)
+        return indices[found], chord_to_nm(chords[found])
+
+    def within(self, lat: float, lon: float, radius_nm: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds all points within a great-circle distance of a location.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (point indices, distances in nautical miles), nearest first.
+        """
+        center = self._query_points(lat, lon)[0]
+        indices = np.asarray(self.tree.query_ball_point(center, float(nm_to_chord(radius_nm)) * (1 + self.RADIUS_SLACK)), dtype=np.intp)
+        distances = chord_to_nm(np.linalg.norm(self.points[indices] - center, axis=1))
+        order = np.argsort(distances, kind="stable")
+        return indices[order], distances[order]
+
+    def within_batch(self, lat: np.ndarray, lon: np.ndarray, radius_nm: float, workers: int = -1) -> List[np.ndarray]:
+        """
+        Batch form of within(): all points within a great-circle distance of each query location.
+
+        Returns:
+            list: one array of point indices (unordered) per query location.
+        """
+        chord = float(nm_to_chord(radius_nm)) * (1 + self.RADIUS_SLACK)
+        results = self.tree.query_ball_point(self._query_points(lat, lon), chord, workers=workers)
+        return [np.asarray(result, dtype=np.intp) for result in results]
+
+    def count_within(self, lat: np.ndarray, lon: np.ndarray, radius_nm: float, workers: int = -1) -> np.ndarray:
+        """
+        Counts the points within a great-circle distance of each query location.
+        """
+        chord = float(nm_to_chord(radius_nm)) * (1 + self.RADIUS_SLACK)
+        return np.asarray(self.tree.query_ball_point(self._query_points(lat, lon), chord, workers=workers, return_length=True))
+
+
+class DynamicSpatialIndex:
+    """
+    Spatial index over slots (stable integer handles) with incremental inserts, moves and removals.
+    The KD-tree over unit-sphere points is static, so changes are recorded instead: changed slots are
+    kept in a pending set that queries search exhaustively, and their outdated tree entries are
+    filtered out. The tree is rebuilt lazily, on a query, once the pending and stale entries exceed a
+    fraction of its size, so a stream of updates never pays for a rebuild per update.
+
+    Args:
+        rebuild_fraction (float): pending and stale entries, relative to the tree size, that trigger a rebuild.
+        min_pending (int): pending and stale entries always tolerated without a rebuild.
+    """
+    def __init__(self, rebuild_fraction: float = 0.1, min_pending: int = 4096):
+        self.rebuild_fraction: float = rebuild_fraction
+        self.min_pending: int = min_pending
+        self.points: np.ndarray = np.zeros((0, 3))
+        self.alive: np.ndarray = np.zeros(0, dtype=bool)
+        self.in_tree: np.ndarray = np.zeros(0, dtype=bool)
+        self.tree: cKDTree = None
+        self.tree_slots: np.ndarray = np.empty(0, dtype=np.intp)
+        self.pending: set = set()
+        self.stale: int = 0
+        self.rebuilds: int = 0
+
+    def __len__(self) -> int:
+        return int(self.alive.sum())
+
+    def _grow(self, capacity: int) -> None:
+        if capacity <= len(self.alive):
+            return
+        capacity = max(capacity, 2 * len(self.alive))
+        extra = capacity - len(self.alive)
+        self.points = np.vstack([self.points, np.zeros((extra, 3))])
+        self.alive = np.concatenate([self.alive, np.zeros(extra, dtype=bool)])
+        self.in_tree = np.concatenate([self.in_tree, np.zeros(extra, dtype=bool)])
+
+    def set(self, slots: np.ndarray, lat: np.ndarray, lon: np.ndarray) -> None:
+        """
+        Inserts or moves points.
+
+        Args:
+            slots (np.ndarray): slot of each point.
+            lat (np.ndarray): latitudes in degrees.
+            lon (np.ndarray): longitudes in degrees.
+        """
+        slots = np.asarray(slots, dtype=np.intp)
+        if len(slots) == 0:
+            return
+        self._grow(int(slots.max()) + 1)
+        self.points[slots] = get_cartesian_coordinates_unit_array(lat, lon)
+        self.alive[slots] = True
+        self.stale += int(self.in_tree[slots].sum())
+        self.in_tree[slots] = False
+        if len(slots) > self.min_pending:
+            self.tree = None # Bulk load: rebuild on the next query instead of tracking every slot
+        else:
+            self.pending.update(slots.tolist())
+
+    def remove(self, slots: np.ndarray) -> None:
+        slots = np.asarray(slots, dtype=np.intp)
+        slots = slots[slots < len(self.alive)]
+        self.stale += int(self.in_tree[slots].sum())
+        self.alive[slots] = False
+        self.in_tree[slots] = False
+        self.pending.difference_update(slots.tolist())
+
+    def rebuild(self) -> None:
+        self.tree_slots = np.flatnonzero(self.alive)
+        self.tree = cKDTree(self.points[self.tree_slots], leafsize=32, balanced_tree=False, compact_nodes=False)
+        self.in_tree[:] = False
+        self.in_tree[self.tree_slots] = True
+        self.pending.clear()
+        self.stale = 0
+        self.rebuilds += 1
+
+    def _maybe_rebuild(self) -> None:
+        if self.tree is None or len(self.pending) + self.stale > max(self.min_pending, self.rebuild_fraction * len(self.tree_slots)):
+            self.rebuild()
+
+    def within(self, lat: float, lon: float, radius_nm: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds all points within a great-circle distance of a location.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (slots, distances in nautical miles), nearest first.
+        """
+        center = get_cartesian_coordinates_unit_array(np.atleast_1d(lat), np.atleast_1d(lon))[0]
+        slots = self.within_unordered(lat, lon, radius_nm)
+        distances = chord_to_nm(np.linalg.norm(self.points[slots] - center, axis=1))
+        order = np.argsort(distances, kind="stable")
+        return slots[order], distances[order]
+
+    def within_unordered(self, lat: float, lon: float, radius_nm: float) -> np.ndarray:
+        """
+        Finds the slots of all points within a great-circle distance of a location, in no particular
+        order and without their distances (e.g. to prefilter candidates).
+        """
+        self._maybe_rebuild()
+        center = get_cartesian_coordinates_unit_array(np.atleast_1d(lat), np.atleast_1d(lon))[0]
+        chord = float(nm_to_chord(radius_nm)) * (1 + SpatialIndex.RADIUS_SLACK)
+        slots = self.tree_slots[np.asarray(self.tree.query_ball_point(center, chord, return_sorted=False), dtype=np.intp)]
+        slots = slots[self.in_tree[slots]]
+        if self.pending:
+            pending = np.fromiter(self.pending, dtype=np.intp, count=len(self.pending))
+            slots = np.concatenate([slots, pending[np.linalg.norm(self.points[pending] - center, axis=1) <= chord]])
+        return slots
+
+    def nearest(self, lat: float, lon: float, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the k nearest points to a location.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (slots, distances in nautical miles), nearest first.
+        """
+        self._maybe_rebuild()
+        center = get_cartesian_coordinates_unit_array(np.atleast_1d(lat), np.atleast_1d(lon))[0]
+        slots = np.empty(0, dtype=np.intp)
+        query_k = k
+        while len(self.tree_slots):
+            # Outdated tree entries are dropped, so widen the query until k current entries are found
+            chords, indices = self.tree.query(center, k=min(query_k, len(self.tree_slots)))
+            indices = np.atleast_1d(indices)
+            slots = self.tree_slots[indices[indices < len(self.tree_slots)]]
+            slots = slots[self.in_tree[slots]]
+            if len(slots) >= k or query_k >= len(self.tree_slots):
+                break
+            query_k *= 2
+        if self.pending:
+            slots = np.concatenate([slots, np.fromiter(self.pending, dtype=np.intp, count=len(self.pending))])
+        chords = np.linalg.norm(self.points[slots] - center, axis=1)
+        order = np.argsort(chords, kind="stable")[:k]
+        return slots[order], chord_to_nm(chords[order])
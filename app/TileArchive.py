@@ -0,0 +1,426 @@
+'''
+Packed tile archive: an alternative to the one-file-per-tile TileStore layout for deep pyramids.
+
+An archive is a directory of three files:
+    tiles.pack      append-only data file holding the compressed tile bytes back to back.
+    tiles.idx       index sorted by tile id: a 16 byte header (magic, version, count) followed by
+                    (tile id u64, offset u64, length u32) records, searched by bisection.
+    tiles.journal   (tile id, offset, length) records of tiles appended since the index was last
+                    written; merged into the index by flush(). Later records supersede earlier ones.
+
+Readers map the data file with mmap, so tile bytes are sliced without copying (see view()), and load
+the index with a single read, so opening an archive of millions of tiles costs no directory scan and
+lookups are a bisection of an in-memory array. Tile ids sort by zoom, row and column (see app.tile_id),
+so the tiles of one row of a region are adjacent in the index, and in the data file too once the
+archive is written in id order (merge(), compact()): regions are copied with one sequential read per row.
+
+Usage:
+    python -m app.TileArchive pack resources/images resources/archive
+    python -m app.TileArchive info resources/archive
+'''
+import os
+import mmap
+import threading
+import numpy as np
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+from app.TileStore import TileStore
+from app.tile_id import tile_id, ZOOM_SHIFT
+
+INDEX_MAGIC = b"TIDX"
+INDEX_VERSION = 1
+INDEX_HEADER_BYTES = 16
+RECORD_DTYPE = np.dtype([("key", "<u8"), ("offset", "<u8"), ("length", "<u4")]) # Packed, 20 bytes
+
+class TileArchive:
+    """
+    Packed tile archive with the interface of TileStore (contains, read, write, iter_keys).
+
+    Writes append to the data file and the journal under a lock, so one process may write while its
+    threads read. Several processes must not write to the same archive: the batch downloader gives
+    each shard its own archive and merges them afterwards.
+
+    Args:
+        root (str): archive directory.
+        writable (bool): whether the archive is opened for writing (created if missing).
+    """
+    PACK_FILE = "tiles.pack"
+    INDEX_FILE = "tiles.idx"
+    JOURNAL_FILE = "tiles.journal"
+
+    def __init__(self, root: str, writable: bool = True):
+        self.root: Path = Path(root)
+        self.writable: bool = writable
+        self.lock: threading.Lock = threading.Lock()
+        self.index: np.ndarray = np.zeros(0, dtype=RECORD_DTYPE)
+        self.keys: np.ndarray = np.zeros(0, dtype=np.uint64) # Contiguous copy of the index keys for bisection
+        self.journal: Dict[int, Tuple[int, int]] = {}
+        self.pack_size: int = 0
+        self.pack_map: mmap.mmap = None
+        self.pack_file = None
+        self.journal_file = None
+        if writable:
+            self.root.mkdir(parents=True, exist_ok=True)
+            self.pack_file = open(self.root / self.PACK_FILE, "ab")
+            self.journal_file = open(self.root / self.JOURNAL_FILE, "ab")
+        self.refresh()
+
+    @staticmethod
+    def is_archive(root: str) -> bool:
+        return (Path(root) / TileArchive.PACK_FILE).is_file()
+
+    def refresh(self) -> None:
+        """
+        (Re)loads the index and the journal, e.g. to see tiles written by another process since opening.
+        """
+        with self.lock:
+            index_path = self.root / self.INDEX_FILE
+            if index_path.is_file() and index_path.stat().st_size > INDEX_HEADER_BYTES:
+                with open(index_path, "rb") as f:
+                    header = f.read(INDEX_HEADER_BYTES)
+                if header[:4] != INDEX_MAGIC:
+                    raise Exception(f"Error: '{index_path}' is not a tile archive index.")
+                count = int.from_bytes(header[8:16], "little")
+                # Read rather than mapped, so flush() can replace the file on every platform
+                self.index = np.fromfile(index_path, dtype=RECORD_DTYPE, count=count, offset=INDEX_HEADER_BYTES)
+            else:
+                self.index = np.zeros(0, dtype=RECORD_DTYPE)
+            self.keys = np.ascontiguousarray(self.index["key"])
+
+            self.journal = {}
+            journal_path = self.root / self.JOURNAL_FILE
+            if journal_path.is_file():
+                records = np.fromfile(journal_path, dtype=RECORD_DTYPE)
+                # Records of a write interrupted after the data but before the journal are simply absent
+                for key, offset, length in zip(records["key"].tolist(), records["offset"].tolist(), records["length"].tolist()):
+                    self.journal[key] = (offset, length)
+            pack_path = self.root / self.PACK_FILE
+            self.pack_size = pack_path.stat().st_size if pack_path.is_file() else 0
+            self.pack_map = None
+
+    def __len__(self) -> int:
+        return len(self.index) + sum(1 for key in self.journal if self._find_indexed(key) is None)
+
+    ##### LOOKUP #####
+    def _find_indexed(self, key: int) -> Tuple[int, int]:
+        # Searched as uint64: a Python int would promote the keys to float64 and lose precision
+        i = int(np.searchsorted(self.keys, np.uint64(key)))
+        if i < len(self.keys) and int(self.keys[i]) == key:
+            record = self.index[i]
+            return int(record["offset"]), int(record["length"])
+        return None
+
+    def locate(self, key: int) -> Tuple[int, int]:
+        """
+        Returns the (offset, length) of a tile in the data file, or None if the tile is not archived.
+        """
+        location = self.journal.get(key)
+        if location is None:
+            location = self._find_indexed(key)
+        return location
+
+    def _pack(self, end: int) -> mmap.mmap:
+        """
+        Returns the mapping of the data file, remapped if it does not extend to `end` yet. A replaced
+        mapping is left to the garbage collector, since views into it may still be alive.
+        """
+        if self.pack_map is None or len(self.pack_map) < end:
+            if self.pack_file is not None:
+                self.pack_file.flush()
+            with open(self.root / self.PACK_FILE, "rb") as f:
+                self.pack_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.pack_map
+
+    def view(self, key: int) -> memoryview:
+        """
+        Returns a zero-copy view of the stored bytes of a tile, or None if the tile is not archived.
+        """
+        location = self.locate(key)
+        if location is None:
+            return None
+        offset, length = location
+        return memoryview(self._pack(offset + length))[offset:offset + length]
+
+    ##### TILESTORE INTERFACE #####
+    def contains(self, key: int) -> bool:
+        return self.locate(key) is not None
+
+    def read(self, key: int) -> bytes:
+        """
+        Returns the stored bytes of a tile, or None if the tile is not archived.
+        """
+        data = self.view(key)
+        return bytes(data) if data is not None else None
+
+    def modified_time(self, key: int) -> float:
+        """
+        Returns None: archives keep no write times per tile (see TileMetadata for downloaded tiles).
+        """
+        return None
+
+    def write(self, key: int, data: bytes) -> int:
+        """
+        Appends the bytes of a tile. A tile written again supersedes the earlier copy (see compact()).
+
+        Returns:
+            int: number of bytes written.
+        """
+        if not self.writable:
+            raise Exception(f"Error: Tile archive '{self.root}' is opened read-only.")
+        with self.lock:
+            offset = self.pack_size
+            self.pack_file.write(data)
+            self.pack_size += len(data)
+            record = np.array([(key, offset, len(data))], dtype=RECORD_DTYPE)
+            # The data precedes its journal record, so an interrupted write never indexes partial data
+            self.pack_file.flush()
+            self.journal_file.write(record.tobytes())
+            self.journal_file.flush()
+            self.journal[key] = (offset, len(data))
+        return len(data)
+
+    def iter_keys(self, zoom: int) -> Iterator[int]:
+        """
+        Yields the tile ids of all archived tiles at a zoom level, in id order.
+        """
+        keys = self.keys
+        start = int(np.searchsorted(keys, np.uint64(zoom << ZOOM_SHIFT)))
+        end = int(np.searchsorted(keys, np.uint64((zoom + 1) << ZOOM_SHIFT)))
+        indexed = keys[start:end].tolist()
+        journaled = sorted(key for key in self.journal if key >> ZOOM_SHIFT == zoom and self._find_indexed(key) is None)
+        if not journaled:
+            yield from indexed
+        else:
+            yield from sorted(indexed + journaled)
+
+    ##### INDEX MAINTENANCE #####
+    def records(self) -> np.ndarray:
+        """
+        Returns the index records of all archived tiles, journal included, sorted by tile id.
+        """
+        if not self.journal:
+            return self.index
+        journal = np.array([(key, offset, length) for key, (offset, length) in self.journal.items()], dtype=RECORD_DTYPE)
+        records = np.concatenate([journal, self.index])
+        # Stable sort with the journal first: np.unique keeps the first (journal) record per id
+        records = records[np.argsort(records["key"], kind="stable")]
+        _, first = np.unique(records["key"], return_index=True)
+        return records[first]
+
+    def flush(self) -> None:
+        """
+        Merges the journal into the sorted index (written atomically) and empties the journal.
+        """
+        if not self.writable:
+            return
+        with self.lock:
+            if not self.journal:
+                return
+            self.pack_file.flush()
+            records = self.records()
+            self._write_index(records)
+            self.journal_file.truncate(0)
+            self.journal_file.seek(0)
+            self.journal = {}
+            self.index = records
+            self.keys = np.ascontiguousarray(records["key"])
+
+    def _write_index(self, records: np.ndarray) -> None:
+        index_path = self.root / self.INDEX_FILE
+        temp_path = index_path.with_name(f"{index_path.name}.{os.getpid()}.part")
+        with open(temp_path, "wb") as f:
+            f.write(INDEX_MAGIC + INDEX_VERSION.to_bytes(4, "little") + len(records).to_bytes(8, "little"))
+            f.write(np.ascontiguousarray(records, dtype=RECORD_DTYPE).tobytes())
+        os.replace(temp_path, index_path)
+
+    def close(self) -> None:
+        self.flush()
+        for f in (self.pack_file, self.journal_file):
+            if f is not None:
+                f.close()
+        self.pack_file = self.journal_file = None
+        self.pack_map = None
+
+    def __enter__(self) -> "TileArchive":
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        self.close()
+        return False
+
+    ##### BULK OPERATIONS #####
+    def append_block(self, records: np.ndarray, block) -> int:
+        """
+        Appends several tiles stored back to back in one buffer, with a single write.
+
+        Args:
+            records (np.ndarray): RECORD_DTYPE records of the tiles; offsets relative to the block start.
+            block (bytes | memoryview): the tile bytes.
+
+        Returns:
+            int: number of bytes written.
+        """
+        if not self.writable:
+            raise Exception(f"Error: Tile archive '{self.root}' is opened read-only.")
+        with self.lock:
+            base = self.pack_size
+            self.pack_file.write(block)
+            self.pack_size += len(block)
+            records = np.array(records, dtype=RECORD_DTYPE)
+            records["offset"] += base
+            self.pack_file.flush()
+            self.journal_file.write(records.tobytes())
+            self.journal_file.flush()
+            for key, offset, length in zip(records["key"].tolist(), records["offset"].tolist(), records["length"].tolist()):
+                self.journal[key] = (offset, length)
+        return len(block)
+
+    def _copy_records(self, dest: "TileArchive", records: np.ndarray) -> int:
+        """
+        Copies tiles to another archive, one write per run of tiles adjacent in the data file.
+        """
+        if len(records) == 0:
+            return 0
+        offsets = records["offset"].astype(np.int64)
+        ends = offsets + records["length"]
+        runs = np.flatnonzero(offsets[1:] != ends[:-1]) + 1
+        pack = self._pack(int(ends.max()))
+        written = 0
+        for run in np.split(np.arange(len(records)), runs):
+            start, end = int(offsets[run[0]]), int(ends[run[-1]])
+            block_records = records[run].copy()
+            block_records["offset"] -= start
+            written += dest.append_block(block_records, memoryview(pack)[start:end])
+        return written
+
+    def copy_region(self, dest: "TileArchive", zoom: int, x_start: int, y_start: int, x_end: int, y_end: int) -> int:
+        """
+        Copies the archived tiles of a tile range at a zoom level into another archive.
+
+        Returns:
+            int: number of tiles copied.
+        """
+        records = self.records()
+        keys = np.ascontiguousarray(records["key"])
+        copied = 0
+        for y in range(y_start, y_end + 1):
+            # One row of the region is one contiguous slice of the sorted index
+            start = int(np.searchsorted(keys, np.uint64(tile_id(zoom, x_start, y))))
+            end = int(np.searchsorted(keys, np.uint64(tile_id(zoom, x_end, y)), side="right"))
+            self._copy_records(dest, records[start:end])
+            copied += end - start
+        return copied
+
+    def merge(self, sources: List["TileArchive"]) -> int:
+        """
+        Appends the tiles of other archives in tile id order (later sources supersede earlier ones),
+        then writes the index.
+
+        Returns:
+            int: number of tiles merged.
+        """
+        entries = []
+        for i, source in enumerate(sources):
+            records = source.records()
+            entries.append((np.full(len(records), i, dtype=np.int64), records))
+        if not entries:
+            return 0
+        owners = np.concatenate([owner for owner, _ in entries])
+        records = np.concatenate([records for _, records in entries])
+        order = np.lexsort((-owners, records["key"])) # By id, the latest source first
+        owners, records = owners[order], records[order]
+        _, first = np.unique(records["key"], return_index=True)
+        owners, records = owners[first], records[first]
+
+        # Consecutive tiles of the same source are copied as runs
+        changes = np.flatnonzero(owners[1:] != owners[:-1]) + 1
+        for part in np.split(np.arange(len(records)), changes):
+            if len(part):
+                sources[owners[part[0]]]._copy_records(self, records[part])
+        self.flush()
+        return len(records)
+
+    def compact(self) -> int:
+        """
+        Rewrites the archive in tile id order, dropping superseded tile copies.
+
+        Returns:
+            int: number of bytes reclaimed.
+        """
+        self.flush()
+        before = self.pack_size
+        temp_root = self.root.with_name(f"{self.root.name}.compact")
+        with TileArchive(temp_root) as compacted:
+            compacted.merge([self])
+        self.close()
+        for name in (self.PACK_FILE, self.INDEX_FILE):
+            os.replace(temp_root / name, self.root / name)
+        for path in temp_root.iterdir():
+            path.unlink()
+        temp_root.rmdir()
+        self.__init__(self.root, self.writable)
+        return before - self.pack_size
+
+    def stats(self) -> dict:
+        records = self.records()
+        live_bytes = int(records["length"].sum()) if len(records) else 0
+        return {
+            "tiles": len(records),
+            "zooms": sorted(set((records["key"] >> ZOOM_SHIFT).tolist())),
+            "pack_bytes": self.pack_size,
+            "live_bytes": live_bytes,
+            "journal": len(self.journal),
+        }
+
+def open_tile_store(root: str, writable: bool = True):
+    """
+    Opens a tile store directory: a packed TileArchive if the directory holds one, otherwise the
+    one-file-per-tile TileStore.
+    """
+    if TileArchive.is_archive(root):
+        return TileArchive(root, writable)
+    return TileStore(root)
+
+def pack_store(store_root: str, archive_root: str, verbose: bool = False) -> int:
+    """
+    Packs the tiles of a TileStore directory into an archive, in tile id order.
+
+    Returns:
+        int: number of tiles packed.
+    """
+    store = TileStore(store_root)
+    count = 0
+    with TileArchive(archive_root) as archive:
+        zooms = sorted(int(entry.name) for entry in os.scandir(store_root) if entry.is_dir() and entry.name.isdigit())
+        for zoom in zooms:
+            for key in sorted(store.iter_keys(zoom)):
+                archive.write(key, store.read(key))
+                count += 1
+            if verbose:
+                print(f"Zoom {zoom}: {count} tiles packed")
+    return count
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Pack tile store directories into packed tile archives and inspect archives.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    pack_parser = subparsers.add_parser("pack", help="Pack a tile store directory into an archive.")
+    pack_parser.add_argument("store_path", type=str, help="Tile store directory (<z>/<y>-<x>.JPG).")
+    pack_parser.add_argument("archive_path", type=str, help="Archive directory to create.")
+    info_parser = subparsers.add_parser("info", help="Print archive statistics.")
+    info_parser.add_argument("archive_path", type=str, help="Archive directory.")
+    compact_parser = subparsers.add_parser("compact", help="Rewrite an archive in tile id order.")
+    compact_parser.add_argument("archive_path", type=str, help="Archive directory.")
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        if not os.path.exists(args.store_path):
+            raise Exception(f"""The directory "{args.store_path}" was not found.""")
+        print(f"Packed {pack_store(args.store_path, args.archive_path, verbose=True)} tiles.")
+    elif args.command == "info":
+        print(TileArchive(args.archive_path, writable=False).stats())
+    elif args.command == "compact":
+        with TileArchive(args.archive_path) as archive:
+            print(f"Reclaimed {archive.compact()} bytes.")
@@ -0,0 +1,161 @@
+import threading
+from collections import OrderedDict
+from PyQt5.QtGui import QPixmap
+
+from app.profiling import span
+from app.SharedTileCache import SharedTileCache
+
+class TileCache:
+    """
+    Two-tier in-memory tile cache.
+
+    The hot tier holds decoded pixmaps (~256 Kb each) for the visible viewport and its immediate
+    surroundings. The warm tier holds the original compressed tile bytes (~15-30 Kb each), so tiles
+    evicted from the hot tier can be decoded again in a worker thread without a network round trip.
+    Splitting one memory budget this way caches roughly ten times the area of a pixmap-only cache.
+
+    The warm tier is read from worker threads and is guarded by a lock; the hot tier is GUI-thread only.
+    Optionally, a shared tier (see app.SharedTileCache) below the warm tier holds compressed bytes for
+    all app instances on the machine: warm misses are looked up there, and stored bytes are written through.
+
+    Args:
+        memory_limit (int): total memory budget in bytes shared by both tiers.
+        hot_limit (int): maximum number of decoded pixmaps in the hot tier.
+        tile_bytes (int): estimated size of a decoded tile in bytes.
+    """
+    def __init__(self, memory_limit: int = 100 * (1024 ** 2), hot_limit: int = 128, tile_bytes: int = 256 * 256 * 4):
+        self.hot: OrderedDict = OrderedDict()
+        self.warm: OrderedDict = OrderedDict()
+        self.memory_limit: int = memory_limit
+        self.tile_bytes: int = tile_bytes
+        self.hot_limit: int = 1
+        self.warm_limit_bytes: int = 0
+        self.warm_bytes: int = 0
+        self.lock: threading.Lock = threading.Lock()
+        self.shared: SharedTileCache = None
+        self.stats: dict = {
+            "hot": {"hits": 0, "misses": 0, "evictions": 0},
+            "warm": {"hits": 0, "misses": 0, "evictions": 0},
+        }
+        self.set_hot_limit(hot_limit)
+
+    def set_hot_limit(self, hot_limit: int) -> None:
+        """
+        Re-splits the memory budget between the tiers for a new maximum number of decoded pixmaps,
+        evicting the least recently used entries of a tier that shrinks.
+        """
+        self.hot_limit = max(1, min(hot_limit, int(self.memory_limit / self.tile_bytes)))
+        with self.lock:
+            self.warm_limit_bytes = max(0, self.memory_limit - self.hot_limit * self.tile_bytes)
+            self._evict_warm()
+        while len(self.hot) > self.hot_limit:
+            self.hot.popitem(last=False)
+            self.stats["hot"]["evictions"] += 1
+
+    def attach_shared(self, shared: SharedTileCache) -> None:
+        """
+        Adds the shared tier below the warm tier (None detaches it).
+        """
+        self.shared = shared
+
+    ##### HOT TIER (DECODED PIXMAPS) #####
+    def get_pixmap(self, key) -> QPixmap:
+        """
+        Returns the decoded pixmap for a key and marks it as recently used, or None on a miss.
+        """
+        with span("cache_lookup"):
+            pixmap = self.hot.get(key)
+            if pixmap is None:
+                self.stats["hot"]["misses"] += 1
+                return None
+            self.hot.move_to_end(key)
+            self.stats["hot"]["hits"] += 1
+            return pixmap
+
+    def put_pixmap(self, key, pixmap: QPixmap) -> None:
+        self.hot[key] = pixmap
+        self.hot.move_to_end(key)
+        while len(self.hot) > self.hot_limit:
+            self.hot.popitem(last=False)
+            self.stats["hot"]["evictions"] += 1
+
+    def keys(self) -> list:
+        """
+        Returns the keys of the hot tier, i.e. the tiles which need neither fetching nor decoding.
+        """
+        return list(self.hot.keys())
+
+    def __contains__(self, key) -> bool:
+        return key in self.hot
+
+    def __len__(self) -> int:
+        return len(self.hot)
+
+    ##### WARM TIER (COMPRESSED BYTES) #####
+    def get_bytes(self, key) -> bytes:
+        """
+        Returns the compressed bytes for a key and marks them as recently used, or None on a miss.
+        Warm misses fall back to the shared tier. Safe to call from worker threads.
+        """
+        with self.lock:
+            data = self.warm.get(key)
+            if data is not None:
+                self.warm.move_to_end(key)
+                self.stats["warm"]["hits"] += 1
+                return data
+            self.stats["warm"]["misses"] += 1
+        return self.shared.get(key) if self.shared is not None else None
+
+    def put_bytes(self, key, data: bytes) -> None:
+        if not data:
+            return
+        with self.lock:
+            previous = self.warm.pop(key, None)
+            if previous is not None:
+                self.warm_bytes -= len(previous)
+            self.warm[key] = data
+            self.warm_bytes += len(data)
+            self._evict_warm()
+        if self.shared is not None:
+            self.shared.put(key, data)
+
+    def replace(self, key, data: bytes) -> None:
+        """
+        Replaces a tile that changed on the tile server: drops its decoded pixmap and stores the new bytes
+        in the warm and shared tiers. GUI thread only.
+        """
+        self.hot.pop(key, None)
+        with self.lock:
+            previous = self.warm.pop(key, None)
+            if previous is not None:
+                self.warm_bytes -= len(previous)
+            if data:
+                self.warm[key] = data
+                self.warm_bytes += len(data)
+                self._evict_warm()
+        if data and self.shared is not None:
+            self.shared.put(key, data, refresh=True)
+
+    def _evict_warm(self) -> None:
+        while self.warm_bytes > self.warm_limit_bytes and self.warm:
+            _, evicted = self.warm.popitem(last=False)
+            self.warm_bytes -= len(evicted)
+            self.stats["warm"]["evictions"] += 1
+
+    ##### STATISTICS #####
+    def get_stats(self) -> dict:
+        """
+        Returns hit/miss/eviction counts, entry counts and the estimated memory use of each tier, and
+        the statistics of the shared tier if attached.
+        """
+        with self.lock:
+            stats = {tier: dict(values) for tier, values in self.stats.items()}
+            stats["warm"]["entries"] = len(self.warm)
+            stats["warm"]["bytes"] = self.warm_bytes
+        stats["hot"]["entries"] = len(self.hot)
+        for tier in stats.values():
+            lookups = tier["hits"] + tier["misses"]
+            tier["hit_rate"] = tier["hits"] / lookups if lookups else 0.0
+        if self.shared is not None:
+            stats["shared"] = self.shared.get_stats()
+        return stats
@@ -0,0 +1,271 @@
+'''
+Headless export of a geographic region at a given zoom level as one large stitched image.
+
+Tiles are read from the on-disk tile store (falling back to the tile server, with downloaded tiles
+written back to the store) and stitched one row band (one tile row, 256 px) at a time, so memory use is
+bounded by a single band regardless of the export size. Bands are streamed into a memory-mapped NumPy
+array (.npy) and/or a streaming PNG writer (.png). Marker overlays can optionally be burned in.
+
+Usage:
+    python -m app.TileExport --bbox 24 -125 50 -66 -z 9 -o export.png --store resources/images
+'''
+import sys
+import zlib
+import time
+import struct
+import argparse
+import threading
+import numpy as np
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from app.util import degree_to_tile, degree_to_tile_array
+from app.TileFetcher import TileFetcher
+from app.TileStore import TileStore
+from app.TileArchive import open_tile_store
+from app.tile_id import tile_id, tile_key
+
+TILE_SIZE = 256
+
+def png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF)
+
+def encode_png(pixels: np.ndarray, level: int = 6) -> bytes:
+    """
+    Encodes an 8-bit RGB image (uint8 array of shape [height, width, 3]) as PNG in memory. zlib releases
+    the GIL while compressing, so images are encoded in parallel on worker threads.
+    """
+    height, width = pixels.shape[:2]
+    filtered = np.zeros((height, width * 3 + 1), dtype=np.uint8) # Filter type 0 (None) per row
+    filtered[:, 1:] = pixels.reshape(height, -1)
+    return b"".join([b"\x89PNG\r\n\x1a\n", png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)),
+                     png_chunk(b"IDAT", zlib.compress(filtered.tobytes(), level)), png_chunk(b"IEND", b"")])
+
+class PngStreamWriter:
+    """
+    Minimal streaming PNG (8-bit RGB) writer. Rows are deflated incrementally and flushed as IDAT
+    chunks, so arbitrarily large images are written with bounded memory.
+
+    Args:
+        file (str): output file path.
+        width (int): image width in pixels.
+        height (int): image height in pixels.
+        level (int): zlib compression level.
+    """
+    def __init__(self, file: str, width: int, height: int, level: int = 6):
+        self.width: int = width
+        self.height: int = height
+        self.rows_written: int = 0
+        self.compressor = zlib.compressobj(level)
+        self.file = open(file, "wb")
+        self.file.write(b"\x89PNG\r\n\x1a\n")
+        self._write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def _write_chunk(self, chunk_type: bytes, data: bytes) -> None:
+        self.file.write(png_chunk(chunk_type, data))
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        """
+        Appends rows of pixels (uint8 array of shape [rows, width, 3]).
+        """
+        filtered = np.zeros((rows.shape[0], self.width * 3 + 1), dtype=np.uint8) # Filter type 0 (None) per row
+        filtered[:, 1:] = rows.reshape(rows.shape[0], -1)
+        data = self.compressor.compress(filtered.tobytes())
+        if data:
+            self._write_chunk(b"IDAT", data)
+        self.rows_written += rows.shape[0]
+
+    def close(self) -> None:
+        if self.rows_written != self.height:
+            raise Exception(f"PNG stream incomplete: wrote {self.rows_written} of {self.height} rows.")
+        self._write_chunk(b"IDAT", self.compressor.flush())
+        self._write_chunk(b"IEND", b"")
+        self.file.close()
+
+
+class TileExporter:
+    """
+    Stitches the tiles covering a bounding box at a zoom level into one image, band by band.
+
+    Args:
+        bbox (tuple): (south, west, north, east) in degrees.
+        zoom (int): level of detail of the export.
+        store_path (str, optional): tile store (or packed tile archive) directory, read first and filled with downloaded tiles.
+        threads (int): concurrent tile reads/downloads per band.
+        offline (bool): never contact the tile server; missing tiles are left black.
+    """
+    def __init__(self, bbox: Tuple[float, float, float, float], zoom: int, store_path: str = None,
+                 threads: int = 16, offline: bool = False):
+        south, west, north, east = bbox
+        self.zoom: int = zoom
+        self.store: TileStore = open_tile_store(store_path) if store_path else None
+        self.threads: int = threads
+        self.offline: bool = offline
+        self.fetcher: TileFetcher = None if offline else TileFetcher(max_concurrency=threads)
+
+        # Global pixel extent of the bounding box at this zoom
+        x0, y0 = degree_to_tile(min(north, 85.0511), west, zoom)
+        x1, y1 = degree_to_tile(max(south, -85.0511), east, zoom)
+        self.px_left: int = int(x0 * TILE_SIZE)
+        self.px_top: int = int(y0 * TILE_SIZE)
+        self.width: int = max(1, int(x1 * TILE_SIZE) - self.px_left)
+        self.height: int = max(1, int(y1 * TILE_SIZE) - self.px_top)
+        self.tile_x_start: int = self.px_left // TILE_SIZE
+        self.tile_x_end: int = (self.px_left + self.width - 1) // TILE_SIZE
+        self.tile_y_start: int = self.px_top // TILE_SIZE
+        self.tile_y_end: int = (self.px_top + self.height - 1) // TILE_SIZE
+
+        self.markers: np.ndarray = np.empty((0, 2))
+        self.marker_radius: int = 0
+        self.marker_color: Tuple[int, int, int] = (214, 39, 40)
+        self.stats: dict = {"tiles": 0, "from_store": 0, "downloaded": 0, "missing": 0}
+        self.stats_lock: threading.Lock = threading.Lock()
+
+    def set_markers(self, lat: np.ndarray, lon: np.ndarray, radius: int = 5, color: Tuple[int, int, int] = (214, 39, 40)) -> None:
+        """
+        Sets marker points (degrees) to burn into the export as filled circles.
+        """
+        x, y = degree_to_tile_array(lat, lon, self.zoom)
+        self.markers = np.column_stack([x * TILE_SIZE - self.px_left, y * TILE_SIZE - self.px_top])
+        self.marker_radius = radius
+        self.marker_color = color
+
+    def _load_tile(self, key: int) -> np.ndarray:
+        from PIL import Image
+
+        data = self.store.read(key) if self.store else None
+        source = "from_store"
+        if data is None and not self.offline:
+            try:
+                data = self.fetcher.fetch(key)
+                source = "downloaded"
+                if self.store:
+                    self.store.write(key, data)
+            except Exception as e:
+                print(f"Error: Tile {tile_key(key)} not retrieved: {e}")
+                data = None
+        with self.stats_lock:
+            self.stats["missing" if data is None else source] += 1
+        if data is None:
+            return None
+        with Image.open(BytesIO(data)) as image:
+            return np.asarray(image.convert("RGB"))
+
+    def _load_row(self, executor: ThreadPoolExecutor, tile_y: int) -> list:
+        return [executor.submit(self._load_tile, tile_id(self.zoom, tile_x, tile_y))
+                for tile_x in range(self.tile_x_start, self.tile_x_end + 1)]
+
+    def _burn_markers(self, band: np.ndarray, band_top: int) -> None:
+        if len(self.markers) == 0:
+            return
+        r = self.marker_radius
+        rows = band.shape[0]
+        in_band = (self.markers[:, 1] >= band_top - r) & (self.markers[:, 1] < band_top + rows + r)
+        yy, xx = np.mgrid[-r:r + 1, -r:r + 1]
+        disc = (xx ** 2 + yy ** 2) <= r ** 2
+        for mx, my in self.markers[in_band].astype(int):
+            my -= band_top
+            top, bottom = max(my - r, 0), min(my + r + 1, rows)
+            left, right = max(mx - r, 0), min(mx + r + 1, self.width)
+            if top >= bottom or left >= right:
+                continue
+            mask = disc[top - (my - r):bottom - (my - r), left - (mx - r):right - (mx - r)]
+            band[top:bottom, left:right][mask] = self.marker_color
+
+    def export(self, outputs: List[str], verbose: bool = False) -> dict:
+        """
+        Exports the region to each output file: '.npy' (memory-mapped array) or '.png' (streamed).
+
+        Returns:
+            dict: export statistics (size, tile sources, elapsed seconds).
+        """
+        start = time.perf_counter()
+        writers = []
+        for file in outputs:
+            if file.lower().endswith(".npy"):
+                writers.append(np.lib.format.open_memmap(file, mode="w+", dtype=np.uint8, shape=(self.height, self.width, 3)))
+            elif file.lower().endswith(".png"):
+                writers.append(PngStreamWriter(file, self.width, self.height))
+            else:
+                raise Exception(f"Unsupported export format '{file}'. Expected a .npy or .png file.")
+
+        band_width = (self.tile_x_end - self.tile_x_start + 1) * TILE_SIZE
+        x_offset = self.px_left - self.tile_x_start * TILE_SIZE
+        row_written = 0
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            next_row = self._load_row(executor, self.tile_y_start)
+            for tile_y in range(self.tile_y_start, self.tile_y_end + 1):
+                row, next_row = next_row, (self._load_row(executor, tile_y + 1) if tile_y < self.tile_y_end else None)
+
+                band = np.zeros((TILE_SIZE, band_width, 3), dtype=np.uint8)
+                for i, future in enumerate(row):
+                    tile = future.result()
+                    self.stats["tiles"] += 1
+                    if tile is not None:
+                        band[:tile.shape[0], i * TILE_SIZE:i * TILE_SIZE + tile.shape[1]] = tile[:TILE_SIZE, :TILE_SIZE]
+
+                # Crop the band to the export extent
+                band_top = tile_y * TILE_SIZE
+                top = max(self.px_top - band_top, 0)
+                bottom = min(self.px_top + self.height - band_top, TILE_SIZE)
+                band = band[top:bottom, x_offset:x_offset + self.width]
+                self._burn_markers(band, row_written)
+
+                for writer in writers:
+                    if isinstance(writer, PngStreamWriter):
+                        writer.write_rows(band)
+                    else:
+                        writer[row_written:row_written + band.shape[0]] = band
+                row_written += band.shape[0]
+                if verbose:
+                    print(f"\rStitched {row_written}/{self.height} rows", end="", flush=True)
+
+        for writer in writers:
+            if isinstance(writer, PngStreamWriter):
+                writer.close()
+            else:
+                writer.flush()
+        if verbose:
+            print()
+        return dict(self.stats, width=self.width, height=self.height, seconds=round(time.perf_counter() - start, 3))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a region of ArcGIS imagery as one stitched image.")
+    parser.add_argument('--bbox', type=float, nargs=4, required=True, metavar=('SOUTH', 'WEST', 'NORTH', 'EAST'),
+                        help='Bounding box in degrees.')
+    parser.add_argument('-z', '--zoom', type=int, required=True, help='Level of Detail to export.')
+    parser.add_argument('-o', '--output', type=str, nargs='+', required=True,
+                        help='Output file(s): .png (streamed) and/or .npy (memory-mapped array).')
+    parser.add_argument('-s', '--store', type=str, default=None, help='Tile store directory to read from and fill.')
+    parser.add_argument('--offline', action='store_true', default=False, help='Only use tiles in the store.')
+    parser.add_argument('--threads', type=int, default=16, help='Concurrent tile reads/downloads.')
+    parser.add_argument('--markers', type=str, default=None, help='CSV file of markers with latitude/longitude columns.')
+    parser.add_argument('--marker-radius', type=int, default=5, help='Marker radius in pixels.')
+    parser.add_argument('--marker-color', type=str, default="#D62728", help='Marker color as #RRGGBB.')
+    parser.add_argument('-mem', '--memory_limit', type=int, default=4096, required=False,
+                        help='Maximum megabytes of export size without confirmation.')
+    args = parser.parse_args()
+
+    exporter = TileExporter(args.bbox, args.zoom, store_path=args.store, threads=args.threads, offline=args.offline)
+    export_size = int(exporter.width * exporter.height * 3 / (1024 ** 2))
+    print(f"Exporting {exporter.width} x {exporter.height} px ({export_size} Mb uncompressed) at zoom {args.zoom}.")
+    if export_size > args.memory_limit:
+        user_input = input(f"Warning: The export size is {export_size} Mb. Continue? (y/n): ")
+        if user_input.lower() != "y":
+            sys.exit(-1)
+
+    if args.markers:
+        import pandas as pd
+        markers = pd.read_csv(args.markers, encoding='unicode_escape')
+        columns = {c.lower(): c for c in markers.columns}
+        lat_column = next((columns[c] for c in ("lat", "latitude") if c in columns), None)
+        lon_column = next((columns[c] for c in ("lon", "lng", "long", "longitude") if c in columns), None)
+        if lat_column is None or lon_column is None:
+            raise Exception(f"No latitude/longitude columns found in '{args.markers}'.")
+        color = args.marker_color.lstrip("#")
+        exporter.set_markers(markers[lat_column].to_numpy(), markers[lon_column].to_numpy(), args.marker_radius,
+                             tuple(int(color[i:i + 2], 16) for i in (0, 2, 4)))
+
+    print(exporter.export(args.output, verbose=True))
@@ -0,0 +1,363 @@
+import ssl
+import time
+import random
+import certifi
+import threading
+import http.client
+import urllib.error
+import urllib.request
+from collections import deque
+
+from app.profiling import span
+from app.SessionRecorder import SessionRecorder
+from app.tile_id import tile_zyx, tile_key
+
+# Template for image tile requests; {z}, {y} and {x} are the level of detail, row and column.
+TILE_SERVER_URL = "https://server.arcgisonline.com/arcgis/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}.JPEG"
+
+def create_ssl_context() -> ssl.SSLContext:
+    return ssl.create_default_context(cafile=certifi.where())
+
+def tile_url(key: int, url_template: str = TILE_SERVER_URL) -> str:
+    """
+    Builds the request URL of an image tile.
+
+    Args:
+        key (int): tile id of the image data (see app.tile_id).
+        url_template (str): URL template with {z}, {y} and {x} fields.
+
+    Returns:
+        str: the tile URL.
+    """
+    z, y, x = tile_zyx(key)
+    return url_template.format(z=z, y=y, x=x)
+
+class TileResponse:
+    """
+    A tile server response: the image data (None if not modified) and its HTTP caching headers.
+
+    Args:
+        status (int): HTTP status, 200 or 304 (not modified).
+        data (bytes): the compressed image data, None for a 304.
+        etag (str, optional): ETag validator.
+        last_modified (str, optional): Last-Modified validator (HTTP date).
+        max_age (float, optional): lifetime in seconds from Cache-Control, None if not given.
+    """
+    def __init__(self, status: int, data: bytes, etag: str = None, last_modified: str = None, max_age: float = None):
+        self.status: int = status
+        self.data: bytes = data
+        self.etag: str = etag
+        self.last_modified: str = last_modified
+        self.max_age: float = max_age
+
+    @classmethod
+    def from_headers(cls, status: int, data: bytes, headers) -> "TileResponse":
+        if headers is None:
+            return cls(status, data)
+        return cls(status, data, headers.get("ETag"), headers.get("Last-Modified"), parse_max_age(headers.get("Cache-Control", "")))
+
+def parse_max_age(cache_control: str) -> float:
+    """
+    Returns the lifetime in seconds given by a Cache-Control header (0 for no-cache and no-store), or None.
+    """
+    max_age = None
+    for directive in cache_control.lower().split(","):
+        name, _, value = directive.strip().partition("=")
+        if name in ("no-cache", "no-store"):
+            return 0.0
+        if name == "max-age" and value.strip('"').isdigit():
+            max_age = float(value.strip('"'))
+    return max_age
+
+def fetch_tile_response(key: int, context: ssl.SSLContext = None, timeout: float = 30.0, url_template: str = TILE_SERVER_URL,
+                        etag: str = None, last_modified: str = None) -> TileResponse:
+    """
+    Fetches a tile from the tile server, conditionally if validators of a stored copy are given: the
+    server answers 304 without payload if the tile did not change. Free of Qt.
+
+    Args:
+        key (int): tile id of the image data (see app.tile_id).
+        context (SSLContext, optional): SSL context for https requests.
+        timeout (float): socket timeout in seconds.
+        url_template (str): URL template with {z}, {y} and {x} fields.
+        etag (str, optional): ETag of the stored copy (If-None-Match).
+        last_modified (str, optional): Last-Modified of the stored copy (If-Modified-Since).
+
+    Returns:
+        TileResponse: the response; its data is None if the tile was not modified.
+    """
+    request = urllib.request.Request(tile_url(key, url_template))
+    if etag:
+        request.add_header("If-None-Match", etag)
+    if last_modified:
+        request.add_header("If-Modified-Since", last_modified)
+    with span("download"):
+        try:
+            with urllib.request.urlopen(request, context=context, timeout=timeout) as response:
+                return TileResponse.from_headers(response.status, response.read(), response.headers)
+        except urllib.error.HTTPError as e:
+            if e.code != 304:
+                raise
+            return TileResponse.from_headers(304, None, e.headers)
+
+def fetch_tile(key: int, context: ssl.SSLContext = None, timeout: float = 30.0, url_template: str = TILE_SERVER_URL) -> bytes:
+    """
+    Fetches the compressed image data of a tile from the tile server. Free of Qt so it can be used
+    from plain threads and worker processes.
+
+    Args:
+        key (int): tile id of the image data (see app.tile_id).
+        context (SSLContext, optional): SSL context for https requests.
+        timeout (float): socket timeout in seconds.
+        url_template (str): URL template with {z}, {y} and {x} fields.
+
+    Returns:
+        bytes: the compressed image data.
+    """
+    return fetch_tile_response(key, context, timeout, url_template).data
+
+
+##### ADAPTIVE FETCH EXECUTION #####
+class CircuitOpenError(Exception):
+    """
+    Raised instead of sending a request while the circuit breaker is open.
+    """
+    pass
+
+
+class AdaptiveLimiter:
+    """
+    AIMD (additive increase, multiplicative decrease) concurrency limit for outgoing requests.
+    The limit grows by about one request per round trip while latency stays near the observed
+    baseline, and is cut multiplicatively on errors or when latency rises well above the baseline,
+    so concurrency settles near the server's throughput sweet spot.
+
+    Args:
+        initial (int): initial concurrency limit.
+        minimum (int): lower bound of the limit.
+        maximum (int): upper bound of the limit.
+        latency_tolerance (float): latency ratio over the baseline treated as congestion.
+    """
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 32, latency_tolerance: float = 2.0):
+        self.limit: float = float(min(max(initial, minimum), maximum))
+        self.minimum: int = minimum
+        self.maximum: int = maximum
+        self.latency_tolerance: float = latency_tolerance
+        self.in_flight: int = 0
+        self.latency_ewma: float = None
+        self.recent_latencies: deque = deque(maxlen=50)
+        self.last_decrease: float = 0.0
+        self.condition: threading.Condition = threading.Condition()
+
+    def acquire(self) -> None:
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency: float, success: bool) -> None:
+        with self.condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if success:
+                self.recent_latencies.append(latency)
+                self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+                baseline = min(self.recent_latencies)
+                if self.latency_ewma > baseline * self.latency_tolerance and len(self.recent_latencies) >= 10:
+                    self._decrease(0.9, now)
+                elif self.in_flight + 1 >= int(self.limit):
+                    # Only grow while the current limit is actually in use
+                    self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            else:
+                self._decrease(0.5, now)
+            self.condition.notify_all()
+
+    def _decrease(self, factor: float, now: float) -> None:
+        # At most one decrease per round trip, so a burst of failures counts as one congestion signal
+        if now - self.last_decrease >= (self.latency_ewma or 0.0):
+            self.limit = max(float(self.minimum), self.limit * factor)
+            self.last_decrease = now
+
+
+class CircuitBreaker:
+    """
+    Stops requests to a failing server. After `failure_threshold` consecutive failures the circuit
+    opens and requests fail fast for `cooldown` seconds; then a single probe request is let through
+    (half-open). A successful probe closes the circuit, a failed one re-opens it with a doubled cooldown.
+
+    Args:
+        failure_threshold (int): consecutive failures which open the circuit.
+        cooldown (float): initial open duration in seconds.
+        max_cooldown (float): upper bound of the open duration in seconds.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 8, cooldown: float = 5.0, max_cooldown: float = 120.0):
+        self.failure_threshold: int = failure_threshold
+        self.base_cooldown: float = cooldown
+        self.cooldown: float = cooldown
+        self.max_cooldown: float = max_cooldown
+        self.state: str = self.CLOSED
+        self.failures: int = 0
+        self.opened_at: float = 0.0
+        self.trips: int = 0
+        self.lock: threading.Lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+                return True # The probe request
+            return self.state == self.CLOSED
+
+    def record(self, success: bool) -> None:
+        with self.lock:
+            if success:
+                self.state = self.CLOSED
+                self.failures = 0
+                self.cooldown = self.base_cooldown
+                return
+            self.failures += 1
+            if self.state == self.HALF_OPEN:
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.trips += 1
+
+
+class TileFetcher:
+    """
+    Tile fetch executor shared by all downloads of a process: adaptive concurrency (AIMD), per-tile
+    retries with exponential backoff and full jitter, and a circuit breaker, with statistics.
+    Thread-safe; call fetch() from any number of worker threads.
+
+    Args:
+        url_template (str): URL template with {z}, {y} and {x} fields.
+        max_concurrency (int): upper bound of concurrent requests.
+        retries (int): retry attempts per tile after the first failure.
+        backoff_base (float): base backoff delay in seconds.
+        backoff_max (float): upper bound of a backoff delay in seconds.
+        timeout (float): socket timeout in seconds.
+    """
+    def __init__(self, url_template: str = TILE_SERVER_URL, max_concurrency: int = 16, retries: int = 3,
+                 backoff_base: float = 0.25, backoff_max: float = 8.0, timeout: float = 30.0):
+        self.url_template: str = url_template
+        self.retries: int = retries
+        self.backoff_base: float = backoff_base
+        self.backoff_max: float = backoff_max
+        self.timeout: float = timeout
+        self.context: ssl.SSLContext = create_ssl_context()
+        self.limiter: AdaptiveLimiter = AdaptiveLimiter(initial=min(4, max_concurrency), maximum=max_concurrency)
+        self.breaker: CircuitBreaker = CircuitBreaker()
+        self.stats_lock: threading.Lock = threading.Lock()
+        self.stats: dict = {"requests": 0, "successes": 0, "failures": 0, "retries": 0, "rejected": 0, "bytes": 0, "not_modified": 0}
+        self.trace: SessionRecorder = None # Records every server response when set
+
+    @property
+    def max_concurrency(self) -> int:
+        return self.limiter.maximum
+
+    def _count(self, **increments) -> None:
+        with self.stats_lock:
+            for name, value in increments.items():
+                self.stats[name] += value
+
+    def fetch(self, key: int) -> bytes:
+        """
+        Fetches the compressed image data of a tile, retrying transient failures.
+
+        Args:
+            key (int): tile id of the image data (see app.tile_id).
+
+        Returns:
+            bytes: the compressed image data.
+
+        Raises:
+            CircuitOpenError: the server is failing and requests are suspended.
+            urllib.error.HTTPError: a non-retriable HTTP error (e.g. 404) or the last retriable error.
+        """
+        return self.fetch_response(key).data
+
+    def fetch_response(self, key: int, etag: str = None, last_modified: str = None) -> TileResponse:
+        """
+        Fetches a tile with its caching headers, retrying transient failures; conditionally if the
+        validators of a stored copy are given (see fetch_tile_response()).
+
+        Returns:
+            TileResponse: the response; its data is None if the tile was not modified (304).
+
+        Raises:
+            CircuitOpenError: the server is failing and requests are suspended.
+            urllib.error.HTTPError: a non-retriable HTTP error (e.g. 404) or the last retriable error.
+        """
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self._count(rejected=1)
+                raise CircuitOpenError(f"Tile server unavailable; request for {tile_key(key)} suspended.")
+            self.limiter.acquire()
+            start = time.monotonic()
+            try:
+                response = fetch_tile_response(key, self.context, self.timeout, self.url_template, etag, last_modified)
+            except Exception as e:
+                retriable, retry_after = self._classify(e)
+                # A missing tile (404) is an answer, not a server failure: neither congestion nor an outage.
+                # Anything else (connection errors, truncated bodies, 5xx) is a failure.
+                answered = isinstance(e, urllib.error.HTTPError) and not retriable
+                self.limiter.release(time.monotonic() - start, success=answered)
+                if self.trace is not None:
+                    self.trace.record("fetch", key=tile_key(key), ms=round((time.monotonic() - start) * 1e3, 2),
+                                      status=getattr(e, "code", 0) or 0, bytes=0)
+                self.breaker.record(success=answered)
+                self._count(requests=1, failures=1)
+                if not retriable or attempt >= self.retries:
+                    raise
+                attempt += 1
+                self._count(retries=1)
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+                time.sleep(max(delay, retry_after))
+                continue
+            size = len(response.data) if response.data is not None else 0
+            self.limiter.release(time.monotonic() - start, success=True)
+            if self.trace is not None:
+                self.trace.record("fetch", key=tile_key(key), ms=round((time.monotonic() - start) * 1e3, 2), status=response.status, bytes=size)
+            self.breaker.record(success=True)
+            self._count(requests=1, successes=1, bytes=size, not_modified=int(response.status == 304))
+            return response
+
+    def _classify(self, error: Exception) -> tuple:
+        """
+        Returns (retriable, retry_after seconds) for a failed request.
+        """
+        if isinstance(error, urllib.error.HTTPError):
+            retry_after = 0.0
+            if error.headers is not None and error.headers.get("Retry-After", "").isdigit():
+                retry_after = min(float(error.headers["Retry-After"]), self.backoff_max)
+            return (error.code in (408, 429) or error.code >= 500), retry_after
+        # HTTPException covers truncated bodies (IncompleteRead) and malformed responses (BadStatusLine)
+        return isinstance(error, (urllib.error.URLError, OSError, http.client.HTTPException)), 0.0
+
+    def get_stats(self) -> dict:
+        with self.stats_lock:
+            stats = dict(self.stats)
+        stats["concurrency_limit"] = round(self.limiter.limit, 2)
+        stats["in_flight"] = self.limiter.in_flight
+        stats["latency_ewma_ms"] = round((self.limiter.latency_ewma or 0.0) * 1e3, 1)
+        stats["circuit"] = self.breaker.state
+        stats["circuit_trips"] = self.breaker.trips
+        return stats
+
+
+_default_fetcher: TileFetcher = None
+_default_fetcher_lock: threading.Lock = threading.Lock()
+
+def get_default_fetcher() -> TileFetcher:
+    """
+    Returns the process-wide TileFetcher used by the viewer.
+    """
+    global _default_fetcher
+    with _default_fetcher_lock:
+        if _default_fetcher is None:
+            _default_fetcher = TileFetcher()
+        return _default_fetcher
@@ -0,0 +1,95 @@
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Tuple
+
+from app.TileFetcher import TileResponse
+
+DEFAULT_TTL = 7 * 24 * 3600.0 # Seconds a stored tile is served without revalidation
+MIN_TTL = 3600.0 # Lower bound on server lifetimes (no-cache, short max-age), so views do not revalidate constantly
+
+class TileMetadata:
+    """
+    HTTP cache metadata of the tiles of a tile store: the validators of every downloaded tile (ETag,
+    Last-Modified) and its expiry time, when it has to be revalidated with the tile server. Kept in a
+    SQLite database in the store root (a tile store directory or a tile archive), so it is shared by
+    the processes using the store and updates are cheap. Free of Qt.
+
+    The lifetime of a tile is the server's Cache-Control max-age if given, otherwise `ttl`, and never
+    less than `min_ttl`. Tiles stored without metadata (e.g. by the batch downloader) expire `ttl`
+    after they were written, if the store knows when (see TileStore.modified_time()), else immediately.
+
+    Args:
+        root (str): root directory of the tile store.
+        ttl (float): lifetime in seconds of tiles without a server lifetime.
+        min_ttl (float): lower bound of tile lifetimes in seconds.
+    """
+    FILE = "tiles.meta.sqlite"
+
+    def __init__(self, root: str, ttl: float = DEFAULT_TTL, min_ttl: float = MIN_TTL):
+        self.root: Path = Path(root)
+        self.ttl: float = ttl
+        self.min_ttl: float = min_ttl
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.lock: threading.Lock = threading.Lock()
+        self.connection: sqlite3.Connection = sqlite3.connect(str(self.root / self.FILE), timeout=30.0, check_same_thread=False)
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS tiles (key INTEGER PRIMARY KEY, etag TEXT, last_modified TEXT, expires REAL)")
+            self.connection.commit()
+
+    def get(self, key: int) -> Tuple[str, str, float]:
+        """
+        Returns the (ETag, Last-Modified, expiry time) of a tile, or None if it has no metadata.
+        """
+        with self.lock:
+            return self.connection.execute("SELECT etag, last_modified, expires FROM tiles WHERE key = ?", (key,)).fetchone()
+
+    def record(self, key: int, response: TileResponse, now: float = None) -> None:
+        """
+        Records the validators and expiry time of a tile from a tile server response. A 304 response
+        keeps the stored validators the server did not repeat.
+        """
+        now = time.time() if now is None else now
+        lifetime = max(self.min_ttl, response.max_age if response.max_age is not None else self.ttl)
+        with self.lock:
+            if response.status == 304:
+                self.connection.execute("INSERT INTO tiles (key, etag, last_modified, expires) VALUES (?, ?, ?, ?) "
+                                        "ON CONFLICT(key) DO UPDATE SET etag = COALESCE(excluded.etag, etag), "
+                                        "last_modified = COALESCE(excluded.last_modified, last_modified), expires = excluded.expires",
+                                        (key, response.etag, response.last_modified, now + lifetime))
+            else:
+                self.connection.execute("INSERT OR REPLACE INTO tiles (key, etag, last_modified, expires) VALUES (?, ?, ?, ?)",
+                                        (key, response.etag, response.last_modified, now + lifetime))
+            self.connection.commit()
+
+    def is_fresh(self, key: int, stored_time: float = None, now: float = None) -> bool:
+        """
+        Returns whether a stored tile may be served without revalidation.
+
+        Args:
+            key (int): tile id.
+            stored_time (float, optional): time the tile was written, for tiles without metadata.
+            now (float, optional): current time (epoch seconds).
+        """
+        now = time.time() if now is None else now
+        entry = self.get(key)
+        if entry is not None:
+            return now < entry[2]
+        return stored_time is not None and now < stored_time + self.ttl
+
+    def stats(self) -> dict:
+        """
+        Returns the number of tiles with metadata, how many of them expired, and how many have validators.
+        """
+        with self.lock:
+            count, expired, validated = self.connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(expires <= ?), 0), COALESCE(SUM(etag IS NOT NULL OR last_modified IS NOT NULL), 0) FROM tiles",
+                (time.time(),)).fetchone()
+        return {"tiles": count, "expired": expired, "validated": validated}
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
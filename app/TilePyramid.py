@@ -0,0 +1,190 @@
+'''
+Offline tile pyramid builder for the on-disk tile store.
+
+Lower zoom levels are derived from a downloaded high-zoom level by 2x2 downsampling (each parent tile
+is the box-filtered mosaic of its four children), so only the deepest level needs downloading: the
+levels above it are a third of its size, i.e. a quarter of the whole pyramid. Overzoom tiles beyond the
+source's maximum level are generated by upsampling crops of the deepest tiles, allowing deeper zoom offline.
+Each level is processed in parallel across a process pool.
+
+Parents missing any of their children (along the edges of a downloaded region) are not derived: the
+store would serve them as real tiles with a black part, and the viewer would never fetch them.
+
+Usage:
+    python -m app.TilePyramid -p resources/images --source_zoom 12 --min_zoom 3 --max_zoom 14
+'''
+import os
+import time
+import argparse
+import numpy as np
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+from app.TileStore import TileStore
+from app.tile_id import tile_id, tile_zyx, tile_parent, tile_children
+
+TILE_SIZE = 256
+JPEG_QUALITY = 90
+
+##### IMAGE HELPERS #####
+def decode_tile(data: bytes) -> np.ndarray:
+    from PIL import Image
+    with Image.open(BytesIO(data)) as image:
+        return np.asarray(image.convert("RGB"))
+
+def encode_tile(pixels: np.ndarray, quality: int = JPEG_QUALITY) -> bytes:
+    from PIL import Image
+    buffer = BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+def downsample_children(children: List[np.ndarray]) -> np.ndarray:
+    """
+    Builds a parent tile from its four children (top-left, top-right, bottom-left, bottom-right) by
+    averaging each 2x2 pixel block of their mosaic.
+
+    Returns:
+        np.ndarray: the parent tile, or None if a child is missing (None) and the parent incomplete.
+    """
+    if any(child is None for child in children):
+        return None
+    mosaic = np.zeros((TILE_SIZE * 2, TILE_SIZE * 2, 3), dtype=np.uint16)
+    for i, child in enumerate(children):
+        row, column = divmod(i, 2)
+        mosaic[row * TILE_SIZE:(row + 1) * TILE_SIZE, column * TILE_SIZE:(column + 1) * TILE_SIZE] = child[:TILE_SIZE, :TILE_SIZE]
+    blocks = mosaic.reshape(TILE_SIZE, 2, TILE_SIZE, 2, 3).sum(axis=(1, 3))
+    return ((blocks + 2) // 4).astype(np.uint8)
+
+def upsample_crop(pixels: np.ndarray, levels: int, sub_x: int, sub_y: int) -> np.ndarray:
+    """
+    Builds an overzoom tile `levels` below a tile: crops the (sub_x, sub_y) cell of a 2^levels grid
+    and upsamples it to full tile size.
+    """
+    from PIL import Image
+    cell = TILE_SIZE >> levels
+    crop = pixels[sub_y * cell:(sub_y + 1) * cell, sub_x * cell:(sub_x + 1) * cell]
+    return np.asarray(Image.fromarray(crop).resize((TILE_SIZE, TILE_SIZE), Image.BICUBIC))
+
+
+##### WORKER TASKS #####
+def _build_parents(store_root: str, parents: List[int], overwrite: bool) -> int:
+    store = TileStore(store_root)
+    written = 0
+    for key in parents:
+        if not overwrite and store.contains(key):
+            continue
+        children = []
+        for child in tile_children(key):
+            data = store.read(child)
+            if data is None:
+                break # Incomplete parent: left to the tile server
+            children.append(decode_tile(data))
+        pixels = downsample_children(children) if len(children) == 4 else None
+        if pixels is None:
+            continue
+        store.write(key, encode_tile(pixels))
+        written += 1
+    return written
+
+def _build_overzoom(store_root: str, source_zoom: int, max_zoom: int, keys: List[int], overwrite: bool) -> int:
+    store = TileStore(store_root)
+    written = 0
+    for key in keys:
+        _, y, x = tile_zyx(key)
+        pixels = None
+        for levels in range(1, max_zoom - source_zoom + 1):
+            if (TILE_SIZE >> levels) < 1:
+                break
+            grid = 2 ** levels
+            for sub_y in range(grid):
+                for sub_x in range(grid):
+                    child = tile_id(source_zoom + levels, x * grid + sub_x, y * grid + sub_y)
+                    if not overwrite and store.contains(child):
+                        continue
+                    if pixels is None:
+                        pixels = decode_tile(store.read(key))
+                    store.write(child, encode_tile(upsample_crop(pixels, levels, sub_x, sub_y)))
+                    written += 1
+    return written
+
+def _chunks(items: list, count: int) -> List[list]:
+    size = max(1, (len(items) + count - 1) // count)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+##### PYRAMID BUILDER #####
+class TilePyramidBuilder:
+    """
+    Derives zoom levels of a tile store from one source level.
+
+    Args:
+        store_root (str): root directory of the tile store.
+        processes (int): number of worker processes.
+        overwrite (bool): rebuild tiles which already exist in the store.
+    """
+    def __init__(self, store_root: str, processes: int = None, overwrite: bool = False):
+        self.store_root: str = str(store_root)
+        self.store: TileStore = TileStore(store_root)
+        self.processes: int = processes or os.cpu_count() or 1
+        self.overwrite: bool = overwrite
+
+    def build_lower(self, source_zoom: int, min_zoom: int, verbose: bool = False) -> dict:
+        """
+        Builds levels source_zoom-1 down to min_zoom, each from the level below it. Parents missing a
+        child are skipped (see module docstring).
+
+        Returns:
+            dict: tiles written per zoom level.
+        """
+        written = {}
+        with ProcessPoolExecutor(max_workers=self.processes) as pool:
+            for zoom in range(source_zoom - 1, min_zoom - 1, -1):
+                start = time.perf_counter()
+                parents = {tile_parent(key) for key in self.store.iter_keys(zoom + 1)}
+                chunks = _chunks(sorted(parents), self.processes * 4)
+                written[zoom] = sum(pool.map(_build_parents, [self.store_root] * len(chunks), chunks,
+                                             [self.overwrite] * len(chunks)))
+                if verbose:
+                    print(f"Zoom {zoom}: {written[zoom]} tiles derived in {time.perf_counter() - start:.2f} s")
+        return written
+
+    def build_overzoom(self, source_zoom: int, max_zoom: int, verbose: bool = False) -> int:
+        """
+        Builds overzoom levels source_zoom+1 up to max_zoom by upsampling the source level.
+
+        Returns:
+            int: number of tiles written.
+        """
+        start = time.perf_counter()
+        keys = sorted(self.store.iter_keys(source_zoom))
+        chunks = _chunks(keys, self.processes * 4)
+        with ProcessPoolExecutor(max_workers=self.processes) as pool:
+            written = sum(pool.map(_build_overzoom, [self.store_root] * len(chunks), [source_zoom] * len(chunks),
+                                   [max_zoom] * len(chunks), chunks, [self.overwrite] * len(chunks)))
+        if verbose:
+            print(f"Zoom {source_zoom + 1}-{max_zoom}: {written} overzoom tiles generated in {time.perf_counter() - start:.2f} s")
+        return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build lower zoom levels and overzoom tiles of a tile store locally.")
+    parser.add_argument('-p', '--store_path', type=str, required=True, help='Root directory of the tile store.')
+    parser.add_argument('--source_zoom', type=int, required=True, help='Downloaded Level of Detail to derive from.')
+    parser.add_argument('--min_zoom', type=int, default=None, help='Lowest Level of Detail to derive by downsampling.')
+    parser.add_argument('--max_zoom', type=int, default=None, help='Highest Level of Detail to generate by upsampling.')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help='Number of worker processes.')
+    parser.add_argument('--overwrite', action='store_true', default=False, help='Rebuild tiles which already exist.')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.store_path):
+        raise Exception(f"""The directory "{args.store_path}" was not found.""")
+    builder = TilePyramidBuilder(args.store_path, processes=args.processes, overwrite=args.overwrite)
+    if args.min_zoom is not None:
+        if args.min_zoom > args.source_zoom:
+            raise Exception("The minimum zoom level must not exceed the source zoom level.")
+        builder.build_lower(args.source_zoom, args.min_zoom, verbose=True)
+    if args.max_zoom is not None:
+        if args.max_zoom < args.source_zoom:
+            raise Exception("The maximum zoom level must not be lower than the source zoom level.")
+        builder.build_overzoom(args.source_zoom, args.max_zoom, verbose=True)
@@ -0,0 +1,142 @@
+import time
+import threading
+import urllib.error
+from collections import deque
+from email.utils import formatdate
+from PyQt5.QtCore import QObject, pyqtSignal
+from typing import Dict, List
+
+from app.TileStore import TileStore
+from app.TileFetcher import TileFetcher, TileResponse
+from app.TileMetadata import TileMetadata
+
+class TileRevalidator(QObject):
+    """
+    Serve-stale-while-revalidate for stored tiles. Expired tiles are served from the tile store as they
+    are and submitted here (see check()); background threads revalidate them with conditional GETs
+    (If-None-Match, If-Modified-Since) through the shared tile fetcher, so its concurrency limit and
+    circuit breaker apply. A 304 only extends the lifetime of the stored tile, at no payload cost; a
+    changed tile is written to the store and announced with tileChanged(tile id), for the views to reload it.
+
+    Tiles stored without validators (e.g. by the batch downloader) are revalidated with their write time
+    as If-Modified-Since if the store knows it, and with a plain GET otherwise.
+
+    Args:
+        tile_store (TileStore): the tile store (or tile archive).
+        metadata (TileMetadata): validators and expiry times of the stored tiles.
+        fetcher (TileFetcher): tile fetcher.
+        threads (int): revalidation threads.
+    """
+    tileChanged = pyqtSignal(object) # Tile ids exceed a C int
+
+    def __init__(self, tile_store: TileStore, metadata: TileMetadata, fetcher: TileFetcher, threads: int = 2):
+        super().__init__()
+        self.tile_store: TileStore = tile_store
+        self.metadata: TileMetadata = metadata
+        self.fetcher: TileFetcher = fetcher
+        self.thread_count: int = threads
+        self.threads: List[threading.Thread] = []
+        self.queue: deque = deque()
+        self.pending: set = set()
+        self.fresh_until: Dict[int, float] = {} # Expiry times already looked up, so fresh tiles cost no query
+        self.condition: threading.Condition = threading.Condition()
+        self.stats: dict = {"submitted": 0, "not_modified": 0, "unchanged": 0, "changed": 0, "failed": 0}
+
+    def record_download(self, key: int, response: TileResponse) -> None:
+        """
+        Records the validators and lifetime of a tile downloaded into the store.
+        """
+        self.metadata.record(key, response)
+        self.fresh_until.pop(key, None)
+
+    def check(self, key: int) -> bool:
+        """
+        Submits a tile served from the store for revalidation if it expired. Safe to call from worker threads.
+
+        Returns:
+            bool: whether the stored tile is fresh.
+        """
+        now = time.time()
+        if now < self.fresh_until.get(key, 0.0):
+            return True
+        entry = self.metadata.get(key)
+        if entry is not None:
+            self.fresh_until[key] = entry[2]
+            if now < entry[2]:
+                return True
+        elif self.metadata.is_fresh(key, self.tile_store.modified_time(key), now):
+            return True
+        self.submit(key)
+        return False
+
+    def submit(self, key: int) -> None:
+        with self.condition:
+            if key in self.pending:
+                return
+            self.pending.add(key)
+            self.queue.append(key)
+            self.stats["submitted"] += 1
+            while len(self.threads) < self.thread_count:
+                thread = threading.Thread(target=self._run, name="tile-revalidator", daemon=True)
+                self.threads.append(thread)
+                thread.start()
+            self.condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                while not self.queue:
+                    self.condition.wait()
+                key = self.queue.popleft()
+            try:
+                self.revalidate(key)
+            finally:
+                with self.condition:
+                    self.pending.discard(key)
+
+    def revalidate(self, key: int) -> bool:
+        """
+        Revalidates a stored tile with the tile server.
+
+        Returns:
+            bool: whether the tile changed.
+        """
+        entry = self.metadata.get(key)
+        etag, last_modified = (entry[0], entry[1]) if entry is not None else (None, None)
+        if not etag and not last_modified:
+            stored_time = self.tile_store.modified_time(key)
+            last_modified = formatdate(stored_time, usegmt=True) if stored_time is not None else None
+        try:
+            response = self.fetcher.fetch_response(key, etag, last_modified)
+        except Exception as e:
+            # The stored tile stays in use; it is submitted again the next time it is served
+            if not isinstance(e, urllib.error.HTTPError) or e.code != 404:
+                print(f"Error: Tile {key} not revalidated: {e}")
+            self._count("failed")
+            return False
+        changed = response.status != 304 and response.data != self.tile_store.read(key)
+        if changed:
+            self.tile_store.write(key, response.data)
+        self.metadata.record(key, response)
+        self.fresh_until.pop(key, None)
+        if changed:
+            self._count("changed")
+            self.tileChanged.emit(key)
+        else:
+            self._count("not_modified" if response.status == 304 else "unchanged")
+        return changed
+
+    def _count(self, name: str) -> None:
+        # The revalidation threads update the counts concurrently
+        with self.condition:
+            self.stats[name] += 1
+
+    def get_stats(self) -> dict:
+        """
+        Returns the revalidation counts (304s, unchanged full responses, changed tiles, failures) and the
+        number of tiles waiting.
+        """
+        with self.condition:
+            stats = dict(self.stats)
+            stats["pending"] = len(self.pending)
+        return stats
@@ -0,0 +1,281 @@
+import os
+import time
+import threading
+from collections import deque
+from PyQt5.QtCore import QObject, QThreadPool, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap
+from typing import Callable, Dict, List
+
+from app.profiling import span
+from app.ImageDownloader import ImageDownloader, Worker, get_fetch_pool
+from app.TileCache import TileCache
+from app.TileStore import TileStore
+from app.TileArchive import open_tile_store
+from app.TileFetcher import TileFetcher, get_default_fetcher
+from app.tile_id import tile_x, tile_y, tile_key
+from app.SessionRecorder import SessionRecorder
+from app.TileMetadata import TileMetadata
+from app.TileRevalidator import TileRevalidator
+from app.TileTranscoder import BackgroundTranscoder, load_codec
+
+class TileRequest:
+    """
+    The outstanding tiles of one viewport request of a subscriber.
+    """
+    def __init__(self, keys: List[int], callback: Callable[[dict], None]):
+        self.keys: List[int] = keys
+        self.callback: Callable[[dict], None] = callback
+        self.waiting: set = set(keys)
+        self.results: dict = {}
+        self.started: float = time.perf_counter()
+
+
+class TileService(QObject):
+    """
+    Process-wide tile service shared by any number of map views: one two-tier tile cache, one on-disk
+    tile store, one worker pool and one (connection pooling) tile fetcher.
+
+    Views subscribe and request the tiles of their viewport. Tiles already decoded are answered from
+    the cache; the rest is queued per subscriber, nearest to the viewport centre first. Workers are
+    started for the queues in turn (round-robin), so a view panning over many new tiles cannot starve
+    the others, and a tile requested by several views is fetched and decoded once and delivered to all
+    of them. A new request of a subscriber supersedes its previous one: tiles still queued for the old
+    viewport are dropped. Each request is answered with one callback, once all of its tiles are
+    resolved, in the result format of ImageDownloader: tile id to (image, sampled data, data), where
+    tiles answered from the cache carry their pixmap without data.
+
+    Stored tiles expire (see app.TileMetadata): expired tiles are still served from the tile store, and
+    revalidated in the background with conditional requests. Tiles that changed on the server replace
+    the cached ones and are announced with tileChanged(tile id), for the views showing them to reload.
+    If a storage codec is recorded for the tile store (see app.TileTranscoder), downloaded tiles are
+    transcoded to it in the background.
+
+    Args:
+        storage_path (str, optional): root directory of the on-disk tile store, or of a packed tile archive.
+        memory_limit (int): memory budget of the shared tile cache in bytes.
+        tile_bytes (int): estimated size of a decoded tile in bytes.
+        fetcher (TileFetcher, optional): tile fetcher; defaults to the process-wide fetcher.
+    """
+    tileChanged = pyqtSignal(object) # Tile ids exceed a C int
+
+    def __init__(self, storage_path: str = None, memory_limit: int = 100 * (1024 ** 2), tile_bytes: int = 256 * 256 * 4,
+                 fetcher: TileFetcher = None):
+        super().__init__()
+        self.tile_store: TileStore = open_tile_store(storage_path) if storage_path else None
+        self.cache: TileCache = TileCache(memory_limit, hot_limit=1, tile_bytes=tile_bytes)
+        self.fetcher: TileFetcher = fetcher or get_default_fetcher()
+        self.pool: QThreadPool = get_fetch_pool()
+        self.metadata: TileMetadata = None
+        self.revalidator: TileRevalidator = None
+        self.transcoder: BackgroundTranscoder = None
+        if self.tile_store is not None:
+            self.metadata = TileMetadata(self.tile_store.root)
+            self.revalidator = TileRevalidator(self.tile_store, self.metadata, self.fetcher)
+            self.revalidator.tileChanged.connect(self._tile_changed)
+            codec, quality = load_codec(self.tile_store.root)
+            if codec != "original":
+                self.transcoder = BackgroundTranscoder(self.tile_store, codec, quality)
+        self.downloader: ImageDownloader = ImageDownloader(threads=self.pool.maxThreadCount(), warm_lookup=self.cache.get_bytes,
+                                                           tile_store=self.tile_store, fetcher=self.fetcher,
+                                                           revalidator=self.revalidator, transcoder=self.transcoder)
+        self.max_in_flight: int = self.pool.maxThreadCount()
+
+        self.viewport_tiles: Dict[int, int] = {}
+        self.requests: Dict[int, TileRequest] = {}
+        self.queues: Dict[int, deque] = {}
+        self.turns: deque = deque() # Round-robin order of the subscribers
+        self.in_flight: Dict[int, Worker] = {}
+        self.dispatched: Dict[int, float] = {} # Dispatch time of the tiles in flight
+        self.next_subscriber: int = 0
+        self.trace: SessionRecorder = None # Records requests and tile loads when set
+        self.stats: dict = {"requests": 0, "cache_hits": 0, "fetched": 0, "failed": 0, "shared": 0, "dropped": 0}
+
+    ##### SUBSCRIPTIONS #####
+    def subscribe(self, viewport_tiles: int) -> int:
+        """
+        Registers a view. The hot cache tier holds about three viewports per subscribed view.
+
+        Args:
+            viewport_tiles (int): number of tiles in the view's viewport.
+
+        Returns:
+            int: the subscriber id.
+        """
+        subscriber = self.next_subscriber
+        self.next_subscriber += 1
+        self.viewport_tiles[subscriber] = viewport_tiles
+        self.queues[subscriber] = deque()
+        self.turns.append(subscriber)
+        self.cache.set_hot_limit(3 * sum(self.viewport_tiles.values()))
+        return subscriber
+
+    def unsubscribe(self, subscriber: int) -> None:
+        self.viewport_tiles.pop(subscriber, None)
+        self.requests.pop(subscriber, None)
+        self.queues.pop(subscriber, None)
+        if subscriber in self.turns:
+            self.turns.remove(subscriber)
+        self.cache.set_hot_limit(3 * max(1, sum(self.viewport_tiles.values())))
+
+    ##### REQUESTS #####
+    def request(self, subscriber: int, keys: List[int], callback: Callable[[dict], None]) -> None:
+        """
+        Requests the tiles of a subscriber's viewport, superseding its previous request.
+
+        Args:
+            subscriber (int): subscriber id (see subscribe()).
+            keys (List[int]): tile ids of the viewport.
+            callback (Callable[[dict], None]): receives the results once all tiles are resolved. Called
+                immediately if all tiles are cached.
+        """
+        self.stats["requests"] += 1
+        self.stats["dropped"] += len(self.queues[subscriber])
+        self.queues[subscriber].clear()
+        request = TileRequest(list(keys), callback)
+        self.requests[subscriber] = request
+
+        for key in request.keys:
+            pixmap = self.cache.get_pixmap(key)
+            if pixmap is not None:
+                request.results[key] = (pixmap, None, None)
+                request.waiting.discard(key)
+                self.stats["cache_hits"] += 1
+            elif key in self.in_flight:
+                self.stats["shared"] += 1
+        self.queues[subscriber].extend(self._center_out([key for key in request.keys if key in request.waiting and key not in self.in_flight]))
+        if self.trace is not None:
+            self.trace.record("tile_request", subscriber=subscriber, tiles=len(request.keys),
+                              cache_hits=len(request.keys) - len(request.waiting), queued=len(self.queues[subscriber]))
+
+        if not request.waiting:
+            self._complete(subscriber)
+        self._dispatch()
+
+    def _center_out(self, keys: List[int]) -> List[int]:
+        """
+        Orders tiles by their distance from the centre of the requested area.
+        """
+        if len(keys) < 2:
+            return keys
+        x_center = sum(tile_x(key) for key in keys) / len(keys)
+        y_center = sum(tile_y(key) for key in keys) / len(keys)
+        return sorted(keys, key=lambda key: (tile_x(key) - x_center) ** 2 + (tile_y(key) - y_center) ** 2)
+
+    def _dispatch(self) -> None:
+        """
+        Starts workers for the queued tiles, taking one tile from each subscriber's queue in turn.
+        """
+        idle = 0
+        while len(self.in_flight) < self.max_in_flight and idle < len(self.turns):
+            subscriber = self.turns[0]
+            self.turns.rotate(-1)
+            queue = self.queues[subscriber]
+            key = None
+            while queue:
+                key = queue.popleft()
+                if key not in self.in_flight and key not in self.cache:
+                    break
+                if key in self.cache:
+                    self._resolve(key, (self.cache.get_pixmap(key), None, None))
+                key = None
+            if key is None:
+                idle += 1
+                continue
+            idle = 0
+            worker = Worker(self.downloader.download_image, key)
+            worker.signals.result.connect(self._worker_result)
+            worker.signals.error.connect(lambda error, key=key: self._worker_failed(key))
+            self.in_flight[key] = worker
+            self.dispatched[key] = time.perf_counter()
+            self.pool.start(worker)
+
+    ##### RESULTS #####
+    def _worker_result(self, result: tuple) -> None:
+        key, entry = result
+        self.in_flight.pop(key, None)
+        self.stats["fetched"] += 1
+        image, _, data = entry
+        self._trace_tile(key, True, len(data) if data else 0)
+        if isinstance(image, QImage):
+            with span("handoff"):
+                pixmap = QPixmap.fromImage(image)
+            self.cache.put_pixmap(key, pixmap)
+            entry = (pixmap, entry[1], data)
+        if data:
+            self.cache.put_bytes(key, data)
+        self._resolve(key, entry)
+        self._dispatch()
+
+    def _worker_failed(self, key: int) -> None:
+        self.in_flight.pop(key, None)
+        self.stats["failed"] += 1
+        self._trace_tile(key, False, 0)
+        self._resolve(key, None)
+        self._dispatch()
+
+    def _tile_changed(self, key: int) -> None:
+        """
+        Replaces a tile that changed on the tile server in the cache, and announces it to the views.
+        """
+        self.cache.replace(key, self.tile_store.read(key))
+        if self.transcoder is not None:
+            self.transcoder.submit(key)
+        self.tileChanged.emit(key)
+
+    def _trace_tile(self, key: int, ok: bool, size: int) -> None:
+        dispatched = self.dispatched.pop(key, None)
+        if self.trace is not None and dispatched is not None:
+            self.trace.record("tile", key=tile_key(key), ms=round((time.perf_counter() - dispatched) * 1e3, 2), ok=ok, bytes=size)
+
+    def _resolve(self, key: int, entry) -> None:
+        """
+        Delivers a tile to every pending request waiting for it. Failed tiles (entry None) are resolved
+        without a result.
+        """
+        for subscriber, request in list(self.requests.items()):
+            if key in request.waiting:
+                request.waiting.discard(key)
+                if entry is not None:
+                    request.results[key] = entry
+                if not request.waiting:
+                    self._complete(subscriber)
+
+    def _complete(self, subscriber: int) -> None:
+        request = self.requests.pop(subscriber)
+        if self.trace is not None:
+            self.trace.record("request_done", subscriber=subscriber, tiles=len(request.keys), resolved=len(request.results),
+                              ms=round((time.perf_counter() - request.started) * 1e3, 2))
+        request.callback({key: request.results[key] for key in request.keys if key in request.results})
+
+    ##### STATISTICS #####
+    def get_stats(self) -> dict:
+        """
+        Returns the service statistics (requests, cache hits, fetched, failed and shared tiles, tiles
+        dropped by superseded requests), queue lengths per subscriber, and the cache, fetcher and revalidation statistics.
+        """
+        stats = dict(self.stats)
+        stats["subscribers"] = len(self.viewport_tiles)
+        stats["in_flight"] = len(self.in_flight)
+        stats["queued"] = {subscriber: len(queue) for subscriber, queue in self.queues.items()}
+        stats["cache"] = self.cache.get_stats()
+        stats["fetcher"] = self.fetcher.get_stats()
+        if self.revalidator is not None:
+            stats["revalidation"] = self.revalidator.get_stats()
+        if self.transcoder is not None:
+            stats["transcoding"] = self.transcoder.get_stats()
+        return stats
+
+
+_tile_services: Dict[str, TileService] = {}
+_tile_service_lock: threading.Lock = threading.Lock()
+
+def get_tile_service(storage_path: str = None) -> TileService:
+    """
+    Returns the process-wide TileService of a tile store root (or of no store), created on first use.
+    Views of the same store share one service; views of different stores get one each.
+    """
+    key = os.path.abspath(str(storage_path)) if storage_path else None
+    with _tile_service_lock:
+        if key not in _tile_services:
+            _tile_services[key] = TileService(storage_path)
+        return _tile_services[key]
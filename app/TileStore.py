@@ -0,0 +1,74 @@
+import os
+import threading
+from pathlib import Path
+
+from app.tile_id import tile_id, tile_zoom, tile_file_name
+
+class TileStore:
+    """
+    On-disk tile store using the batch download layout: <root>/<z>/<y>-<x>.JPG, holding the
+    compressed image data exactly as served. Free of Qt so it can be used from worker processes.
+
+    Args:
+        root (str): root directory of the store.
+        extension (str): file extension of stored tiles.
+    """
+    def __init__(self, root: str, extension: str = ".JPG"):
+        self.root: Path = Path(root)
+        self.extension: str = extension
+
+    def path_for(self, key: int) -> Path:
+        """
+        Returns the file path of a tile id.
+        """
+        return self.root / str(tile_zoom(key)) / f"{tile_file_name(key)}{self.extension}"
+
+    def iter_keys(self, zoom: int):
+        """
+        Yields the tile ids of all stored tiles at a zoom level.
+        """
+        directory = self.root / str(zoom)
+        if not directory.is_dir():
+            return
+        for entry in os.scandir(directory):
+            if entry.name.endswith(self.extension) and entry.is_file():
+                y, x = entry.name[:-len(self.extension)].split('-')
+                yield tile_id(zoom, int(x), int(y))
+
+    def contains(self, key: int) -> bool:
+        return self.path_for(key).is_file()
+
+    def read(self, key: int) -> bytes:
+        """
+        Returns the stored bytes of a tile, or None if the tile is not stored.
+        """
+        try:
+            with open(self.path_for(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def modified_time(self, key: int) -> float:
+        """
+        Returns the time (epoch seconds) a tile was written, or None if the tile is not stored.
+        """
+        try:
+            return self.path_for(key).stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def write(self, key: int, data: bytes) -> int:
+        """
+        Writes the bytes of a tile atomically (write then rename), so concurrent readers and
+        interrupted batch runs never observe partial files.
+
+        Returns:
+            int: number of bytes written.
+        """
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}-{threading.get_ident()}.part")
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        return len(data)
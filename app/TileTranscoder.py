@@ -0,0 +1,475 @@
+'''
+Storage codec of the tile store: transcodes stored tiles from the JPEG served by the tile server to a
+smaller format (WebP at a configurable quality), or keeps them as served.
+
+The codec of a store is recorded in <root>/tiles.codec.json. Tiles keep their paths (<z>/<y>-<x>.JPG)
+or archive records; readers sniff the format from the bytes (QImage.fromData, PIL), so the viewer,
+the tile pyramid builder and the exporter read transcoded stores unchanged. A tile is only replaced if
+its transcoded form saves at least `min_saving` of its size, and transcoding keeps the file time of a
+tile, which revalidation uses as If-Modified-Since for tiles without validators (see app.TileRevalidator).
+
+The transcoding pass runs across a process pool, per zoom level, and skips tiles already in the target
+format, so it can be rerun after each download to transcode only the new tiles. Archives are appended
+to by the parent process and compacted at the end. The viewer transcodes the tiles it downloads into a
+store with a codec on one background thread (see BackgroundTranscoder).
+
+The benchmark transcodes a sample of stored tiles into temporary stores, one per codec and quality,
+and reports bytes saved, encode and decode time per tile (Qt decode to the pixmap format, as the viewer
+does) and the time to load viewports of tiles from disk with the viewer's worker count.
+
+Usage:
+    python -m app.TileTranscoder transcode -p resources/images --codec webp --quality 80
+    python -m app.TileTranscoder benchmark -p resources/images --quality 60 75 90 --sample 500
+    python -m app.TileTranscoder info -p resources/images
+'''
+import os
+import json
+import time
+import argparse
+import tempfile
+import threading
+import numpy as np
+from io import BytesIO
+from collections import deque
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from app.TileStore import TileStore
+from app.TileArchive import TileArchive, open_tile_store
+from app.tile_id import tile_id, tile_zyx
+
+CODECS = ("original", "webp", "jpeg")
+DEFAULT_QUALITY = 80
+MIN_SAVING = 0.05 # Tiles whose transcoded form is not at least this much smaller keep their original bytes
+CODEC_FILE = "tiles.codec.json"
+
+##### CODECS #####
+def detect_codec(data) -> str:
+    """
+    Returns the format of compressed tile bytes from their signature: 'jpeg', 'webp', 'png' or None.
+    """
+    head = bytes(data[:12])
+    if head[:3] == b"\xff\xd8\xff":
+        return "jpeg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    return None
+
+def transcode_tile(data: bytes, codec: str, quality: int = DEFAULT_QUALITY, min_saving: float = MIN_SAVING) -> bytes:
+    """
+    Re-encodes compressed tile bytes with a storage codec.
+
+    Args:
+        data (bytes): compressed tile bytes.
+        codec (str): target codec, one of CODECS.
+        quality (int): encoder quality, 1-100.
+        min_saving (float): share of the size the transcoded form must save.
+
+    Returns:
+        bytes: the transcoded bytes, or None if the tile is kept as it is (original codec, already in
+            the target format, or not smaller).
+    """
+    if codec not in CODECS:
+        raise Exception(f"Error: Unknown tile codec '{codec}', expected one of {', '.join(CODECS)}.")
+    if codec == "original" or detect_codec(data) == codec:
+        return None
+    from PIL import Image
+    with Image.open(BytesIO(data)) as image:
+        buffer = BytesIO()
+        if codec == "webp":
+            image.convert("RGB").save(buffer, format="WEBP", quality=quality, method=4)
+        else:
+            image.convert("RGB").save(buffer, format="JPEG", quality=quality, optimize=True)
+    transcoded = buffer.getvalue()
+    if len(transcoded) > len(data) * (1.0 - min_saving):
+        return None
+    return transcoded
+
+def load_codec(root: str) -> Tuple[str, int]:
+    """
+    Returns the (codec, quality) recorded for a tile store, ('original', None) if none is.
+    """
+    path = Path(root) / CODEC_FILE
+    if not path.is_file():
+        return "original", None
+    with open(path, "r", encoding="utf-8") as f:
+        settings = json.load(f)
+    return settings.get("codec", "original"), settings.get("quality")
+
+def save_codec(root: str, codec: str, quality: int) -> None:
+    if codec not in CODECS:
+        raise Exception(f"Error: Unknown tile codec '{codec}', expected one of {', '.join(CODECS)}.")
+    with open(Path(root) / CODEC_FILE, "w", encoding="utf-8") as f:
+        json.dump({"codec": codec, "quality": quality}, f, indent=2)
+
+
+##### TRANSCODING PASS #####
+def stored_zooms(store) -> List[int]:
+    """
+    Returns the zoom levels holding tiles in a tile store or archive.
+    """
+    if isinstance(store, TileArchive):
+        return store.stats()["zooms"]
+    if not store.root.is_dir():
+        return []
+    return sorted(int(entry.name) for entry in os.scandir(store.root) if entry.is_dir() and entry.name.isdigit())
+
+def _transcode_store_tiles(store_root: str, keys: List[int], codec: str, quality: int, min_saving: float) -> Tuple[int, int, int]:
+    """
+    Transcodes tiles of a TileStore in place, keeping their file times.
+
+    Returns:
+        tuple: (tiles transcoded, bytes before, bytes after) of the transcoded tiles.
+    """
+    store = TileStore(store_root)
+    transcoded, before, after = 0, 0, 0
+    for key in keys:
+        data = store.read(key)
+        if data is None:
+            continue
+        try:
+            encoded = transcode_tile(data, codec, quality, min_saving)
+        except Exception as e:
+            print(f"Error: Tile {tile_zyx(key)} not transcoded: {e}")
+            continue
+        if encoded is None:
+            continue
+        path = store.path_for(key)
+        stat = path.stat()
+        store.write(key, encoded)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        transcoded += 1
+        before += len(data)
+        after += len(encoded)
+    return transcoded, before, after
+
+def _transcode_archive_tiles(archive_root: str, keys: List[int], codec: str, quality: int, min_saving: float) -> List[Tuple[int, int, bytes]]:
+    """
+    Transcodes tiles of an archive, for the parent process to append (an archive has one writer).
+
+    Returns:
+        list: (tile id, original length, transcoded bytes) of the transcoded tiles.
+    """
+    archive = TileArchive(archive_root, writable=False)
+    results = []
+    for key in keys:
+        data = archive.view(key)
+        if data is None:
+            continue
+        try:
+            encoded = transcode_tile(data, codec, quality, min_saving)
+        except Exception as e:
+            print(f"Error: Tile {tile_zyx(key)} not transcoded: {e}")
+            continue
+        if encoded is not None:
+            results.append((key, len(data), encoded))
+    archive.close()
+    return results
+
+def _chunks(items: list, count: int) -> List[list]:
+    size = max(1, (len(items) + count - 1) // count)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class TileTranscoder:
+    """
+    Transcodes the tiles of a tile store or archive to a storage codec, in parallel across processes,
+    and records the codec for the store (see module docstring).
+
+    Args:
+        store_root (str): root directory of the tile store or archive.
+        codec (str): target codec, one of CODECS.
+        quality (int): encoder quality, 1-100.
+        processes (int): number of worker processes.
+        min_saving (float): share of its size a tile must save to be replaced.
+    """
+    def __init__(self, store_root: str, codec: str = "webp", quality: int = DEFAULT_QUALITY, processes: int = None,
+                 min_saving: float = MIN_SAVING):
+        if codec not in CODECS:
+            raise Exception(f"Error: Unknown tile codec '{codec}', expected one of {', '.join(CODECS)}.")
+        self.store_root: str = str(store_root)
+        self.codec: str = codec
+        self.quality: int = quality
+        self.processes: int = processes or os.cpu_count() or 1
+        self.min_saving: float = min_saving
+
+    def run(self, zooms: List[int] = None, verbose: bool = False) -> dict:
+        """
+        Transcodes the stored tiles of the given zoom levels (all by default).
+
+        Returns:
+            dict: tiles examined and transcoded, bytes before and after transcoding of the transcoded
+                tiles, and the duration in seconds.
+        """
+        start = time.perf_counter()
+        save_codec(self.store_root, self.codec, self.quality)
+        summary = {"codec": self.codec, "quality": self.quality, "tiles": 0, "transcoded": 0, "bytes_before": 0, "bytes_after": 0}
+        if self.codec == "original":
+            summary["seconds"] = 0.0
+            return summary
+        is_archive = TileArchive.is_archive(self.store_root)
+        store = open_tile_store(self.store_root, writable=is_archive)
+        with ProcessPoolExecutor(max_workers=self.processes) as pool:
+            for zoom in zooms if zooms is not None else stored_zooms(store):
+                zoom_start = time.perf_counter()
+                keys = list(store.iter_keys(zoom))
+                chunks = _chunks(keys, self.processes * 4)
+                task = _transcode_archive_tiles if is_archive else _transcode_store_tiles
+                results = pool.map(task, [self.store_root] * len(chunks), chunks, [self.codec] * len(chunks),
+                                   [self.quality] * len(chunks), [self.min_saving] * len(chunks))
+                transcoded = 0
+                for result in results:
+                    if is_archive:
+                        for key, length, encoded in result:
+                            store.write(key, encoded)
+                            summary["bytes_before"] += length
+                            summary["bytes_after"] += len(encoded)
+                        transcoded += len(result)
+                    else:
+                        transcoded += result[0]
+                        summary["bytes_before"] += result[1]
+                        summary["bytes_after"] += result[2]
+                summary["tiles"] += len(keys)
+                summary["transcoded"] += transcoded
+                if verbose:
+                    print(f"Zoom {zoom}: {transcoded}/{len(keys)} tiles transcoded in {time.perf_counter() - zoom_start:.2f} s")
+        if is_archive:
+            if summary["transcoded"]:
+                store.compact() # Drops the original copies the transcoded tiles superseded
+            store.close()
+        summary["seconds"] = round(time.perf_counter() - start, 3)
+        return summary
+
+
+class BackgroundTranscoder:
+    """
+    Transcodes tiles written to a store with a codec (see load_codec()) as they arrive, on one daemon
+    thread, so the viewer's fetch workers keep storing tiles as served and never wait for an encoder.
+
+    Args:
+        tile_store (TileStore): the tile store (or tile archive) the tiles are written to.
+        codec (str): target codec, one of CODECS.
+        quality (int): encoder quality, 1-100.
+    """
+    def __init__(self, tile_store: TileStore, codec: str, quality: int = DEFAULT_QUALITY):
+        self.tile_store: TileStore = tile_store
+        self.codec: str = codec
+        self.quality: int = quality or DEFAULT_QUALITY
+        self.queue: deque = deque()
+        self.condition: threading.Condition = threading.Condition()
+        self.thread: threading.Thread = None
+        self.stats: dict = {"submitted": 0, "transcoded": 0, "bytes_before": 0, "bytes_after": 0}
+
+    def submit(self, key: int) -> None:
+        """
+        Queues a tile just written to the store. Safe to call from worker threads.
+        """
+        with self.condition:
+            self.queue.append(key)
+            self.stats["submitted"] += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="tile-transcoder", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                while not self.queue:
+                    self.condition.wait()
+                key = self.queue.popleft()
+            self.transcode(key)
+
+    def transcode(self, key: int) -> bool:
+        """
+        Transcodes one stored tile, keeping its file time.
+
+        Returns:
+            bool: whether the tile was replaced.
+        """
+        data = self.tile_store.read(key)
+        if data is None:
+            return False
+        try:
+            encoded = transcode_tile(data, self.codec, self.quality)
+        except Exception as e:
+            print(f"Error: Tile {tile_zyx(key)} not transcoded: {e}")
+            return False
+        if encoded is None:
+            return False
+        stored_time = self.tile_store.modified_time(key)
+        self.tile_store.write(key, encoded)
+        if stored_time is not None:
+            os.utime(self.tile_store.path_for(key), (stored_time, stored_time))
+        with self.condition:
+            self.stats["transcoded"] += 1
+            self.stats["bytes_before"] += len(data)
+            self.stats["bytes_after"] += len(encoded)
+        return True
+
+    def get_stats(self) -> dict:
+        with self.condition:
+            stats = dict(self.stats)
+            stats["pending"] = len(self.queue)
+        return stats
+
+
+##### BENCHMARK #####
+def sample_tiles(store_root: str, sample: int = 200, zoom: int = None) -> Dict[int, bytes]:
+    """
+    Returns up to `sample` stored tiles, from the deepest zoom level holding enough of them unless a
+    zoom level is given. Tiles are taken in id order, so they form contiguous rows, like viewports.
+    """
+    store = open_tile_store(store_root, writable=False)
+    zooms = [zoom] if zoom is not None else stored_zooms(store)[::-1]
+    tiles = {}
+    for level in zooms:
+        keys = sorted(store.iter_keys(level))
+        if len(keys) >= sample or level == zooms[-1]:
+            for key in keys[:sample]:
+                tiles[key] = store.read(key)
+            break
+    if isinstance(store, TileArchive):
+        store.close()
+    return tiles
+
+def _drop_cached(path: Path) -> None:
+    """
+    Evicts a file from the page cache where supported, so the viewport loads read from disk.
+    """
+    if hasattr(os, "posix_fadvise"):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+def _decode(data: bytes):
+    from PyQt5.QtGui import QImage
+    return QImage.fromData(data).convertToFormat(QImage.Format_RGB32)
+
+def benchmark_codec(tiles: Dict[int, bytes], codec: str, quality: int = DEFAULT_QUALITY, viewport: int = 48,
+                    threads: int = 4, repeat: int = 3) -> dict:
+    """
+    Measures one storage codec on sample tiles: transcodes them (without the minimum saving, so every
+    tile is in the codec) into a temporary store and times decoding and viewport loads from it.
+
+    Args:
+        tiles (Dict[int, bytes]): sample tiles, tile id to original bytes.
+        codec (str): codec, one of CODECS.
+        quality (int): encoder quality, 1-100.
+        viewport (int): tiles per viewport load (the default viewer viewport is 8x6 tiles).
+        threads (int): concurrent tile loads, as the viewer's fetch workers.
+        repeat (int): timed repetitions; the best is kept.
+
+    Returns:
+        dict: bytes stored and saved, encode and decode time per tile in ms, and the median and
+            maximum viewport load time in ms (read from disk and decode).
+    """
+    start = time.perf_counter()
+    encoded = {key: transcode_tile(data, codec, quality, min_saving=-1.0) or data for key, data in tiles.items()}
+    encode_ms = (time.perf_counter() - start) * 1e3 / max(1, len(tiles)) if codec != "original" else 0.0
+
+    decode_ms = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for data in encoded.values():
+            _decode(data)
+        decode_ms = min(decode_ms, (time.perf_counter() - start) * 1e3 / max(1, len(encoded)))
+
+    keys = list(encoded)
+    loads = []
+    with tempfile.TemporaryDirectory() as root, ThreadPoolExecutor(max_workers=threads) as executor:
+        store = TileStore(root)
+        for key, data in encoded.items():
+            store.write(key, data)
+        load = lambda key: _decode(store.read(key))
+        for _ in range(repeat):
+            for i in range(0, len(keys), viewport):
+                batch = keys[i:i + viewport]
+                for key in batch:
+                    _drop_cached(store.path_for(key))
+                start = time.perf_counter()
+                list(executor.map(load, batch))
+                loads.append((time.perf_counter() - start) * 1e3)
+
+    original_bytes = sum(len(data) for data in tiles.values())
+    stored_bytes = sum(len(data) for data in encoded.values())
+    return {
+        "codec": codec,
+        "quality": quality if codec != "original" else None,
+        "tiles": len(tiles),
+        "bytes": stored_bytes,
+        "saved": 1.0 - stored_bytes / original_bytes if original_bytes else 0.0,
+        "encode_ms": round(encode_ms, 3),
+        "decode_ms": round(decode_ms, 3),
+        "viewport_ms": round(float(np.median(loads)), 2) if loads else 0.0,
+        "viewport_max_ms": round(max(loads), 2) if loads else 0.0,
+    }
+
+def run_benchmark(tiles: Dict[int, bytes], qualities: List[int] = (60, 75, 90), codecs: List[str] = ("webp",),
+                  viewport: int = 48, threads: int = 4, repeat: int = 3) -> List[dict]:
+    """
+    Benchmarks the original tiles and every codec at every quality (see benchmark_codec()).
+    """
+    results = [benchmark_codec(tiles, "original", None, viewport, threads, repeat)]
+    for codec in codecs:
+        for quality in qualities:
+            results.append(benchmark_codec(tiles, codec, quality, viewport, threads, repeat))
+    return results
+
+def format_benchmark(results: List[dict]) -> str:
+    """
+    Formats benchmark results as a fixed-width table.
+    """
+    lines = [f"{'codec':<14}{'tiles':>7}{'Kb/tile':>10}{'saved':>8}{'encode (ms)':>13}{'decode (ms)':>13}{'viewport (ms)':>15}{'max (ms)':>10}"]
+    for result in results:
+        name = result["codec"] if result["quality"] is None else f"{result['codec']}:{result['quality']}"
+        lines.append(f"{name:<14}{result['tiles']:>7}{result['bytes'] / max(1, result['tiles']) / 1024:>10.1f}{result['saved']:>8.1%}"
+                     f"{result['encode_ms']:>13.3f}{result['decode_ms']:>13.3f}{result['viewport_ms']:>15.2f}{result['viewport_max_ms']:>10.2f}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transcode the tiles of a tile store to a storage codec, or benchmark the codecs.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    transcode_parser = subparsers.add_parser("transcode", help="Transcode the stored tiles and record the codec of the store.")
+    transcode_parser.add_argument('-p', '--store_path', type=str, required=True, help='Root directory of the tile store or archive.')
+    transcode_parser.add_argument('--codec', type=str, default="webp", choices=CODECS, help='Storage codec.')
+    transcode_parser.add_argument('--quality', type=int, default=DEFAULT_QUALITY, help='Encoder quality, 1-100.')
+    transcode_parser.add_argument('--zoom', type=int, nargs='*', default=None, help='Zoom levels to transcode (all by default).')
+    transcode_parser.add_argument('--processes', type=int, default=os.cpu_count(), help='Number of worker processes.')
+    benchmark_parser = subparsers.add_parser("benchmark", help="Compare codecs and qualities on a sample of the stored tiles.")
+    benchmark_parser.add_argument('-p', '--store_path', type=str, required=True, help='Root directory of the tile store or archive.')
+    benchmark_parser.add_argument('--codec', type=str, nargs='+', default=["webp"], choices=CODECS[1:], help='Codecs to compare with the original tiles.')
+    benchmark_parser.add_argument('--quality', type=int, nargs='+', default=[60, 75, 90], help='Encoder qualities.')
+    benchmark_parser.add_argument('--sample', type=int, default=200, help='Number of tiles to sample.')
+    benchmark_parser.add_argument('--zoom', type=int, default=None, help='Zoom level to sample (deepest with enough tiles by default).')
+    benchmark_parser.add_argument('--viewport', type=int, default=48, help='Tiles per viewport load.')
+    benchmark_parser.add_argument('--threads', type=int, default=4, help='Concurrent tile loads.')
+    benchmark_parser.add_argument('--json', action='store_true', default=False, help='Print the results as JSON.')
+    info_parser = subparsers.add_parser("info", help="Print the codec recorded for a tile store.")
+    info_parser.add_argument('-p', '--store_path', type=str, required=True, help='Root directory of the tile store or archive.')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.store_path):
+        raise Exception(f"""The directory "{args.store_path}" was not found.""")
+    if args.command == "transcode":
+        summary = TileTranscoder(args.store_path, args.codec, args.quality, args.processes).run(args.zoom, verbose=True)
+        saved = summary["bytes_before"] - summary["bytes_after"]
+        print(f"Transcoded {summary['transcoded']}/{summary['tiles']} tiles to {args.codec}:{args.quality}, "
+              f"saving {saved / (1024 ** 2):.1f} Mb in {summary['seconds']:.1f} s.")
+    elif args.command == "benchmark":
+        from PyQt5.QtCore import QCoreApplication
+        app = QCoreApplication.instance() or QCoreApplication([]) # Loads the Qt image format plugins
+        tiles = sample_tiles(args.store_path, args.sample, args.zoom)
+        if not tiles:
+            raise Exception(f"Error: No tiles found in '{args.store_path}'.")
+        results = run_benchmark(tiles, args.quality, args.codec, args.viewport, args.threads)
+        print(json.dumps(results, indent=2) if args.json else format_benchmark(results))
+    elif args.command == "info":
+        codec, quality = load_codec(args.store_path)
+        print(f"{codec}" if quality is None else f"{codec}:{quality}")
@@ -5,18 +5,21 @@ Comment: Tool template for rendering image tile layers of ArcGIS satellite image
 %Complete: 100
 '''
 
+import time
+_process_start = time.perf_counter()
+
 import os
 import sys
 import argparse
 import configparser
 
-import pandas as pd
-
 from pathlib import Path
 from PyQt5.QtGui import QColor
+from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import QApplication
 
 from app.MapInterface import MapInterface
+from app.profiling import ProfileSession, StartupTimer
 
 COLOR_CYCLE = [
     QColor("#2CA02C"), # Green
@@ -50,10 +53,12 @@ def load_config(file: str, working_directory: str) -> dict:
     data_dir = Path.joinpath(working_directory, data_dir)
     return [paths, data_dir]
 
-def load_csv(file: str) -> pd.DataFrame:
+def load_csv(file: str) -> "pd.DataFrame":
     """
     Helper method for loading files of Comma-Separated Values type.
+    pandas is imported on first use to keep it off the startup path.
     """
+    import pandas as pd
     try:
         return pd.read_csv(file, encoding='unicode_escape')
     except FileNotFoundError:
@@ -61,12 +66,31 @@ def load_csv(file: str) -> pd.DataFrame:
     return pd.DataFrame()
 
 if __name__== "__main__":
+    startup = StartupTimer(_process_start)
+    startup.mark("imports")
+
     # PARSE CLI ARGUMENTS:
     parser = argparse.ArgumentParser(description="Map Visualization Tool: An application of the ArcGIS image tile layer system.")
     parser.add_argument('-p', '--path', type=str, default=None, required=False,
                         help='Specify a path to the source directory where the application resides.')
     parser.add_argument('-v', '--verbose', action='store_true', default=False, required=False,
                         help='Show all logs, warnings, and error messages.')
+    parser.add_argument('--profile', type=str, default=None, required=False, choices=ProfileSession.MODES,
+                        help='Profile the session with cProfile or the sampling profiler. Results are written to the data directory.')
+    parser.add_argument('--profile-delay', type=float, default=0.0, required=False,
+                        help='Seconds to wait after startup before profiling begins.')
+    parser.add_argument('--profile-duration', type=float, default=None, required=False,
+                        help='Seconds to profile for. Profiles until the application exits if not specified.')
+    parser.add_argument('--feed', type=str, default=None, required=False,
+                        help='Stream live markers from a growing CSV/NDJSON file, or from NDJSON lines sent to tcp://host:port.')
+    parser.add_argument('--heatmap', type=str, default=None, required=False,
+                        help='Show the point density of a CSV file with latitude/longitude columns as a heatmap.')
+    parser.add_argument('--shared-cache', type=int, default=None, required=False,
+                        help='Share fetched tiles with the other instances on this machine through a shared memory cache of this size in MB.')
+    parser.add_argument('--tile-ttl', type=float, default=None, required=False,
+                        help='Days a stored tile is served before it is revalidated with the tile server, unless the server sets its lifetime.')
+    parser.add_argument('--trace', type=str, default=None, required=False,
+                        help='Record the navigation and tile requests of the session to a trace file for replay (see app.SessionReplay).')
     args = parser.parse_args()
 
     current_working_directory = os.getcwd()
@@ -84,18 +108,99 @@ if __name__== "__main__":
         verbose = args.verbose
 
     # PARSE CONFIG.INI:
-    # resource_paths, data_dir_base = load_config("config.ini", working_directory= current_working_directory)
+    resource_paths, data_dir_base = {}, None
+    if os.path.exists(current_working_directory + "config.ini"):
+        resource_paths, data_dir_base = load_config("config.ini", working_directory= current_working_directory)
+    session_path = str(data_dir_base / "session.json") if data_dir_base else None
     
     # Load config parameters, files, data (then preprocess)
 
     # INITIALIZE QT AND EVENT LOOP:
     # Address command-line parsing by Qt later. No specific use currently.
     main_app = QApplication([])
-    window = MapInterface()
+    startup.mark("qt_init")
+
+    # PROFILING (OPTIONAL):
+    profile_session = None
+    if args.profile:
+        if data_dir_base is None:
+            raise Exception(f"Error: Profiling requires the data directory from '{current_working_directory}config.ini'.")
+        profile_session = ProfileSession(args.profile, str(data_dir_base / "profiles"))
+
+        def stop_profiling():
+            for file in profile_session.stop():
+                print(f"Profile written: {file}")
+
+        if args.profile_delay > 0:
+            QTimer.singleShot(int(args.profile_delay * 1000), profile_session.start)
+        else:
+            profile_session.start()
+        if args.profile_duration:
+            QTimer.singleShot(int((args.profile_delay + args.profile_duration) * 1000), stop_profiling)
+        main_app.aboutToQuit.connect(stop_profiling)
+
+    window = MapInterface(session_path= session_path)
+    startup.mark("window_init")
+    if window.map_view.restored_tiles > 0:
+        startup.mark("first_paint_store") # Painted within window_init
 
     # Do any additional configuration: module initialization, data filtering, etc.
+    live_feed = None
+    if args.feed:
+        from app.LiveFeed import LiveFeed
+        from app.MarkerLayer import MarkerLayer
+        live_layer = MarkerLayer("live", color=COLOR_CYCLE[0], radius_px=3.0, z_order=2)
+        window.map_view.add_layer(live_layer)
+        live_feed = LiveFeed(live_layer, window.map_view, args.feed)
+        live_feed.start()
+        main_app.aboutToQuit.connect(live_feed.stop)
+        if verbose:
+            main_app.aboutToQuit.connect(lambda: print(f"Live feed: {live_feed.get_stats()}"))
+
+    if args.heatmap:
+        from app.HeatmapLayer import HeatmapLayer
+        points = load_csv(args.heatmap)
+        columns = {c.lower(): c for c in points.columns}
+        lat_column = next((columns[c] for c in ("lat", "latitude") if c in columns), None)
+        lon_column = next((columns[c] for c in ("lon", "lng", "long", "longitude") if c in columns), None)
+        if lat_column is None or lon_column is None:
+            raise Exception(f"Error: No latitude/longitude columns found in '{args.heatmap}'.")
+        window.map_view.add_layer(HeatmapLayer("heatmap", points[lat_column].to_numpy(), points[lon_column].to_numpy()))
+
+    if args.shared_cache:
+        from app.SharedTileCache import SharedTileCache
+        shared_cache = SharedTileCache(size=args.shared_cache * (1024 ** 2))
+        window.map_view.tile_service.cache.attach_shared(shared_cache)
+
+        def detach_shared_cache():
+            if verbose:
+                print(f"Shared tile cache: {shared_cache.get_stats()}")
+            window.map_view.tile_service.cache.attach_shared(None)
+            shared_cache.close()
+
+        main_app.aboutToQuit.connect(detach_shared_cache)
+
+    if args.tile_ttl is not None and window.map_view.tile_service.metadata is not None:
+        window.map_view.tile_service.metadata.ttl = args.tile_ttl * 24 * 3600.0
+
+    if args.trace:
+        from app.SessionRecorder import SessionRecorder
+        recorder = SessionRecorder(args.trace)
+        recorder.attach(window.map_view)
+        main_app.aboutToQuit.connect(recorder.close)
 
     window.setWindowTitle("Image Tile Layer")
     window.show()
+    startup.mark("window_shown")
+
+    def report_startup(source: str) -> None:
+        startup.mark(f"first_paint_{source}")
+        if source == "network":
+            window.map_view.framePainted.disconnect(report_startup)
+            if verbose:
+                mode = "Warm" if window.map_view.restored_tiles > 0 else "Cold"
+                print(startup.format_report(f"{mode} startup ({window.map_view.restored_tiles} tiles from store)"))
+
+    window.map_view.framePainted.connect(report_startup)
 
     sys.exit(main_app.exec_())
\ No newline at end of file
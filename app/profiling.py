@@ -0,0 +1,214 @@
+import os
+import sys
+import time
+import cProfile
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List
+
+##### TIMING SPANS #####
+_spans_enabled: bool = False
+_span_lock: threading.Lock = threading.Lock()
+_span_stats: Dict[str, List[float]] = {}
+
+class span:
+    """
+    Named timing span for annotating hot-path sections (download, decode, cache lookup, paint).
+    Spans cost a single flag check while no profiling session is active.
+
+    Usage:
+        with span("decode"):
+            image.loadFromData(data)
+    """
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name: str = name
+        self.start: float = 0.0
+
+    def __enter__(self) -> "span":
+        if _spans_enabled:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        if _spans_enabled and self.start:
+            record_span(self.name, time.perf_counter() - self.start)
+        return False
+
+def record_span(name: str, elapsed: float) -> None:
+    """
+    Accumulates an elapsed time (seconds) for a named span: [count, total, max].
+    """
+    with _span_lock:
+        stats = _span_stats.get(name)
+        if stats is None:
+            _span_stats[name] = [1, elapsed, elapsed]
+        else:
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+
+def enable_spans(state: bool = True) -> None:
+    global _spans_enabled
+    _spans_enabled = state
+
+def reset_spans() -> None:
+    with _span_lock:
+        _span_stats.clear()
+
+def get_span_stats() -> Dict[str, List[float]]:
+    with _span_lock:
+        return {name: list(stats) for name, stats in _span_stats.items()}
+
+def format_span_report(stats: Dict[str, List[float]]) -> str:
+    """
+    Formats span statistics as a fixed-width table sorted by total time.
+    """
+    lines = [f"{'span':<24}{'count':>10}{'total (ms)':>14}{'mean (ms)':>12}{'max (ms)':>12}"]
+    for name, (count, total, peak) in sorted(stats.items(), key=lambda s: -s[1][1]):
+        lines.append(f"{name:<24}{count:>10}{total * 1e3:>14.2f}{(total / count) * 1e3:>12.3f}{peak * 1e3:>12.3f}")
+    return "\n".join(lines) + "\n"
+
+
+##### SAMPLING PROFILER #####
+class StackSampler(threading.Thread):
+    """
+    Low-overhead sampling profiler. Periodically snapshots the stacks of all threads and
+    aggregates them into the collapsed-stack format consumed by flamegraph tools.
+    """
+    def __init__(self, interval: float = 0.005):
+        super().__init__(name="StackSampler", daemon=True)
+        self.interval: float = interval
+        self.samples: Counter = Counter()
+        self.sample_count: int = 0
+        self._stop_event: threading.Event = threading.Event()
+
+    def run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+            self.sample_count += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+    def write_collapsed(self, file: str) -> None:
+        with open(file, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+##### PROFILING SESSION #####
+class ProfileSession:
+    """
+    Profiles an application session (or a bounded time window of it) and writes the results
+    into an output directory:
+        <prefix>.pstats     cProfile statistics (mode 'cprofile' only), readable with pstats/snakeviz.
+        <prefix>.collapsed  collapsed-stack samples, compatible with flamegraph.pl/speedscope.
+        <prefix>.spans.txt  timings of the named hot-path spans.
+
+    Args:
+        mode (str): 'cprofile' for deterministic profiling of the calling (GUI) thread plus stack
+            sampling, or 'sample' for stack sampling only.
+        output_dir (str): directory to write the results into; created if missing.
+        interval (float): stack sampling interval in seconds.
+    """
+    MODES = ("cprofile", "sample")
+
+    def __init__(self, mode: str, output_dir: str, interval: float = 0.005):
+        if mode not in self.MODES:
+            raise Exception(f"Invalid profiling mode '{mode}'. Expected one of {self.MODES}.")
+        self.mode: str = mode
+        self.output_dir: Path = Path(output_dir)
+        self.interval: float = interval
+        self.profiler: cProfile.Profile = None
+        self.sampler: StackSampler = None
+        self.started_at: float = None
+        self.is_running: bool = False
+
+    def start(self) -> None:
+        if self.is_running:
+            return
+        reset_spans()
+        enable_spans(True)
+        self.sampler = StackSampler(self.interval)
+        self.sampler.start()
+        if self.mode == "cprofile":
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.started_at = time.perf_counter()
+        self.is_running = True
+
+    def stop(self) -> List[str]:
+        """
+        Stops profiling and writes the results.
+
+        Returns:
+            list: paths of the files written.
+        """
+        if not self.is_running:
+            return []
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.sampler.stop()
+        enable_spans(False)
+        self.is_running = False
+        elapsed = time.perf_counter() - self.started_at
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        prefix = self.output_dir / time.strftime(f"profile-%Y%m%d-%H%M%S-{self.mode}")
+        written = []
+        if self.profiler is not None:
+            self.profiler.dump_stats(f"{prefix}.pstats")
+            written.append(f"{prefix}.pstats")
+
+        self.sampler.write_collapsed(f"{prefix}.collapsed")
+        written.append(f"{prefix}.collapsed")
+
+        with open(f"{prefix}.spans.txt", "w", encoding="utf-8") as f:
+            f.write(f"# mode: {self.mode}, duration: {elapsed:.2f} s, samples: {self.sampler.sample_count}\n")
+            f.write(format_span_report(get_span_stats()))
+        written.append(f"{prefix}.spans.txt")
+        return written
+
+
+##### STARTUP TIMING #####
+class StartupTimer:
+    """
+    Records named startup milestones relative to a start time and reports the breakdown.
+
+    Args:
+        start (float, optional): time.perf_counter() value at process start. Defaults to now.
+    """
+    def __init__(self, start: float = None):
+        self.start: float = start if start is not None else time.perf_counter()
+        self.marks: List[tuple] = []
+
+    def mark(self, name: str) -> None:
+        """
+        Records a milestone; repeated names are ignored so only the first occurrence counts.
+        """
+        if name not in [mark[0] for mark in self.marks]:
+            self.marks.append((name, time.perf_counter()))
+
+    def format_report(self, title: str = "Startup") -> str:
+        lines = [f"{title} time breakdown:"]
+        previous = self.start
+        for name, at in self.marks:
+            lines.append(f"  {name:<28}{(at - previous) * 1e3:>10.1f} ms{(at - self.start) * 1e3:>10.1f} ms total")
+            previous = at
+        return "\n".join(lines)
@@ -0,0 +1,110 @@
+'''
+Compact integer tile identifiers.
+
+A tile id packs (zoom, y, x) into one 64-bit integer: 5 bits of zoom level above 29 bits of row and
+29 bits of column. Ids are cheap to hash and compare, sort by zoom then row then column, and parent,
+child and neighbour ids are computed with bit operations, without any string allocation or parsing.
+String keys ("z-y-x"), URL paths and file names are derived only at the edges (network, disk).
+'''
+from typing import List, Tuple
+
+from app.util import tile_to_quadkey, quadkey_to_tile
+
+COORD_BITS = 29
+COORD_MASK = (1 << COORD_BITS) - 1
+Y_SHIFT = COORD_BITS
+ZOOM_SHIFT = 2 * COORD_BITS
+MAX_ZOOM = 29
+
+def tile_id(zoom: int, x: int, y: int) -> int:
+    """
+    Packs a tile position at a zoom level (LOD) into a tile id.
+    """
+    return (zoom << ZOOM_SHIFT) | (y << Y_SHIFT) | x
+
+def tile_zoom(tid: int) -> int:
+    return tid >> ZOOM_SHIFT
+
+def tile_x(tid: int) -> int:
+    return tid & COORD_MASK
+
+def tile_y(tid: int) -> int:
+    return (tid >> Y_SHIFT) & COORD_MASK
+
+def tile_zyx(tid: int) -> Tuple[int, int, int]:
+    """
+    Unpacks a tile id into (zoom, y, x), the order of the tile server's URL scheme.
+    """
+    return (tid >> ZOOM_SHIFT, (tid >> Y_SHIFT) & COORD_MASK, tid & COORD_MASK)
+
+##### HIERARCHY #####
+def tile_parent(tid: int, levels: int = 1) -> int:
+    """
+    Returns the id of the ancestor tile `levels` zoom levels up.
+    """
+    zoom, y, x = tile_zyx(tid)
+    levels = min(levels, zoom)
+    return tile_id(zoom - levels, x >> levels, y >> levels)
+
+def tile_children(tid: int) -> List[int]:
+    """
+    Returns the ids of the four child tiles: top-left, top-right, bottom-left, bottom-right.
+    """
+    zoom, y, x = tile_zyx(tid)
+    return [tile_id(zoom + 1, 2 * x + dx, 2 * y + dy) for dy in (0, 1) for dx in (0, 1)]
+
+def tile_neighbours(tid: int) -> List[int]:
+    """
+    Returns the ids of the (up to eight) surrounding tiles. Columns wrap around the antimeridian;
+    rows beyond the poles are omitted.
+    """
+    zoom, y, x = tile_zyx(tid)
+    n = 1 << zoom
+    neighbours = []
+    for dy in (-1, 0, 1):
+        ny = y + dy
+        if ny < 0 or ny >= n:
+            continue
+        for dx in (-1, 0, 1):
+            if dx == 0 and dy == 0:
+                continue
+            neighbour = tile_id(zoom, (x + dx) % n, ny)
+            if neighbour != tid and neighbour not in neighbours:
+                neighbours.append(neighbour)
+    return neighbours
+
+##### CONVERSIONS #####
+def tile_quadkey(tid: int) -> str:
+    zoom, y, x = tile_zyx(tid)
+    return tile_to_quadkey(x, y, zoom)
+
+def tile_from_quadkey(quadkey: str) -> int:
+    x, y, zoom = quadkey_to_tile(quadkey)
+    return tile_id(zoom, x, y)
+
+def tile_key(tid: int) -> str:
+    """
+    Returns the legacy "z-y-x" string key of a tile id (for logs and manifests).
+    """
+    zoom, y, x = tile_zyx(tid)
+    return f"{zoom}-{y}-{x}"
+
+def tile_from_key(key: str) -> int:
+    """
+    Parses a "z-y-x" string key into a tile id.
+    """
+    zoom, y, x = key.split('-')
+    return tile_id(int(zoom), int(x), int(y))
+
+def tile_url_path(tid: int) -> str:
+    """
+    Returns the "z/y/x" path of a tile on the tile server.
+    """
+    zoom, y, x = tile_zyx(tid)
+    return f"{zoom}/{y}/{x}"
+
+def tile_file_name(tid: int) -> str:
+    """
+    Returns the "y-x" file stem of a tile within its zoom directory of the tile store.
+    """
+    return f"{(tid >> Y_SHIFT) & COORD_MASK}-{tid & COORD_MASK}"
@@ -138,6 +138,23 @@ def haversine_nm(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
     return RADIUS_OF_EARTH * c
 
+def haversine_nm_array(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """
+    Vectorised form of haversine_nm; the arguments are broadcast against each other.
+
+    Args:
+        lat1 (np.ndarray): Latitudes of the first points in degrees.
+        lon1 (np.ndarray): Longitudes of the first points in degrees.
+        lat2 (np.ndarray): Latitudes of the second points in degrees.
+        lon2 (np.ndarray): Longitudes of the second points in degrees.
+
+    Returns:
+        np.ndarray: Distances in nautical miles.
+    """
+    lat1, lon1, lat2, lon2 = [np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lon1, lat2, lon2)]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return RADIUS_OF_EARTH * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
 def get_cartesian_coordinates_unit(lat: float, lon: float, alt: bool = None) -> Tuple[float, float, float]:
     """
     Convert geographic coordinates (latitude, longitude, altitude) into 3D Cartesian
@@ -220,22 +237,15 @@ def interpolate_interval(lat1: float, lon1: float, lat2: float, lon2: float, int
 
     angle = np.arccos(np.clip(np.dot(p1, p2), -1.0, 1.0))
     total_dist = angle * RADIUS_OF_EARTH
-
-    num_pts = int(total_dist // interval)
-
-    points = []
-    for i in range(num_pts):
-        f = (i * interval) / total_dist
-        sin_angle = np.sin(angle)
-        if sin_angle == 0:
-            # interp = p1
-            continue
-        else:
-            interp = (np.sin((1 - f) * angle) * p1 + np.sin(f * angle) * p2) / sin_angle
-        lat, lon = get_geodesic_coordinates(interp[0], interp[1], interp[2])
-        points.append([lat, lon])
-
-    return points
+    sin_angle = np.sin(angle)
+    if sin_angle == 0:
+        return []
+
+    # Spherical linear interpolation of all points at once: [n, 1] weights against [1, 3] endpoints
+    f = (np.arange(int(total_dist // interval)) * interval / total_dist)[:, None]
+    interp = (np.sin((1 - f) * angle) * p1 + np.sin(f * angle) * p2) / sin_angle
+    lat, lon = get_geodesic_coordinates(interp[:, 0], interp[:, 1], interp[:, 2])
+    return np.column_stack([lat, lon]).tolist()
     
 def get_center_of_coordinates(coordinate1: List[float], coordinate2: List[float]) -> Tuple[float, float]:
     """
@@ -262,3 +272,203 @@ def get_center_of_coordinates(coordinate1: List[float], coordinate2: List[float]
     center_lon = math.degrees(math.atan2(y, x))
 
     return center_lat, center_lon
+
+def bbox_to_tile_range(south: float, west: float, north: float, east: float, zoom: int) -> Tuple[int, int, int, int]:
+    """
+    Computes the inclusive range of tiles covering a geographic bounding box at a given zoom (LOD).
+    Latitudes are clamped to the Web Mercator limits.
+
+    Args:
+        south (float): southern latitude in degrees.
+        west (float): western longitude in degrees.
+        north (float): northern latitude in degrees.
+        east (float): eastern longitude in degrees.
+        zoom (int): Zoom level (LOD).
+
+    Returns:
+        Tuple[int, int, int, int]: (x_start, y_start, x_end, y_end) tile indices, inclusive.
+    """
+    south, north = [min(max(lat, -85.0511), 85.0511) for lat in (south, north)]
+    last = (2 ** zoom) - 1
+    x_start, y_start = degree_to_tile(north, west, zoom, snap=True)
+    x_end, y_end = degree_to_tile(south, east, zoom, snap=True)
+    return (int(min(x_start, last)), int(min(y_start, last)), int(min(x_end, last)), int(min(y_end, last)))
+
+def tile_to_quadkey(xTile: int, yTile: int, zoom: int) -> str:
+    """
+    Convert tile x, y coordinates at a given zoom (LOD) to a quadkey: one base-4 digit per level,
+    so tiles sharing a quadkey prefix share the same ancestor tile.
+
+    Args:
+        tile X (int): x tile position.
+        tile Y (int): y tile position.
+        zoom (int): Zoom level (LOD).
+
+    Returns:
+        str: quadkey of length zoom (empty for zoom 0).
+    """
+    digits = []
+    for i in range(zoom, 0, -1):
+        mask = 1 << (i - 1)
+        digits.append(str(int(bool(xTile & mask)) + 2 * int(bool(yTile & mask))))
+    return ''.join(digits)
+
+def quadkey_to_tile(quadkey: str) -> Tuple[int, int, int]:
+    """
+    Convert a quadkey to tile x, y coordinates and zoom (LOD).
+
+    Args:
+        quadkey (str): quadkey string of base-4 digits.
+
+    Returns:
+        Tuple[int, int, int]: (x, y, zoom) tile coordinates.
+    """
+    xTile = yTile = 0
+    zoom = len(quadkey)
+    for i, digit in zip(range(zoom, 0, -1), quadkey):
+        mask = 1 << (i - 1)
+        if digit not in "0123":
+            raise ValueError(f"Invalid quadkey digit '{digit}' in '{quadkey}'.")
+        if int(digit) & 1:
+            xTile |= mask
+        if int(digit) & 2:
+            yTile |= mask
+    return (xTile, yTile, zoom)
+
+def degree_to_tile_array(lat_deg: np.ndarray, lon_deg: np.ndarray, zoom: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorised form of degree_to_tile for arrays of coordinates. Latitudes are clamped to the
+    Web Mercator limits instead of raising.
+
+    Args:
+        lat_deg (np.ndarray): Latitudes in degrees.
+        lon_deg (np.ndarray): Longitudes in degrees.
+        zoom (int): Zoom level (LOD).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The (x, y) fractional tile coordinates.
+    """
+    lat_rad = np.radians(np.clip(np.asarray(lat_deg, dtype=np.float64), -85.0511, 85.0511))
+    n = 2.0 ** zoom
+    xTile = (np.asarray(lon_deg, dtype=np.float64) + 180.0) / 360.0 * n
+    yTile = (1.0 - np.log(np.tan(lat_rad) + (1 / np.cos(lat_rad))) / np.pi) / 2.0 * n
+    return (xTile, yTile)
+
+def tile_to_degree_array(xTile: np.ndarray, yTile: np.ndarray, zoom: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorised form of tile_to_degree for arrays of tile coordinates.
+
+    Args:
+        xTile (np.ndarray): x tile positions.
+        yTile (np.ndarray): y tile positions.
+        zoom (int): Zoom level (LOD).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The (latitude, longitude) coordinates in degrees.
+    """
+    n = 2.0 ** zoom
+    lon_deg = np.asarray(xTile, dtype=np.float64) / n * 360.0 - 180.0
+    lat_deg = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * np.asarray(yTile, dtype=np.float64) / n))))
+    return (lat_deg, lon_deg)
+
+def douglas_peucker_ranks(x: np.ndarray, y: np.ndarray, min_tolerance: float = 0.0) -> np.ndarray:
+    """
+    Ranks the vertices of a polyline by Douglas-Peucker significance: each vertex gets the largest
+    tolerance at which the Douglas-Peucker algorithm still keeps it (endpoints are always kept).
+    The simplification at any tolerance >= min_tolerance is then the mask `ranks > tolerance`, so one
+    pass serves every zoom level.
+
+    Args:
+        x (np.ndarray): x-coordinates of the vertices.
+        y (np.ndarray): y-coordinates of the vertices.
+        min_tolerance (float): smallest tolerance of interest; finer detail is ranked 0.
+
+    Returns:
+        np.ndarray: the rank of every vertex.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    count = len(x)
+    ranks = np.zeros(count)
+    if count == 0:
+        return ranks
+    ranks[0] = ranks[-1] = np.inf
+
+    stack = [(0, count - 1, np.inf)]
+    while stack:
+        first, last, parent_rank = stack.pop()
+        if last - first < 2:
+            continue
+        dx = x[last] - x[first]
+        dy = y[last] - y[first]
+        px = x[first + 1:last] - x[first]
+        py = y[first + 1:last] - y[first]
+        length = math.hypot(dx, dy)
+        if length == 0:
+            distances = np.hypot(px, py)
+        else:
+            distances = np.abs(px * dy - py * dx) / length
+        i = int(np.argmax(distances))
+        if distances[i] <= min_tolerance:
+            continue
+        # A vertex is never kept at a tolerance where the split that exposes it is not made
+        rank = min(float(distances[i]), parent_rank)
+        index = first + 1 + i
+        ranks[index] = rank
+        stack.append((first, index, rank))
+        stack.append((index, last, rank))
+    return ranks
+
+def get_cartesian_coordinates_unit_array(lat_deg: np.ndarray, lon_deg: np.ndarray) -> np.ndarray:
+    """
+    Vectorised form of get_cartesian_coordinates_unit for arrays of coordinates.
+
+    Args:
+        lat_deg (np.ndarray): Latitudes in degrees.
+        lon_deg (np.ndarray): Longitudes in degrees.
+
+    Returns:
+        np.ndarray: Cartesian coordinates on a unit sphere, shape [n, 3].
+    """
+    lat_rad = np.radians(np.asarray(lat_deg, dtype=np.float64))
+    lon_rad = np.radians(np.asarray(lon_deg, dtype=np.float64))
+    cos_lat = np.cos(lat_rad)
+    return np.column_stack([cos_lat * np.cos(lon_rad), cos_lat * np.sin(lon_rad), np.sin(lat_rad)])
+
+def points_in_polygon(x: np.ndarray, y: np.ndarray, poly_x: np.ndarray, poly_y: np.ndarray) -> np.ndarray:
+    """
+    Vectorised point-in-polygon test (even-odd rule) in planar coordinates, e.g. projected tile or pixel
+    coordinates. The points are sorted by y once, so each edge only tests the points within its y-range:
+    the cost is about the number of points times the edges crossed by a horizontal line, not times all
+    edges, which keeps hand-drawn polygons with hundreds of vertices fast on millions of points.
+
+    Args:
+        x (np.ndarray): x-coordinates of the points.
+        y (np.ndarray): y-coordinates of the points.
+        poly_x (np.ndarray): x-coordinates of the polygon vertices (implicitly closed).
+        poly_y (np.ndarray): y-coordinates of the polygon vertices.
+
+    Returns:
+        np.ndarray: boolean mask of the points inside the polygon.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    poly_x = np.asarray(poly_x, dtype=np.float64)
+    poly_y = np.asarray(poly_y, dtype=np.float64)
+    inside = np.zeros(len(x), dtype=bool)
+    if len(poly_x) < 3 or len(x) == 0:
+        return inside
+    order = np.argsort(y)
+    sorted_x, sorted_y = x[order], y[order]
+    crossed = np.zeros(len(x), dtype=bool) # Parity of the edges crossed by a ray to -x, in sorted order
+    for x0, y0, x1, y1 in zip(poly_x.tolist(), poly_y.tolist(), np.roll(poly_x, -1).tolist(), np.roll(poly_y, -1).tolist()):
+        if y0 == y1:
+            continue # Horizontal edges are never crossed
+        # Half-open y-range, so a ray through a shared vertex crosses exactly one of its edges
+        low, high = np.searchsorted(sorted_y, [min(y0, y1), max(y0, y1)], side="left")
+        if low == high:
+            continue
+        crossing = x0 + (sorted_y[low:high] - y0) * ((x1 - x0) / (y1 - y0))
+        crossed[low:high] ^= sorted_x[low:high] < crossing
+    inside[order] = crossed
+    return inside
@@ -0,0 +1,379 @@
+'''
+Micro-benchmark and accuracy suite of the geodesy functions in app.util.
+
+Every benchmark case times one function over a fixed, seeded set of inputs (best of several repeats)
+and reports the time per call and the throughput in million elements per second, for the scalar
+functions as well as their batched (array) forms. The accuracy checks verify round trips, agreement
+of the batched and scalar forms and known reference values.
+
+Times per element are compared against a stored baseline of the same workload size to flag
+regressions (quick runs are not compared). Times are normalized by a fixed calibration workload
+measured in the same run, so a baseline recorded on one machine stays roughly comparable on another.
+Everything runs offline and without Qt.
+
+Usage:
+    python -m app.util_benchmark
+    python -m app.util_benchmark --save-baseline
+    python -m app.util_benchmark --quick
+    python -m app.util_benchmark --tolerance 1.0 --baseline my_baseline.json
+'''
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import platform
+import numpy as np
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from app.util import (RADIUS_OF_EARTH, degree_to_tile, tile_to_degree, haversine_nm, interpolate_interval,
+                      get_center_of_coordinates, angular_to_decimal_degree, degree_to_tile_array,
+                      tile_to_degree_array, haversine_nm_array, get_cartesian_coordinates_unit_array)
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent.parent / "tests" / "baselines" / "util_benchmark.json"
+MAX_LAT = 85.0511
+MERCATOR_LAT = 85.05112877980659 # Latitude of the top edge of the Web Mercator projection, atan(sinh(pi))
+
+##### INPUTS #####
+def random_coordinates(count: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns seeded random (latitude, longitude) arrays within the Web Mercator limits.
+    """
+    rng = np.random.default_rng(seed)
+    return rng.uniform(-MAX_LAT, MAX_LAT, count), rng.uniform(-180.0, 180.0, count)
+
+def to_dms(value: float, positive: str, negative: str) -> str:
+    """
+    Formats a decimal degree as a DMS string led by its compass direction, e.g. N40°26'46.000000".
+    """
+    direction = positive if value >= 0 else negative
+    value = abs(value)
+    degrees = int(value)
+    minutes = int((value - degrees) * 60)
+    seconds = (value - degrees - minutes / 60) * 3600
+    return f"{direction}{degrees}°{minutes}'{seconds:.6f}\""
+
+
+##### BENCHMARK CASES #####
+class BenchmarkCase:
+    """
+    One benchmark: `setup(size)` prepares the inputs and returns a callable running the whole workload,
+    together with the number of calls and of elements it processes.
+
+    Args:
+        name (str): case name, also the key of its baseline.
+        setup (Callable): size -> (workload, calls, elements).
+    """
+    def __init__(self, name: str, setup: Callable):
+        self.name: str = name
+        self.setup: Callable = setup
+
+def _scalar_case(name: str, function: Callable, make_args: Callable) -> BenchmarkCase:
+    def setup(size: int):
+        args = make_args(size)
+        def workload():
+            for arg in args:
+                function(*arg)
+        return workload, len(args), len(args)
+    return BenchmarkCase(name, setup)
+
+def _array_case(name: str, function: Callable, make_args: Callable) -> BenchmarkCase:
+    def setup(size: int):
+        args = make_args(size * 10) # Batched forms process an order of magnitude more elements
+        return (lambda: function(*args)), 1, len(args[0])
+    return BenchmarkCase(name, setup)
+
+def _coordinate_args(size: int) -> List[tuple]:
+    lat, lon = random_coordinates(size)
+    return list(zip(lat.tolist(), lon.tolist()))
+
+def _tile_args(size: int, zoom: int = 12) -> List[tuple]:
+    lat, lon = random_coordinates(size)
+    x, y = degree_to_tile_array(lat, lon, zoom)
+    return list(zip(x.tolist(), y.tolist(), [zoom] * size))
+
+def _pair_args(size: int) -> List[tuple]:
+    lat1, lon1 = random_coordinates(size, seed=1)
+    lat2, lon2 = random_coordinates(size, seed=2)
+    return list(zip(lat1.tolist(), lon1.tolist(), lat2.tolist(), lon2.tolist()))
+
+def _route_case() -> BenchmarkCase:
+    # Long routes sampled every 10 nm: one call produces hundreds of points
+    def setup(size: int):
+        routes = _pair_args(max(size // 500, 4))
+        elements = sum(len(interpolate_interval(*route, 10)) for route in routes)
+        def workload():
+            for route in routes:
+                interpolate_interval(*route, 10)
+        return workload, len(routes), elements
+    return BenchmarkCase("interpolate_interval", setup)
+
+def _array_coordinates(size: int) -> tuple:
+    return random_coordinates(size)
+
+def _array_tiles(size: int) -> tuple:
+    lat, lon = random_coordinates(size)
+    return degree_to_tile_array(lat, lon, 12) + (12,)
+
+def _array_pairs(size: int) -> tuple:
+    return random_coordinates(size, seed=1) + random_coordinates(size, seed=2)
+
+BENCHMARK_CASES: List[BenchmarkCase] = [
+    _scalar_case("degree_to_tile", degree_to_tile, lambda size: [arg + (12,) for arg in _coordinate_args(size)]),
+    _scalar_case("tile_to_degree", tile_to_degree, _tile_args),
+    _scalar_case("haversine_nm", haversine_nm, _pair_args),
+    _scalar_case("get_center_of_coordinates", get_center_of_coordinates,
+                 lambda size: [((a, b), (c, d)) for a, b, c, d in _pair_args(size)]),
+    _scalar_case("angular_to_decimal_degree", angular_to_decimal_degree,
+                 lambda size: [(to_dms(lat, "N", "S"),) for lat, _ in _coordinate_args(size)]),
+    _route_case(),
+    _array_case("degree_to_tile_array", degree_to_tile_array, lambda size: _array_coordinates(size) + (12,)),
+    _array_case("tile_to_degree_array", tile_to_degree_array, _array_tiles),
+    _array_case("haversine_nm_array", haversine_nm_array, _array_pairs),
+    _array_case("get_cartesian_coordinates_unit_array", get_cartesian_coordinates_unit_array, _array_coordinates),
+]
+
+def calibrate(repeat: int = 5) -> float:
+    """
+    Times a fixed mix of interpreted and NumPy work (best of `repeat`), the unit of the normalized times.
+    """
+    values = np.linspace(0.0, 1.0, 200_000)
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        total = 0.0
+        for i in range(100_000):
+            total += math.sin(i * 1e-5)
+        np.sin(values).sum()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def run_benchmarks(size: int = 100_000, repeat: int = 5, cases: List[BenchmarkCase] = None) -> Dict[str, dict]:
+    """
+    Runs the benchmark cases; each workload is timed `repeat` times and the best time is kept.
+
+    Args:
+        size (int): number of scalar calls per workload (batched forms process ten times as many elements).
+        repeat (int): timed repetitions of every workload.
+        cases (list, optional): cases to run. Defaults to BENCHMARK_CASES.
+
+    Returns:
+        dict: case name -> {'seconds', 'calls', 'elements', 'per_call_us', 'melem_per_s'}.
+    """
+    results = {}
+    for case in cases or BENCHMARK_CASES:
+        workload, calls, elements = case.setup(size)
+        workload() # Warm-up
+        best = math.inf
+        for _ in range(repeat):
+            start = time.perf_counter()
+            workload()
+            best = min(best, time.perf_counter() - start)
+        results[case.name] = {"seconds": best, "calls": calls, "elements": elements,
+                              "per_call_us": best / calls * 1e6, "melem_per_s": elements / best / 1e6}
+    return results
+
+
+##### ACCURACY CHECKS #####
+def _round_trip_error() -> float:
+    # Largest degree error of degree -> tile -> degree over all zoom levels
+    lat, lon = random_coordinates(2000, seed=3)
+    error = 0.0
+    for zoom in range(0, 22):
+        for a, b in zip(lat[::50].tolist(), lon[::50].tolist()):
+            x, y = degree_to_tile(a, b, zoom)
+            c, d = tile_to_degree(x, y, zoom)
+            error = max(error, abs(a - c), abs(b - d))
+        c, d = tile_to_degree_array(*degree_to_tile_array(lat, lon, zoom), zoom)
+        error = max(error, float(np.abs(lat - c).max()), float(np.abs(lon - d).max()))
+    return error
+
+def _tile_reference_error() -> float:
+    # Known tiles: the map center, the corners of the projection and a quarter of the world at zoom 2
+    references = [((0.0, 0.0, 1), (1.0, 1.0)), ((0.0, -180.0, 3), (0.0, 4.0)), ((0.0, 90.0, 2), (3.0, 2.0))]
+    error = max(max(abs(p - q) for p, q in zip(degree_to_tile(*args), expected)) for args, expected in references)
+    north, west = tile_to_degree(0, 0, 0)
+    south, east = tile_to_degree(1, 1, 0)
+    return max(error, abs(north - MERCATOR_LAT), abs(south + MERCATOR_LAT), abs(west + 180.0), abs(east - 180.0))
+
+def _array_agreement_error() -> float:
+    # Largest relative difference between the batched and scalar forms
+    lat1, lon1 = random_coordinates(500, seed=4)
+    lat2, lon2 = random_coordinates(500, seed=5)
+    x, y = degree_to_tile_array(lat1, lon1, 15)
+    scalar_xy = np.array([degree_to_tile(a, b, 15) for a, b in zip(lat1.tolist(), lon1.tolist())])
+    back = np.column_stack(tile_to_degree_array(x, y, 15))
+    scalar_back = np.array([tile_to_degree(a, b, 15) for a, b in zip(x.tolist(), y.tolist())])
+    distances = haversine_nm_array(lat1, lon1, lat2, lon2)
+    scalar_distances = np.array([haversine_nm(*args) for args in zip(lat1, lon1, lat2, lon2)])
+    relative = lambda a, b: float((np.abs(a - b) / np.maximum(np.abs(b), 1.0)).max())
+    return max(relative(np.column_stack([x, y]), scalar_xy), relative(back, scalar_back), relative(distances, scalar_distances))
+
+def _haversine_reference_error() -> float:
+    # Distances in multiples of the earth radius: a quarter meridian, one degree of equator, antipodes (on
+    # the equator: haversine is ill-conditioned near antipodes elsewhere)
+    references = [((0, 0, 90, 0), math.pi / 2), ((0, 0, 0, 1), math.pi / 180), ((0, -90, 0, 90), math.pi),
+                  ((45, 0, 45, 0), 0.0), ((0, 179.5, 0, -179.5), math.pi / 180)]
+    error = max(abs(haversine_nm(*args) - RADIUS_OF_EARTH * expected) for args, expected in references)
+    symmetry = abs(haversine_nm(12.3, 45.6, -7.8, -90.1) - haversine_nm(-7.8, -90.1, 12.3, 45.6))
+    return max(error, symmetry)
+
+def _interpolation_error() -> float:
+    # Interpolated points are `interval` apart along the great circle, starting at the first endpoint
+    error = 0.0
+    for lat1, lon1, lat2, lon2 in _pair_args(20):
+        interval = 25.0
+        points = np.array(interpolate_interval(lat1, lon1, lat2, lon2, interval))
+        total = haversine_nm(lat1, lon1, lat2, lon2)
+        error = max(error, abs(len(points) - int(total // interval)))
+        if len(points) == 0:
+            continue
+        error = max(error, abs(points[0, 0] - lat1), abs(((points[0, 1] - lon1) + 180.0) % 360.0 - 180.0))
+        steps = haversine_nm_array(points[:-1, 0], points[:-1, 1], points[1:, 0], points[1:, 1])
+        # On the great circle: distances to both endpoints add up to the total
+        along = haversine_nm_array(lat1, lon1, points[:, 0], points[:, 1]) + haversine_nm_array(points[:, 0], points[:, 1], lat2, lon2)
+        error = max(error, float(np.abs(steps - interval).max(initial=0.0)), float(np.abs(along - total).max()))
+    return error
+
+def _center_error() -> float:
+    references = [(([0.0, 0.0], [0.0, 90.0]), (0.0, 45.0)), (([10.0, 20.0], [-10.0, 20.0]), (0.0, 20.0)),
+                  (([45.0, -30.0], [45.0, -30.0]), (45.0, -30.0))]
+    error = max(max(abs(p - q) for p, q in zip(get_center_of_coordinates(*args), expected)) for args, expected in references)
+    # The center of a great-circle arc is equidistant from its endpoints
+    for lat1, lon1, lat2, lon2 in _pair_args(50):
+        lat, lon = get_center_of_coordinates([lat1, lon1], [lat2, lon2])
+        if haversine_nm(lat1, lon1, lat2, lon2) < 0.99 * math.pi * RADIUS_OF_EARTH:
+            error = max(error, abs(haversine_nm(lat, lon, lat1, lon1) - haversine_nm(lat, lon, lat2, lon2)))
+    return error
+
+def _dms_error() -> float:
+    references = [("N40°26'46\"", 40 + 26 / 60 + 46 / 3600), ("W79°58'56\"", -(79 + 58 / 60 + 56 / 3600)),
+                  ("S33°51'35.9\"", -(33 + 51 / 60 + 35.9 / 3600)), ("E0°0'0\"", 0.0)]
+    error = max(abs(angular_to_decimal_degree(text) - expected) for text, expected in references)
+    for lat, _ in _coordinate_args(200):
+        error = max(error, abs(angular_to_decimal_degree(to_dms(lat, "N", "S")) - lat))
+    return error
+
+# (name, check returning the largest error, tolerance)
+ACCURACY_CHECKS: List[Tuple[str, Callable, float]] = [
+    ("degree/tile round trip (deg)", _round_trip_error, 1e-9),
+    ("tile reference values", _tile_reference_error, 1e-9),
+    ("batched vs scalar (relative)", _array_agreement_error, 1e-12),
+    ("haversine reference (nm)", _haversine_reference_error, 1e-9),
+    ("interpolation spacing (nm)", _interpolation_error, 1e-6),
+    ("center of coordinates", _center_error, 1e-6),
+    ("DMS parsing (deg)", _dms_error, 1e-9),
+]
+
+def run_accuracy_checks() -> List[dict]:
+    """
+    Runs the accuracy checks.
+
+    Returns:
+        list: {'name', 'error', 'tolerance', 'passed'} of every check.
+    """
+    results = []
+    for name, check, tolerance in ACCURACY_CHECKS:
+        error = float(check())
+        results.append({"name": name, "error": error, "tolerance": tolerance, "passed": error <= tolerance})
+    return results
+
+
+##### BASELINES #####
+def load_baseline(path: str) -> dict:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_baseline(path: str, results: Dict[str, dict], calibration: float, size: int) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    baseline = {"calibration": calibration, "size": size, "python": platform.python_version(), "numpy": np.__version__,
+                "machine": platform.machine(),
+                "cases": {name: {"per_call_us": result["per_call_us"], "melem_per_s": result["melem_per_s"]}
+                          for name, result in results.items()}}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2)
+
+def compare_to_baseline(results: Dict[str, dict], calibration: float, baseline: dict, size: int) -> Dict[str, float]:
+    """
+    Compares calibration-normalized times per element against a baseline. A call of a batched case
+    covers a whole array, so times per call are only comparable at one workload size; per element they
+    still depend on it (fixed overheads, cache effects), so baselines of another size are refused.
+
+    Args:
+        results (dict): results of run_benchmarks().
+        calibration (float): calibration time of this run.
+        baseline (dict): a baseline written by save_baseline().
+        size (int): workload size of this run (see run_benchmarks()).
+
+    Returns:
+        dict: case name -> slowdown ratio (normalized time / baseline time), for the cases in the baseline.
+    """
+    if baseline.get("size", size) != size:
+        raise Exception(f"Error: The baseline was recorded with --size {baseline['size']}, this run uses {size}.")
+    ratios = {}
+    for name, result in results.items():
+        reference = baseline["cases"].get(name)
+        if reference is not None:
+            ratios[name] = (reference["melem_per_s"] * baseline["calibration"]) / (result["melem_per_s"] * calibration)
+    return ratios
+
+def find_regressions(ratios: Dict[str, float], tolerance: float = 0.5) -> Dict[str, float]:
+    """
+    Returns the cases slower than their baseline by more than `tolerance` (a fraction, e.g. 0.5 for 50 %).
+    """
+    return {name: ratio for name, ratio in ratios.items() if ratio > 1.0 + tolerance}
+
+def format_report(results: Dict[str, dict], accuracy: List[dict], ratios: Dict[str, float] = None) -> str:
+    """
+    Formats benchmark and accuracy results as fixed-width tables.
+    """
+    ratios = ratios or {}
+    lines = [f"{'function':<40}{'elements':>10}{'per call (us)':>16}{'Melem/s':>10}{'vs baseline':>13}"]
+    for name, result in results.items():
+        ratio = f"{ratios[name]:.2f}x" if name in ratios else "-"
+        lines.append(f"{name:<40}{result['elements']:>10}{result['per_call_us']:>16.3f}{result['melem_per_s']:>10.2f}{ratio:>13}")
+    lines.append("")
+    lines.append(f"{'accuracy check':<40}{'max error':>12}{'tolerance':>12}  result")
+    for check in accuracy:
+        lines.append(f"{check['name']:<40}{check['error']:>12.2e}{check['tolerance']:>12.0e}  {'ok' if check['passed'] else 'FAILED'}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark and accuracy suite of the app.util geodesy functions.")
+    parser.add_argument('--size', type=int, default=100_000, help='Scalar calls per benchmark (batched forms use ten times as many elements).')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed repetitions per benchmark; the best is kept.')
+    parser.add_argument('--quick', action='store_true', default=False, help='Small workloads for a fast check, without the baseline comparison.')
+    parser.add_argument('--baseline', type=str, default=str(DEFAULT_BASELINE), help='Baseline JSON file.')
+    parser.add_argument('--save-baseline', action='store_true', default=False, help='Store this run as the new baseline.')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='Allowed slowdown against the baseline (fraction).')
+    args = parser.parse_args()
+
+    if args.quick and args.save_baseline:
+        raise Exception("Error: Quick runs are not stored as a baseline.")
+    size, repeat = (10_000, 3) if args.quick else (args.size, args.repeat)
+    accuracy = run_accuracy_checks()
+    calibration = calibrate()
+    results = run_benchmarks(size, repeat)
+    calibration = min(calibration, calibrate()) # Once more after the benchmarks, in case the machine was busy
+
+    baseline = None if args.quick else load_baseline(args.baseline) # Quick workloads are not comparable
+    ratios = compare_to_baseline(results, calibration, baseline, size) if baseline is not None else {}
+    regressions = find_regressions(ratios, args.tolerance)
+    print(format_report(results, accuracy, ratios))
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results, calibration, size)
+        print(f"\nBaseline saved to {args.baseline}")
+    elif baseline is None and not args.quick:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to store one.")
+    for name, ratio in regressions.items():
+        print(f"Error: {name} is {ratio:.2f}x slower than its baseline (tolerance {args.tolerance:.0%}).")
+    failed = [check["name"] for check in accuracy if not check["passed"]]
+    for name in failed:
+        print(f"Error: accuracy check '{name}' failed.")
+    sys.exit(1 if failed or regressions else 0)
@@ -0,0 +1,38 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.BatchDownloader import plan_shards, iter_shard_tiles, count_tiles, WORLD_BBOX
+
+US_BBOX = (24.0, -125.0, 50.0, -66.0)
+
+class TestPlanShards(unittest.TestCase):
+    def assert_partition(self, min_zoom: int, max_zoom: int, bbox: tuple, prefixes: list) -> None:
+        shard_level = max(len(prefix) for prefix in prefixes)
+        keys = [key for prefix in prefixes for key in iter_shard_tiles(prefix, min_zoom, max_zoom, bbox, shard_level)]
+        self.assertEqual(len(keys), len(set(keys)))
+        self.assertEqual(len(keys), count_tiles(min_zoom, max_zoom, bbox))
+
+    def test_shard_level_above_min_zoom(self):
+        # A single deep level (e.g. --derive_lower) is sharded by shallow prefixes, not one shard per tile
+        prefixes = plan_shards(12, 12, US_BBOX, 32)
+        self.assertGreaterEqual(len(prefixes), 32)
+        self.assertLess(len(prefixes), 256)
+        self.assertNotIn("", prefixes)
+        self.assert_partition(12, 12, US_BBOX, prefixes)
+
+    def test_root_shard_covers_low_zooms(self):
+        prefixes = plan_shards(0, 6, WORLD_BBOX, 16)
+        self.assertEqual(prefixes[0], "")
+        self.assertEqual(max(len(prefix) for prefix in prefixes), 2)
+        self.assert_partition(0, 6, WORLD_BBOX, prefixes)
+        self.assert_partition(3, 8, US_BBOX, plan_shards(3, 8, US_BBOX, 8))
+
+    def test_single_tile(self):
+        self.assertEqual(plan_shards(0, 0, WORLD_BBOX, 8), [""])
+        self.assert_partition(0, 0, WORLD_BBOX, [""])
+
+if __name__ == "__main__":
+    unittest.main()
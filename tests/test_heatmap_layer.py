@@ -0,0 +1,58 @@
+import os
+import sys
+import unittest
+import numpy as np
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtGui import QImage, QPainter
+
+from app.util import tile_to_degree
+from app.HeatmapLayer import HeatmapLayer
+from app.OverlayCache import OverlayTileCache
+
+class TestHeatmapLayer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication([])
+
+    def test_tiles_are_seamless(self):
+        # A cluster around a tile corner: every point's blurred mass lands in the four adjacent tiles
+        zoom, x, y = 8, 40, 90
+        lat, lon = tile_to_degree(x, y, zoom)
+        rng = np.random.default_rng(0)
+        layer = HeatmapLayer(lat=lat + rng.normal(0, 0.02, 500), lon=lon + rng.normal(0, 0.02, 500))
+        mass = sum(layer._tile_density(zoom, x + i, y + j).sum() for i in (-1, 0) for j in (-1, 0))
+        self.assertAlmostEqual(mass, 500 * layer._kernel().sum() ** 2, delta=1e-6 * mass)
+        self.assertIsNone(layer._tile_density(zoom, x + 5, y + 5))
+
+    def test_overlay_tiles_follow_version(self):
+        layer = HeatmapLayer(lat=np.array([10.0, 10.1]), lon=np.array([20.0, 20.1]))
+        view = SimpleNamespace(img_res_x=256, zoom_level=4, x_tile_start=7, x_tile_end=9, y_tile_start=6, y_tile_end=8)
+        image = QImage(3 * 256, 3 * 256, QImage.Format_ARGB32_Premultiplied)
+        for _ in range(2):
+            painter = QPainter(image)
+            layer.paint(painter, view)
+            painter.end()
+        self.assertEqual(layer.get_stats()["computed"], 9) # Second paint served from the overlay tile cache
+        layer.set_points(np.array([10.0]), np.array([20.0]))
+        painter = QPainter(image)
+        layer.paint(painter, view)
+        painter.end()
+        self.assertEqual(layer.get_stats()["computed"], 18)
+
+    def test_overlay_cache_caps_empty_tiles(self):
+        cache = OverlayTileCache(max_entries=100)
+        for tile in range(1000):
+            cache.put(1, 0, tile, 256, None)
+        stats = cache.get_stats()
+        self.assertEqual((stats["entries"], stats["evictions"], stats["bytes"]), (100, 900, 0))
+        self.assertEqual(cache.get(1, 0, 999, 256), (True, None))
+        self.assertEqual(cache.get(1, 0, 0, 256), (False, None))
+        self.assertEqual(sum(len(keys) for keys in cache.layer_entries[1].values()), 100)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import os
+import sys
+import time
+import tempfile
+import unittest
+import numpy as np
+from io import BytesIO
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtGui import QImage, QPainter, QPixmap, QRegion, QColor
+from PyQt5.QtCore import QPoint
+
+from app.util import tile_to_degree
+from app.tile_id import tile_id
+from app.MapCanvas import MapCanvas, FrameViewport
+from app.MarkerLayer import MarkerLayer
+from app.MapView import MapView
+from app.TileService import TileService, get_tile_service
+from app.TileFetcher import TileResponse
+
+def pixels(image: QImage) -> np.ndarray:
+    image = image.convertToFormat(QImage.Format_RGB32)
+    bits = image.constBits()
+    bits.setsize(image.byteCount())
+    return np.frombuffer(bits, np.uint32).reshape(image.height(), image.width()).copy()
+
+class TestMapCanvas(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication([])
+
+    def setUp(self):
+        self.viewport = FrameViewport(6, 10, 13, 20, 22, 256, 256, 12)
+        self.canvas = MapCanvas()
+        self.canvas.setFixedSize(4 * 256, 3 * 256)
+        self.canvas.set_tiles(self.viewport, {})
+
+    def test_partial_repaint_matches_full_repaint(self):
+        rng = np.random.default_rng(5)
+        lat0, lon0 = tile_to_degree(10, 20, 6)
+        lat1, lon1 = tile_to_degree(14, 23, 6)
+        lat, lon = rng.uniform(lat1, lat0, 300), rng.uniform(lon0, lon1, 300)
+        layer = MarkerLayer("live", radius_px=4.0)
+        layer.upsert(list(range(300)), lat, lon)
+        self.canvas.layers = [layer]
+        frame = self.canvas.grab_frame()
+
+        moved = list(range(0, 300, 37))
+        layer.upsert(moved, lat[moved] + 0.3, lon[moved] - 0.3)
+        dirty = layer.dirty_tiles()
+        self.assertTrue(0 < len(dirty) < 12)
+        region = QRegion()
+        for tile in dirty:
+            region += self.viewport.tile_rect(tile)
+        painter = QPainter(frame)
+        painter.setClipRegion(region)
+        self.canvas.paint_content(painter, region.boundingRect())
+        painter.end()
+        np.testing.assert_array_equal(pixels(frame), pixels(self.canvas.grab_frame()))
+
+    def test_set_tiles_repaints_changed_tiles(self):
+        red, blue = QPixmap(256, 256), QPixmap(256, 256)
+        red.fill(QColor("#FF0000"))
+        blue.fill(QColor("#0000FF"))
+        tiles = {tile_id(6, x, y): red for x in range(10, 14) for y in range(20, 23)}
+        self.canvas.show()
+        self.canvas.set_tiles(self.viewport, tiles)
+        self.app.processEvents()
+        painted = self.canvas.get_stats()["pixels"]
+
+        self.canvas.set_tiles(self.viewport, dict(tiles))  # Unchanged pixmaps: nothing to repaint
+        self.canvas.set_tiles(self.viewport, {tile_id(6, 12, 21): blue})
+        self.app.processEvents()
+        self.assertEqual(self.canvas.get_stats()["pixels"] - painted, 256 * 256)
+        self.assertEqual(self.canvas.grab_frame().pixel(2 * 256 + 10, 256 + 10) & 0xFFFFFF, 0x0000FF)
+        self.canvas.hide()
+
+class StubFetcher:
+    """
+    Answers every tile with a distinct solid-colour JPEG, without network access.
+    """
+    max_concurrency = 4
+
+    def __init__(self):
+        self.requests = 0
+
+    def fetch_response(self, key: int, etag: str = None, last_modified: str = None) -> TileResponse:
+        from PIL import Image
+        self.requests += 1
+        buffer = BytesIO()
+        Image.new("RGB", (256, 256), (key % 251, (key >> 29) % 251, 90)).save(buffer, format="JPEG")
+        return TileResponse(200, buffer.getvalue())
+
+    def get_stats(self) -> dict:
+        return {"requests": self.requests}
+
+class TestMapViewCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication([])
+
+    def test_hot_tier_counts_each_tile_once(self):
+        fetcher = StubFetcher()
+        service = TileService(fetcher=fetcher)
+        view = MapView(4 * 256, 3 * 256, 256, 256, tile_service=service)
+        painted = []
+        view.framePainted.connect(painted.append)
+        deadline = time.monotonic() + 10.0
+        while "network" not in painted and time.monotonic() < deadline:
+            self.app.processEvents()
+            time.sleep(0.005)
+        tiles = len(view.jobs)
+        self.assertEqual(fetcher.requests, tiles)
+        self.assertEqual(service.cache.get_stats()["hot"]["hits"], 0) # Cold load: one miss per tile
+        self.assertEqual(service.cache.get_stats()["hot"]["misses"], tiles)
+
+        view._fetch_imagery() # Warm: answered from the hot tier at once
+        self.assertEqual(painted.count("network"), 2)
+        stats = service.cache.get_stats()["hot"]
+        self.assertEqual((stats["hits"], stats["misses"]), (tiles, tiles))
+        self.assertEqual(fetcher.requests, tiles)
+
+    def test_placeholder_tiles_end_zoom_preview(self):
+        view = MapView(4 * 256, 3 * 256, 256, 256, tile_service=TileService(fetcher=StubFetcher()))
+        view.paint_zoom_preview(0.5, QPoint(100, 100))
+        placeholder = StubFetcher().fetch_response(0).data
+        tiles = {key: (QImage.fromData(placeholder), placeholder[::16], placeholder) for key in range(4)}
+        self.assertFalse(view.tiles_ready(tiles)) # The server's "no imagery" placeholder repeated
+        self.assertTrue(view.map_view_frame.view_transform.isIdentity())
+
+    def test_tile_service_per_store(self):
+        with tempfile.TemporaryDirectory() as first, tempfile.TemporaryDirectory() as second:
+            service = get_tile_service(first)
+            self.assertIs(get_tile_service(os.path.join(first, ".")), service)
+            self.assertIsNot(get_tile_service(second), service)
+            self.assertEqual(str(get_tile_service(second).tile_store.root), second)
+
+if __name__ == "__main__":
+    unittest.main()
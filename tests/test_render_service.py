@@ -0,0 +1,53 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtGui import QImage
+
+from app.util import degree_to_tile
+from app.RenderService import RenderService, RenderViewport, parse_request
+
+class TestRenderService(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication([])
+        cls.service = RenderService(workers=2, offline=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.service.close()
+
+    def test_parse_request(self):
+        request = parse_request({"bbox": "37,-123,38.2,-121.5", "zoom": "9", "markers": "37.7,-122.4;37.8,-122.2"})
+        self.assertEqual(request.zoom, 9)
+        self.assertEqual(request.markers.shape, (2, 2))
+        for spec in ({"zoom": 9}, {"bbox": [38, -123, 37, -122], "zoom": 9}, {"bbox": [-80, -180, 80, 180], "zoom": 14}):
+            with self.assertRaises(ValueError):
+                parse_request(spec)
+
+    def test_viewport_covers_bbox(self):
+        viewport = RenderViewport((37.0, -123.0, 38.2, -121.5), 9)
+        tiles = viewport.tiles()
+        self.assertEqual(len(tiles), (viewport.x_tile_end - viewport.x_tile_start + 1) * (viewport.y_tile_end - viewport.y_tile_start + 1))
+        self.assertLessEqual(viewport.crop.right(), (viewport.x_tile_end - viewport.x_tile_start + 1) * 256)
+        self.assertLessEqual(viewport.crop.bottom(), (viewport.y_tile_end - viewport.y_tile_start + 1) * 256)
+
+    def test_render_markers(self):
+        bbox = (37.0, -123.0, 38.2, -121.5)
+        request = parse_request({"bbox": bbox, "zoom": 9, "markers": [[37.6, -122.25]], "marker_radius": 6, "marker_color": "#00FF00"})
+        result = self.service.render(request)
+        image = QImage.fromData(result.png)
+        self.assertEqual((image.width(), image.height()), (result.width, result.height))
+        self.assertEqual(result.tiles["missing"], result.tiles["tiles"]) # Offline without a store
+        self.assertIn("total", result.timing)
+
+        x0, y0 = degree_to_tile(bbox[2], bbox[1], 9)
+        x, y = degree_to_tile(37.6, -122.25, 9)
+        self.assertEqual(image.pixel(int(x * 256) - int(x0 * 256), int(y * 256) - int(y0 * 256)) & 0xFFFFFF, 0x00FF00)
+
+if __name__ == "__main__":
+    unittest.main()
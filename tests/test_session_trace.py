@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication
+
+from app.SessionRecorder import load_trace, trace_summary
+from app.SessionReplay import SessionReplay
+
+HEADER = {"t": 0.0, "type": "session", "version": 1, "width": 512, "height": 512, "img_res": 256, "max_zoom_level": 12,
+          "update_interval": 100, "store": False, "zoom": 4, "x_tile_start": 6, "x_tile_end": 8, "y_tile_start": 5, "y_tile_end": 7}
+
+class TestSessionTrace(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication([])
+
+    def test_replay_records_navigation_and_tiles(self):
+        events = [HEADER,
+                  {"t": 0.05, "type": "fetch", "key": "4-5-6", "ms": 20.0, "status": 200, "bytes": 100},
+                  {"t": 0.3, "type": "click_zoom", "x": 256, "y": 256, "zoom_in": True},
+                  {"t": 0.6, "type": "wheel", "dy": -120, "x": 100, "y": 300}]
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "replay.ndjson")
+            summary = SessionReplay(events, speed=2.0, settle=10.0, output=output).run()
+            replayed = load_trace(output)
+        self.assertEqual([event["type"] for event in replayed if event["type"] in ("click_zoom", "wheel")], ["click_zoom", "wheel"])
+        self.assertEqual(replayed[0]["zoom"], 4)
+        self.assertEqual(summary["navigation"], 2)
+        self.assertGreaterEqual(summary["requests"], 2)
+        self.assertGreater(summary["fetches"], 0)
+        self.assertEqual(summary["fetch_failures"], 0)
+        self.assertEqual(summary, trace_summary(replayed))
+
+    def test_load_trace_skips_malformed_lines(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file = os.path.join(directory, "trace.ndjson")
+            with open(file, "w", encoding="utf-8") as f:
+                f.write('{"t": 0.0, "type": "session"}\n{"t": 0.1, "type": "wheel", "dy": 1\n\n{"t": 0.2}\n')
+            self.assertEqual(len(load_trace(file)), 1)
+
+if __name__ == "__main__":
+    unittest.main()
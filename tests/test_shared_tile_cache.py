@@ -0,0 +1,54 @@
+import os
+import sys
+import uuid
+import subprocess
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.SharedTileCache import SharedTileCache
+from app.TileCache import TileCache
+from app.tile_id import tile_id
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+class TestSharedTileCache(unittest.TestCase):
+    def setUp(self):
+        self.name = f"test_tiles_{uuid.uuid4().hex[:8]}"
+        self.cache = SharedTileCache(self.name, size=1024 ** 2)
+
+    def tearDown(self):
+        self.cache.unlink()
+        self.cache.close()
+        os.remove(self.cache.lock.file.name)
+
+    def test_tiles_are_shared_between_processes(self):
+        key = tile_id(12, 1205, 1539)
+        self.cache.put(key, b"\xff\xd8" + bytes(range(256)) * 40)
+        script = (f"from app.SharedTileCache import SharedTileCache; cache = SharedTileCache('{self.name}', create=False); "
+                  f"print(len(cache.get({key}))); cache.put({key + 1}, b'other'); cache.close()")
+        result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.stdout.strip(), str(2 + 256 * 40), result.stderr)
+        self.assertEqual(self.cache.get(key + 1), b"other")
+
+    def test_eviction_keeps_memory_cap(self):
+        for key in range(300):
+            self.cache.put(key, bytes([key % 256]) * 10000)
+        stats = self.cache.get_stats()
+        self.assertLessEqual(stats["bytes"], stats["capacity"])
+        self.assertIsNone(self.cache.get(0))
+        self.assertEqual(self.cache.get(299), bytes([299 % 256]) * 10000)
+        self.assertGreater(stats["entries"], 50)
+
+    def test_tile_cache_shared_tier(self):
+        first, second = TileCache(4 * 1024 ** 2, hot_limit=1), TileCache(4 * 1024 ** 2, hot_limit=1)
+        for tile_cache in (first, second):
+            tile_cache.attach_shared(SharedTileCache(self.name))
+        first.put_bytes(7, b"tile bytes")
+        self.assertEqual(second.get_bytes(7), b"tile bytes")
+        self.assertEqual(second.get_stats()["shared"]["hits"], 1)
+        for tile_cache in (first, second):
+            tile_cache.shared.close()
+
+if __name__ == "__main__":
+    unittest.main()
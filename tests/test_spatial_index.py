@@ -0,0 +1,106 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.util import haversine_nm, degree_to_tile_array, points_in_polygon
+from app.SpatialIndex import SpatialIndex, DynamicSpatialIndex
+from app.MarkerLayer import MarkerLayer
+
+class TestSpatialIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.default_rng(3)
+        cls.lat = np.degrees(np.arcsin(rng.uniform(-1, 1, 5000)))
+        cls.lon = rng.uniform(-180, 180, 5000)
+        cls.index = SpatialIndex(cls.lat, cls.lon)
+        cls.queries = [(0.0, 179.9), (89.5, 10.0), (-33.9, 151.2), (40.7, -74.0)]
+
+    def haversine_all(self, lat: float, lon: float) -> np.ndarray:
+        return np.array([haversine_nm(lat, lon, a, b) for a, b in zip(self.lat, self.lon)])
+
+    def test_within_matches_haversine(self):
+        for lat, lon in self.queries:
+            distances = self.haversine_all(lat, lon)
+            indices, found = self.index.within(lat, lon, 300.0)
+            self.assertEqual(set(indices.tolist()), set(np.flatnonzero(distances <= 300.0).tolist()))
+            np.testing.assert_allclose(found, distances[indices], atol=1e-6)
+            self.assertTrue(np.all(np.diff(found) >= 0))
+
+    def test_nearest_matches_haversine(self):
+        for lat, lon in self.queries:
+            distances = self.haversine_all(lat, lon)
+            indices, found = self.index.nearest(lat, lon, k=3)
+            np.testing.assert_array_equal(indices, np.argsort(distances)[:3])
+            np.testing.assert_allclose(found, np.sort(distances)[:3], atol=1e-6)
+        indices, found = self.index.nearest(0.0, 0.0, k=3, max_distance_nm=1e-3)
+        self.assertEqual(len(indices), 0)
+
+    def test_batch_queries(self):
+        lat, lon = zip(*self.queries)
+        batch = self.index.within_batch(np.array(lat), np.array(lon), 500.0)
+        counts = self.index.count_within(np.array(lat), np.array(lon), 500.0)
+        for (qlat, qlon), indices, count in zip(self.queries, batch, counts):
+            self.assertEqual(sorted(indices.tolist()), sorted(self.index.within(qlat, qlon, 500.0)[0].tolist()))
+            self.assertEqual(len(indices), count)
+
+class TestDynamicSpatialIndex(unittest.TestCase):
+    def test_updates_match_brute_force(self):
+        rng = np.random.default_rng(5)
+        n = 3000
+        lat = np.degrees(np.arcsin(rng.uniform(-1, 1, n)))
+        lon = rng.uniform(-180, 180, n)
+        alive = np.ones(n, dtype=bool)
+        index = DynamicSpatialIndex(min_pending=200)
+        index.set(np.arange(n), lat, lon)
+        for step in range(20):
+            # Move, remove and re-insert random slots between queries
+            moved = rng.choice(n, 50, replace=False)
+            lat[moved] = np.degrees(np.arcsin(rng.uniform(-1, 1, 50)))
+            lon[moved] = rng.uniform(-180, 180, 50)
+            index.set(moved, lat[moved], lon[moved])
+            alive[moved] = True
+            removed = rng.choice(n, 20, replace=False)
+            index.remove(removed)
+            alive[removed] = False
+
+            qlat, qlon = float(lat[step]), float(lon[step])
+            distances = np.array([haversine_nm(qlat, qlon, a, b) for a, b in zip(lat, lon)])
+            distances[~alive] = np.inf
+            slots, found = index.within(qlat, qlon, 400.0)
+            self.assertEqual(set(slots.tolist()), set(np.flatnonzero(distances <= 400.0).tolist()))
+            np.testing.assert_allclose(found, distances[slots], atol=1e-6)
+            slots, found = index.nearest(qlat, qlon, k=5)
+            np.testing.assert_allclose(found, np.sort(distances)[:5], atol=1e-6)
+        self.assertEqual(len(index), int(alive.sum()))
+        self.assertGreater(index.rebuilds, 1)
+
+class TestLassoSelection(unittest.TestCase):
+    def test_select_polygon_matches_brute_force(self):
+        rng = np.random.default_rng(11)
+        lat, lon = rng.uniform(30, 60, 20000), rng.uniform(-20, 40, 20000)
+        layer = MarkerLayer("markers", lat, lon)
+        layer.upsert(["a", "b"], np.array([45.0, 46.0]), np.array([10.0, 11.0]))
+        zoom, res = 5, 256
+        # Star-shaped lasso around (45N, 10E) in world pixels
+        cx, cy = degree_to_tile_array(45.0, 10.0, zoom)
+        angles = np.linspace(0, 2 * np.pi, 120, endpoint=False)
+        radius = 300 * (1 + 0.4 * np.sin(5 * angles))
+        x, y = cx * res + radius * np.cos(angles), cy * res + radius * np.sin(angles)
+
+        selected = layer.select_polygon(x, y, zoom, res)
+        all_x, all_y = degree_to_tile_array(layer.lat[:layer.size], layer.lon[:layer.size], zoom)
+        expected = np.flatnonzero(points_in_polygon(all_x * res, all_y * res, x, y) & layer.alive[:layer.size])
+        np.testing.assert_array_equal(selected, expected)
+        self.assertIn(layer.slot_of["a"], selected.tolist())
+        self.assertEqual(list(layer.features(selected).columns), ["lat", "lon"])
+
+        slot = layer.slot_of["a"]
+        layer.remove(["a"])
+        self.assertNotIn(slot, layer.select_polygon(x, y, zoom, res).tolist())
+        self.assertEqual(len(layer.select_polygon(x[:2], y[:2], zoom, res)), 0)
+
+if __name__ == "__main__":
+    unittest.main()
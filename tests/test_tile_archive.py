@@ -0,0 +1,61 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.tile_id import tile_id
+from app.TileArchive import TileArchive
+
+class TestTileArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, "archive")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_write_flush_reopen(self):
+        tiles = {tile_id(4, x, y): bytes([x, y]) * 10 for x in range(4) for y in range(3)}
+        with TileArchive(self.root) as archive:
+            for key, data in tiles.items():
+                archive.write(key, data)
+            archive.write(tile_id(4, 1, 1), b"new")
+            tiles[tile_id(4, 1, 1)] = b"new"
+            # Journalled tiles are readable before the index is written
+            self.assertEqual(archive.read(tile_id(4, 1, 1)), b"new")
+
+        reader = TileArchive(self.root, writable=False)
+        self.assertEqual(len(reader), len(tiles))
+        for key, data in tiles.items():
+            self.assertEqual(bytes(reader.view(key)), data)
+        self.assertIsNone(reader.read(tile_id(4, 9, 9)))
+        self.assertEqual(sorted(reader.iter_keys(4)), sorted(tiles))
+        reader.close()
+
+    def test_copy_region_and_merge(self):
+        first, second = TileArchive(self.root), TileArchive(self.root + "-b")
+        for x in range(8):
+            first.write(tile_id(3, x, 0), b"a%d" % x)
+        second.write(tile_id(3, 2, 0), b"b2")
+        second.write(tile_id(5, 0, 0), b"b5")
+        first.flush()
+        second.flush()
+
+        region = TileArchive(self.root + "-region")
+        self.assertEqual(first.copy_region(region, 3, 2, 0, 4, 0), 3)
+        self.assertEqual(region.read(tile_id(3, 3, 0)), b"a3")
+        self.assertFalse(region.contains(tile_id(3, 5, 0)))
+
+        merged = TileArchive(self.root + "-merged")
+        merged.merge([first, second])
+        self.assertEqual(len(merged), 9)
+        # Later sources win
+        self.assertEqual(merged.read(tile_id(3, 2, 0)), b"b2")
+        self.assertEqual(merged.read(tile_id(5, 0, 0)), b"b5")
+        for archive in (first, second, region, merged):
+            archive.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+import os
+import sys
+import time
+import threading
+import tempfile
+import unittest
+import http.client
+import urllib.error
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.TileFetcher import TileFetcher, AdaptiveLimiter, CircuitBreaker, CircuitOpenError, parse_max_age
+from app.TileStore import TileStore
+from app.TileMetadata import TileMetadata
+from app.TileRevalidator import TileRevalidator
+from app.tile_id import tile_id
+
+class TileHandler(BaseHTTPRequestHandler):
+    failures_before_success: int = 0
+    requests: int = 0
+    version: int = 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        TileHandler.requests += 1
+        if self.path.endswith("/404"):
+            self.send_response(404)
+            self.end_headers()
+        elif self.path.endswith("/499"): # Truncated body
+            self.send_response(200)
+            self.send_header("Content-Length", "100")
+            self.end_headers()
+            self.wfile.write(b"tile")
+        elif TileHandler.requests <= TileHandler.failures_before_success:
+            self.send_response(503)
+            self.end_headers()
+        elif self.headers.get("If-None-Match") == f'"v{TileHandler.version}"':
+            self.send_response(304)
+            self.end_headers()
+        else:
+            self.send_response(200)
+            self.send_header("ETag", f'"v{TileHandler.version}"')
+            self.send_header("Cache-Control", "public, max-age=60")
+            self.end_headers()
+            self.wfile.write(b"tile" if TileHandler.version == 1 else b"tile v%d" % TileHandler.version)
+
+class TestTileFetcher(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), TileHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = "http://127.0.0.1:%d/{z}/{y}/{x}" % cls.server.server_port
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        TileHandler.requests = 0
+        TileHandler.failures_before_success = 0
+        TileHandler.version = 1
+
+    def test_retries_transient_errors(self):
+        TileHandler.failures_before_success = 2
+        fetcher = TileFetcher(self.url, retries=3, backoff_base=0.001)
+        self.assertEqual(fetcher.fetch(tile_id(3, 2, 1)), b"tile")
+        stats = fetcher.get_stats()
+        self.assertEqual(stats["retries"], 2)
+        self.assertEqual(stats["successes"], 1)
+
+    def test_missing_tile_is_not_retried(self):
+        fetcher = TileFetcher(self.url, retries=3, backoff_base=0.001)
+        limit = fetcher.limiter.limit
+        for _ in range(5):
+            with self.assertRaises(urllib.error.HTTPError):
+                fetcher.fetch(tile_id(3, 404, 1))
+        self.assertEqual(fetcher.get_stats()["retries"], 0)
+        self.assertEqual(fetcher.limiter.limit, limit)
+        self.assertEqual(fetcher.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_truncated_body_is_a_failure(self):
+        fetcher = TileFetcher(self.url, retries=1, backoff_base=0.001)
+        limit = fetcher.limiter.limit
+        with self.assertRaises(http.client.IncompleteRead):
+            fetcher.fetch(tile_id(3, 499, 1))
+        stats = fetcher.get_stats()
+        self.assertEqual((stats["retries"], stats["failures"], stats["successes"]), (1, 2, 0))
+        self.assertLess(fetcher.limiter.limit, limit)
+
+    def test_circuit_breaker_opens_and_recovers(self):
+        breaker = CircuitBreaker(failure_threshold=2, cooldown=0.05)
+        breaker.record(False)
+        breaker.record(False)
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.trips, 1)
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())  # Half-open probe
+        self.assertFalse(breaker.allow())
+        breaker.record(True)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+        TileHandler.failures_before_success = 100
+        fetcher = TileFetcher(self.url, retries=20, backoff_base=0.001, backoff_max=0.001)
+        with self.assertRaises(CircuitOpenError):
+            fetcher.fetch(tile_id(3, 2, 1))
+
+    def test_limiter_aimd(self):
+        limiter = AdaptiveLimiter(initial=4, maximum=8)
+        for _ in range(40):
+            for _ in range(int(limiter.limit)):
+                limiter.acquire()
+            for _ in range(int(limiter.limit)):
+                limiter.release(0.01, success=True)
+        self.assertEqual(limiter.limit, 8)
+        limiter.acquire()
+        limiter.release(0.01, success=False)
+        self.assertEqual(limiter.limit, 4)
+
+    def test_conditional_request(self):
+        fetcher = TileFetcher(self.url, retries=0)
+        response = fetcher.fetch_response(tile_id(3, 2, 1))
+        self.assertEqual((response.status, response.data, response.etag, response.max_age), (200, b"tile", '"v1"', 60.0))
+        response = fetcher.fetch_response(tile_id(3, 2, 1), etag=response.etag)
+        self.assertEqual((response.status, response.data), (304, None))
+        self.assertEqual(fetcher.get_stats()["not_modified"], 1)
+        self.assertEqual(parse_max_age("no-cache, max-age=60"), 0.0)
+        self.assertIsNone(parse_max_age("public"))
+
+    def test_revalidation(self):
+        with tempfile.TemporaryDirectory() as root:
+            key = tile_id(3, 2, 1)
+            store = TileStore(root)
+            metadata = TileMetadata(root, min_ttl=0)
+            fetcher = TileFetcher(self.url, retries=0)
+            revalidator = TileRevalidator(store, metadata, fetcher)
+            changed = []
+            revalidator.tileChanged.connect(changed.append)
+
+            response = fetcher.fetch_response(key)
+            store.write(key, response.data)
+            revalidator.record_download(key, response)
+            self.assertTrue(revalidator.check(key))
+
+            metadata.record(key, response, now=time.time() - 120) # Expired: a 304 extends its lifetime
+            self.assertFalse(metadata.is_fresh(key))
+            self.assertFalse(revalidator.revalidate(key))
+            self.assertTrue(metadata.is_fresh(key))
+            self.assertEqual(metadata.get(key)[0], '"v1"')
+
+            TileHandler.version = 2
+            self.assertTrue(revalidator.revalidate(key))
+            self.assertEqual(store.read(key), b"tile v2")
+            self.assertEqual(metadata.get(key)[0], '"v2"')
+            self.assertEqual(changed, [key])
+            stats = revalidator.get_stats()
+            self.assertEqual((stats["not_modified"], stats["changed"]), (1, 1))
+            metadata.close()
+
+if __name__ == "__main__":
+    unittest.main()
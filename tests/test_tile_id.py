@@ -0,0 +1,44 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.tile_id import (tile_id, tile_zyx, tile_parent, tile_children, tile_neighbours, tile_quadkey,
+                         tile_from_quadkey, tile_key, tile_from_key, tile_url_path, tile_file_name)
+
+class TestTileId(unittest.TestCase):
+    def test_pack_roundtrip(self):
+        for zoom, x, y in [(0, 0, 0), (3, 5, 2), (20, 1048575, 1), (29, 2 ** 29 - 1, 2 ** 29 - 1)]:
+            tid = tile_id(zoom, x, y)
+            self.assertLess(tid, 2 ** 64)
+            self.assertEqual(tile_zyx(tid), (zoom, y, x))
+            self.assertEqual(tile_from_key(tile_key(tid)), tid)
+            self.assertEqual(tile_from_quadkey(tile_quadkey(tid)), tid)
+
+    def test_ordering(self):
+        self.assertLess(tile_id(3, 7, 7), tile_id(4, 0, 0))
+        self.assertLess(tile_id(4, 15, 2), tile_id(4, 0, 3))
+
+    def test_hierarchy(self):
+        tid = tile_id(5, 9, 20)
+        for child in tile_children(tid):
+            self.assertEqual(tile_parent(child), tid)
+        self.assertEqual(tile_parent(tid, 5), tile_id(0, 0, 0))
+        self.assertEqual(tile_parent(tile_id(0, 0, 0)), tile_id(0, 0, 0))
+
+    def test_neighbours(self):
+        self.assertEqual(len(tile_neighbours(tile_id(3, 4, 4))), 8)
+        # Top row: no rows above the pole, columns wrap around
+        neighbours = tile_neighbours(tile_id(3, 0, 0))
+        self.assertEqual(len(neighbours), 5)
+        self.assertIn(tile_id(3, 7, 0), neighbours)
+
+    def test_string_forms(self):
+        tid = tile_id(12, 655, 1583)
+        self.assertEqual(tile_key(tid), "12-1583-655")
+        self.assertEqual(tile_url_path(tid), "12/1583/655")
+        self.assertEqual(tile_file_name(tid), "1583-655")
+
+if __name__ == "__main__":
+    unittest.main()
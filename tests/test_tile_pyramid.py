@@ -0,0 +1,34 @@
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.TilePyramid import downsample_children, encode_tile, decode_tile, _build_parents, TILE_SIZE
+from app.TileStore import TileStore
+from app.tile_id import tile_id, tile_children
+
+class TestTilePyramid(unittest.TestCase):
+    def test_downsample_children(self):
+        children = [np.full((TILE_SIZE, TILE_SIZE, 3), value, dtype=np.uint8) for value in (0, 100, 200, 40)]
+        parent = downsample_children(children)
+        half = TILE_SIZE // 2
+        self.assertEqual(parent.shape, (TILE_SIZE, TILE_SIZE, 3))
+        self.assertEqual([int(parent[0, 0, 0]), int(parent[0, half, 0]), int(parent[half, 0, 0]), int(parent[half, half, 0])], [0, 100, 200, 40])
+        self.assertIsNone(downsample_children(children[:3] + [None]))
+
+    def test_incomplete_parents_are_not_stored(self):
+        complete, partial = tile_id(4, 2, 3), tile_id(4, 6, 3)
+        pixels = np.full((TILE_SIZE, TILE_SIZE, 3), 120, dtype=np.uint8)
+        with tempfile.TemporaryDirectory() as root:
+            store = TileStore(root)
+            for child in tile_children(complete) + tile_children(partial)[:3]:
+                store.write(child, encode_tile(pixels))
+            self.assertEqual(_build_parents(root, [complete, partial], overwrite=False), 1)
+            self.assertFalse(store.contains(partial))
+            self.assertAlmostEqual(float(decode_tile(store.read(complete)).mean()), 120.0, delta=2.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+from io import BytesIO
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PIL import Image
+from PyQt5.QtWidgets import QApplication
+
+from app.TileStore import TileStore
+from app.TileArchive import TileArchive
+from app.TileTranscoder import (TileTranscoder, BackgroundTranscoder, detect_codec, transcode_tile, load_codec,
+                                benchmark_codec)
+from app.tile_id import tile_id
+
+app = QApplication.instance() or QApplication([])
+
+def make_tile(seed: int) -> bytes:
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0, 200, 256, dtype=np.float32)
+    pixels = np.stack([gradient[None, :] + np.zeros((256, 1)), gradient[:, None] + np.zeros((1, 256)),
+                       np.full((256, 256), 90.0)], axis=-1)
+    pixels += rng.normal(0, 6, pixels.shape)
+    buffer = BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+class TestTileTranscoder(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tiles = {tile_id(5, x, y): make_tile(x * 8 + y) for x in range(3) for y in range(2)}
+
+    def test_transcode_tile(self):
+        data = next(iter(self.tiles.values()))
+        self.assertEqual(detect_codec(data), "jpeg")
+        webp = transcode_tile(data, "webp", 75)
+        self.assertEqual(detect_codec(webp), "webp")
+        self.assertLess(len(webp), len(data))
+        self.assertIsNone(transcode_tile(webp, "webp", 75)) # Already in the target format
+        self.assertIsNone(transcode_tile(data, "original"))
+        with self.assertRaises(Exception):
+            transcode_tile(data, "avif")
+
+    def test_store_pass(self):
+        with tempfile.TemporaryDirectory() as root:
+            store = TileStore(root)
+            for key, data in self.tiles.items():
+                store.write(key, data)
+                os.utime(store.path_for(key), (1_000_000, 1_000_000))
+            summary = TileTranscoder(root, "webp", 75, processes=2).run()
+            self.assertEqual((summary["tiles"], summary["transcoded"]), (6, 6))
+            self.assertLess(summary["bytes_after"], summary["bytes_before"])
+            for key in self.tiles:
+                self.assertEqual(detect_codec(store.read(key)), "webp")
+                self.assertEqual(store.modified_time(key), 1_000_000) # Kept for If-Modified-Since revalidation
+            self.assertEqual(load_codec(root), ("webp", 75))
+            self.assertEqual(TileTranscoder(root, "webp", 75, processes=2).run()["transcoded"], 0)
+
+    def test_archive_pass(self):
+        with tempfile.TemporaryDirectory() as root:
+            with TileArchive(root) as archive:
+                for key, data in self.tiles.items():
+                    archive.write(key, data)
+            summary = TileTranscoder(root, "webp", 75, processes=2).run()
+            self.assertEqual(summary["transcoded"], 6)
+            archive = TileArchive(root, writable=False)
+            self.assertEqual(archive.stats()["pack_bytes"], summary["bytes_after"]) # Originals compacted away
+            self.assertTrue(all(detect_codec(archive.read(key)) == "webp" for key in self.tiles))
+            archive.close()
+
+    def test_background_and_benchmark(self):
+        key, data = next(iter(self.tiles.items()))
+        with tempfile.TemporaryDirectory() as root:
+            store = TileStore(root)
+            store.write(key, data)
+            transcoder = BackgroundTranscoder(store, "webp", 75)
+            self.assertTrue(transcoder.transcode(key))
+            self.assertFalse(transcoder.transcode(key))
+            self.assertEqual(transcoder.get_stats()["transcoded"], 1)
+
+        original = benchmark_codec(self.tiles, "original", None, viewport=4, threads=2, repeat=1)
+        webp = benchmark_codec(self.tiles, "webp", 75, viewport=4, threads=2, repeat=1)
+        self.assertEqual(original["saved"], 0.0)
+        self.assertGreater(webp["saved"], 0.0)
+        self.assertGreater(webp["decode_ms"], 0.0)
+        self.assertGreater(webp["viewport_ms"], 0.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.util import douglas_peucker_ranks, interpolate_interval, haversine_nm, points_in_polygon
+from app.util_benchmark import BENCHMARK_CASES, run_accuracy_checks, run_benchmarks, compare_to_baseline, find_regressions
+
+def douglas_peucker(x: np.ndarray, y: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Reference (recursive) Douglas-Peucker simplification; returns the mask of kept vertices.
+    """
+    keep = np.zeros(len(x), dtype=bool)
+    keep[0] = keep[-1] = True
+    def simplify(first: int, last: int) -> None:
+        if last - first < 2:
+            return
+        dx, dy = x[last] - x[first], y[last] - y[first]
+        distances = np.abs((x[first + 1:last] - x[first]) * dy - (y[first + 1:last] - y[first]) * dx) / np.hypot(dx, dy)
+        i = int(np.argmax(distances))
+        if distances[i] > tolerance:
+            keep[first + 1 + i] = True
+            simplify(first, first + 1 + i)
+            simplify(first + 1 + i, last)
+    simplify(0, len(x) - 1)
+    return keep
+
+class TestUtil(unittest.TestCase):
+    def test_douglas_peucker_ranks(self):
+        rng = np.random.default_rng(7)
+        x = np.cumsum(rng.normal(size=2000))
+        y = np.cumsum(rng.normal(size=2000))
+        ranks = douglas_peucker_ranks(x, y)
+        for tolerance in (0.1, 1.0, 5.0, 25.0):
+            np.testing.assert_array_equal(ranks > tolerance, douglas_peucker(x, y, tolerance))
+
+    def test_douglas_peucker_ranks_straight_line(self):
+        ranks = douglas_peucker_ranks(np.arange(10.0), np.arange(10.0) * 2)
+        self.assertEqual(int((ranks > 0).sum()), 2)
+
+    def test_points_in_polygon(self):
+        # Concave polygon with vertices on the rows of a point grid (rays through vertices)
+        poly_x, poly_y = [0.0, 4.0, 4.0, 2.0, 0.0], [0.0, 0.0, 4.0, 2.0, 4.0]
+        x, y = np.meshgrid(np.arange(-1.0, 5.5, 0.5), np.arange(-1.0, 5.5, 0.5))
+        x, y = x.ravel(), y.ravel()
+        expected = np.zeros(len(x), dtype=bool)
+        for x0, y0, x1, y1 in zip(poly_x, poly_y, np.roll(poly_x, -1), np.roll(poly_y, -1)):
+            spans = ((y0 <= y) & (y < y1)) | ((y1 <= y) & (y < y0))
+            with np.errstate(divide="ignore", invalid="ignore"):
+                expected ^= spans & (x < x0 + (y - y0) * (x1 - x0) / (y1 - y0))
+        np.testing.assert_array_equal(points_in_polygon(x, y, poly_x, poly_y), expected)
+        self.assertTrue(points_in_polygon([1.0], [1.0], poly_x, poly_y)[0])
+        self.assertFalse(points_in_polygon([2.0], [3.0], poly_x, poly_y)[0]) # In the notch
+
+    def test_accuracy_checks(self):
+        for check in run_accuracy_checks():
+            with self.subTest(check["name"]):
+                self.assertLessEqual(check["error"], check["tolerance"])
+
+    def test_interpolate_interval(self):
+        points = interpolate_interval(37.6, -122.4, 40.6, -73.8, 10)
+        self.assertEqual(len(points), int(haversine_nm(37.6, -122.4, 40.6, -73.8) // 10))
+        self.assertAlmostEqual(points[0][0], 37.6)
+        self.assertAlmostEqual(points[1][1] - points[0][1], points[2][1] - points[1][1], places=1)
+        self.assertEqual(interpolate_interval(10.0, 10.0, 10.0, 10.0, 5), [])
+
+    def test_benchmark_regressions(self):
+        results = run_benchmarks(size=200, repeat=1, cases=BENCHMARK_CASES[:2])
+        self.assertEqual(results["degree_to_tile"]["elements"], 200)
+        # A baseline twice as fast (relative to its calibration) flags both cases
+        baseline = {"calibration": 1.0, "size": 200,
+                    "cases": {name: {"melem_per_s": result["melem_per_s"] * 2} for name, result in results.items()}}
+        ratios = compare_to_baseline(results, 1.0, baseline, 200)
+        self.assertAlmostEqual(ratios["tile_to_degree"], 2.0)
+        self.assertEqual(set(find_regressions(ratios, 0.5)), set(results))
+        self.assertEqual(find_regressions(compare_to_baseline(results, 2.0, baseline, 200), 0.5), {})
+        with self.assertRaises(Exception): # Workloads of another size are not comparable
+            compare_to_baseline(results, 1.0, baseline, 10_000)
+
+if __name__ == "__main__":
+    unittest.main()